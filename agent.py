@@ -1,113 +1,430 @@
-from langchain.agents import initialize_agent, Tool
+import contextvars
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+from langchain.agents import initialize_agent, AgentExecutor, Tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents.agent_types import AgentType
-from langchain.callbacks import get_openai_callback
-from langchain.memory import ConversationBufferMemory
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
 from config import Config
-from tools import (
-    wikipedia_tool,
-    study_tips_tool,
-    google_search_tool,
-    youtube_summary_tool,
-    exam_strategy_tool,
-    flashcard_generator_tool,
-    note_organizer_tool,
-    concept_mapper_tool,
-    scholarly_papers_tool,
-    subject_expert_tool
-)
-
-def run_agent(query: str):
-    llm = ChatGoogleGenerativeAI(
-        model=Config.LLM_MODEL,
-        temperature=Config.TEMPERATURE,
-        max_output_tokens=Config.MAX_OUTPUT_TOKENS,
-        convert_system_message_to_human=True  
-    )
+from deadline import Deadline, DeadlineExceeded, deadline_scope
+from llm_cache import cache_for, will_hit
+from memory import WindowedSummaryMemory
+from observations import ObservationCompressor, compress, observing, process_observation
+from ratelimit import UpstreamUnavailableError, get_upstream
+from router import Route, get_router, polish_prompt
+from semantic_cache import get_semantic_cache, is_cacheable_query
+from streaming import AgentEvent, StreamingCallbackHandler, TracingCallbackHandler
+from tool_registry import TOOL_REGISTRY, collect_tool_errors, get_tool
+import tracing
 
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-
-    tools = [
-        Tool(
-            name="Wikipedia Tool",
-            func=wikipedia_tool,
-            description="Fetch Wikipedia summaries on academic topics, concepts, and theories."
-        ),
-        Tool(
-            name="Study Tips Tool", 
-            func=study_tips_tool, 
-            description="Provide personalized study tips for different subjects and learning styles."
-        ),
-        Tool(
-            name="Google Search Tool", 
-            func=google_search_tool, 
-            description="Search Google for recent academic information and facts."
-        ),
-        Tool(
-            name="YouTube Summary Tool", 
-            func=youtube_summary_tool, 
-            description="Summarize educational YouTube videos. Input: YouTube Video ID or URL."
-        ),
-        Tool(
-            name="Exam Strategy Tool", 
-            func=exam_strategy_tool, 
-            description="Get specific tips for different exam formats: MCQ, theory, practical, or viva."
-        ),
-        Tool(
-            name="Flashcard Generator Tool", 
-            func=flashcard_generator_tool, 
-            description="Generate study flashcards for any topic with question-answer pairs."
-        ),
-        Tool(
-            name="Note Organizer Tool", 
-            func=note_organizer_tool, 
-            description="Organize and structure study notes for better comprehension."
-        ),
-        Tool(
-            name="Concept Mapper Tool", 
-            func=concept_mapper_tool, 
-            description="Create concept maps showing relationships between ideas for visual learning."
-        ),
-        Tool(
-            name="Scholarly Papers Tool", 
-            func=scholarly_papers_tool, 
-            description="Find and summarize academic papers on a given topic."
-        ),
-        Tool(
-            name="Subject Expert Tool", 
-            func=subject_expert_tool, 
-            description="Get specialized help from virtual subject matter experts in various fields."
-        ),
-    ]
-
-    class ToolTracker:
-        def __init__(self):
-            self.tools_used = set()
-        
-        def track_tool_usage(self, tool_name):
-            self.tools_used.add(tool_name)
+AGENT_INPUT_PREFIX = "Based on all available information, please provide a detailed and helpful answer to this query: "
 
-    tool_tracker = ToolTracker()
-    
-    def _track_tool_usage(tool_name):
-        tool_tracker.track_tool_usage(tool_name)
-    
-    for tool in tools:
-        original_func = tool.func
-        tool.func = lambda query, tool_name=tool.name, func=original_func: (_track_tool_usage(tool_name), func(query))[1]
-
-    agent = initialize_agent(
-        tools=tools,
-        llm=llm,
-        agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-        verbose=True,
-        memory=memory,
-        max_iterations=Config.MAX_ITERATIONS,
-        early_stopping_method="generate",
+def _new_memory(llm=None) -> WindowedSummaryMemory:
+    return WindowedSummaryMemory(llm=llm, memory_key="chat_history", return_messages=True, input_prefix=AGENT_INPUT_PREFIX)
+
+def _observed(spec):
+    # Tool outputs pass through the request's observation compressor (if any)
+    # before they reach the agent's scratchpad.
+    def run(tool_input: str) -> str:
+        return process_observation(spec.name, tool_input, spec(tool_input))
+    return run
+
+def build_tools():
+    # Tool functions are lazy (see tool_registry), so building the agent does not
+    # import any tool's dependencies.
+    return [Tool(name=spec.name, func=_observed(spec), description=spec.description) for spec in TOOL_REGISTRY]
+
+class ToolTracker(BaseCallbackHandler):
+    # Passed as a per-request callback, so the shared Tool objects stay untouched.
+    def __init__(self):
+        self.tools_used = []
+        self.llm_calls = 0
+        self.outputs = []
+        self._running = {}
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        tool_name = serialized.get("name")
+        self._running[run_id] = tool_name
+        if tool_name and tool_name not in self.tools_used:
+            self.tools_used.append(tool_name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.outputs.append((self._running.pop(run_id, None), str(output)))
+
+class UpstreamGuard(BaseCallbackHandler):
+    # Puts every LLM call through the upstream's rate limiter, quota and circuit
+    # breaker. raise_error makes a refusal in on_*_start abort the call before any
+    # request is sent.
+    raise_error = True
+
+    def __init__(self, name: str):
+        self.upstream = get_upstream(name)
+        self._admitted = set()
+
+    def _admit(self, run_id):
+        self.upstream.admit()
+        self._admitted.add(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._admit(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, options=None, **kwargs):
+        # A reply that will come from the response cache sends no request.
+        if will_hit(serialized, messages, invocation_params, options):
+            return
+        self._admit(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id in self._admitted:
+            self._admitted.discard(run_id)
+            self.upstream.record()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if run_id in self._admitted:
+            self._admitted.discard(run_id)
+            self.upstream.record(error)
+
+class StepBudgetExceeded(DeadlineExceeded):
+    pass
+
+class AgentRunError(RuntimeError):
+    pass
+
+class DeadlineGuard(BaseCallbackHandler):
+    # Checks the request deadline at every LLM call, streamed token and tool call,
+    # so a run the caller has given up on stops at its next step. With `reserve`
+    # set, a further agent step is refused once less than `reserve` seconds are
+    # left, leaving that time for writing an answer from what was found.
+    raise_error = True
+
+    def __init__(self, deadline: Deadline, reserve: float = 0.0):
+        self.deadline = deadline
+        self.reserve = reserve
+        self._llm_calls = 0
+
+    def _llm_start(self):
+        self.deadline.check()
+        if self._llm_calls and self.deadline.remaining() < self.reserve:
+            raise StepBudgetExceeded(f"Less than {self.reserve:g}s left for another step")
+        self._llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._llm_start()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._llm_start()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.deadline.check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.deadline.check()
+
+class AgentFactory:
+    def __init__(self, llm=None):
+        self._lock = threading.Lock()
+        self._llm = llm
+        self._tools = None
+        self._executor = None
+        self._memories = OrderedDict()
+        self.timings = {"cold_build_seconds": None, "warm_lookup_seconds": None}
+
+    def _build(self):
+        if self._llm is None:
+            self._llm = ChatGoogleGenerativeAI(
+                model=Config.LLM_MODEL,
+                temperature=Config.TEMPERATURE,
+                max_output_tokens=Config.MAX_OUTPUT_TOKENS,
+                convert_system_message_to_human=True,
+                cache=cache_for(Config.TEMPERATURE),
+            )
+        self._tools = build_tools()
+        self._executor = initialize_agent(
+            tools=self._tools,
+            llm=self._llm,
+            agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
+            verbose=Config.AGENT_VERBOSE,
+            memory=_new_memory(self._llm),
+            max_iterations=Config.MAX_ITERATIONS,
+            early_stopping_method="generate",
+        )
+        # Ask the chat model to stream so StreamingCallbackHandler sees tokens as they arrive.
+        self._executor.agent.llm_chain.llm_kwargs = {"stream": True}
+
+    def get_llm(self):
+        with self._lock:
+            if self._executor is None:
+                self._build()
+            return self._llm
+
+    def set_llm(self, llm):
+        # Swaps the chat model (e.g. for a scripted one in benchmarks); the agent and
+        # all session memories are rebuilt on next use.
+        with self._lock:
+            self._llm = llm
+            self._executor = None
+            self._memories.clear()
+
+    def memory_for(self, session_id: str):
+        with self._lock:
+            memory = self._memories.pop(session_id, None)
+            if memory is None:
+                memory = _new_memory(self._llm)
+            elif memory.llm is None:
+                memory.llm = self._llm
+            self._memories[session_id] = memory
+            while len(self._memories) > Config.MAX_SESSIONS:
+                self._memories.popitem(last=False)
+            return memory
+
+    def has_history(self, session_id: str) -> bool:
+        # Unlike memory_for, doesn't create a memory or mark the session as used.
+        with self._lock:
+            memory = self._memories.get(session_id)
+        return memory is not None and memory.has_history
+
+    def get_executor(self, session_id: str = "default"):
+        start = time.perf_counter()
+        with self._lock:
+            cold = self._executor is None
+            if cold:
+                self._build()
+        # construct() makes a shallow, unvalidated copy: the LLM client, tools and prompt
+        # are shared, only the memory differs. (.copy() would clone every nested model.)
+        executor = AgentExecutor.construct(**{
+            **self._executor.__dict__,
+            "memory": self.memory_for(session_id),
+        })
+        elapsed = time.perf_counter() - start
+        self.timings["cold_build_seconds" if cold else "warm_lookup_seconds"] = elapsed
+        return executor
+
+    def reset_session(self, session_id: str):
+        with self._lock:
+            self._memories.pop(session_id, None)
+
+_factory = AgentFactory()
+
+def get_agent_factory() -> AgentFactory:
+    return _factory
+
+def get_build_timings():
+    return dict(_factory.timings)
+
+def _agent_input(query: str) -> str:
+    return f"{AGENT_INPUT_PREFIX}{query}"
+
+def _partial_answer(streamed: str, tool_outputs, seconds: float) -> str:
+    # Best answer available when the deadline cuts a run short: the part of the
+    # final answer already streamed, else a digest of what the tools returned.
+    if streamed.strip():
+        return f"{streamed.rstrip()}…\n\n(I ran out of time before finishing this answer.)"
+    if not tool_outputs:
+        return f"I couldn't answer within {seconds:g}s. Please try again, or ask a narrower question."
+    return (
+        f"I ran out of time ({seconds:g}s) before I could write a full answer. Here is what I found so far:\n\n"
+        + _digest(tool_outputs, Config.OBSERVATION_TOKEN_BUDGET // 2)
     )
-    
+
+def _run_routed(route: Route, query: str, session_id: str, events: queue.Queue, started_at: float, callbacks) -> Tuple[str, bool]:
+    # Fast path: call the routed tool directly, then one LLM call turns its output
+    # into the answer. Returns the response and whether any tokens were streamed.
+    def elapsed():
+        return time.perf_counter() - started_at
+
+    events.put(AgentEvent("tool_start", elapsed(), text=route.tool_input, tool=route.tool))
+    tool_started = time.perf_counter()
+    with tracing.span(route.tool, "tool", rule=route.rule, input=route.tool_input[:200]) as span:
+        output = get_tool(route.tool)(route.tool_input)
+        span.attributes["output_chars"] = len(output)
+    events.put(AgentEvent("tool_end", elapsed(), text=output, tool=route.tool, latency=time.perf_counter() - tool_started))
+    return _answer_from_material(query, route.tool, output, session_id, events, started_at, callbacks)
+
+class TokenRelay(BaseCallbackHandler):
+    def __init__(self, events: queue.Queue, started_at: float):
+        self.events = events
+        self.started_at = started_at
+        self.parts = []
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.parts.append(token)
+            self.events.put(AgentEvent("token", time.perf_counter() - self.started_at, text=token))
+
+def _answer_from_material(query: str, source: str, material: str, session_id: str, events: queue.Queue, started_at: float, callbacks) -> Tuple[str, bool]:
+    # One streamed LLM call that writes the answer from tool output. Returns the
+    # response and whether any tokens were streamed. invoke(stream=True) rather than
+    # stream() so the call goes through the model's response cache.
+    relay = TokenRelay(events, started_at)
+    response = ""
     try:
-        response = agent.run(f"Based on all available information, please provide a detailed and helpful answer to this query: {query}")
-        return response, list(tool_tracker.tools_used)
-    except Exception as e:
-        return f"I encountered an error: {str(e)}. Please try rephrasing your question.", list(tool_tracker.tools_used)
\ No newline at end of file
+        prompt = [HumanMessage(content=polish_prompt(query, source, material))]
+        response = _factory.get_llm().invoke(prompt, config={"callbacks": callbacks + [relay]}, stream=True).content
+    except Exception:
+        # The tool output is still a useful answer if the polish call fails.
+        if not relay.parts:
+            return material, False
+    response = response or "".join(relay.parts) or material
+    _factory.memory_for(session_id).save_context({"input": _agent_input(query)}, {"output": response})
+    return response, bool(relay.parts)
+
+def _digest(tool_outputs, budget: int) -> str:
+    return "\n\n".join(f"**{tool}**\n{compress(text, budget)}" for tool, text in tool_outputs)
+
+def stream_agent(query: str, session_id: str = "default", deadline_seconds: float = None) -> Iterator[AgentEvent]:
+    started_at = time.perf_counter()
+    # One time budget for the whole run; every tool and LLM call gets what is left.
+    deadline = Deadline(deadline_seconds or Config.REQUEST_DEADLINE_SECONDS)
+    root = tracing.start_trace("run_agent", session_id=session_id, query=query)
+
+    def elapsed():
+        return time.perf_counter() - started_at
+
+    def finish(response: str, tools_used, compressor=None, error: Optional[str] = None, **attributes) -> AgentEvent:
+        saved = compressor.prompt_tokens_saved() if compressor is not None else 0
+        root.finish(tools_used=list(tools_used), response_chars=len(response), prompt_tokens_saved=saved, error=error, **attributes)
+        tracing.export_trace(root)
+        return AgentEvent(
+            "final",
+            elapsed(),
+            text=response,
+            tools_used=list(tools_used),
+            trace=root.breakdown(),
+            observations=compressor.records if compressor is not None else [],
+            prompt_tokens_saved=saved,
+            error=error,
+        )
+
+    semantic_cache = get_semantic_cache() if Config.SEMANTIC_CACHE_ENABLED and is_cacheable_query(query) else None
+    if semantic_cache is not None:
+        with tracing.use_span(root):
+            query_vector = semantic_cache.embed(query)
+            cached = semantic_cache.lookup(query_vector)
+            tracing.record_event("Semantic Cache", hit=cached is not None,
+                                 similarity=None if cached is None else round(cached.similarity, 3))
+        if cached is not None:
+            # Keep the session's memory consistent with what the user saw.
+            _factory.memory_for(session_id).save_context({"input": _agent_input(query)}, {"output": cached.answer})
+            yield AgentEvent("token", elapsed(), text=cached.answer)
+            yield finish(cached.answer, cached.tools_used, semantic_cache_hit=True)
+            return
+    # An answer written with earlier turns in the prompt may lean on them, so only
+    # a session's first exchange is stored; stored answers serve any session.
+    store_answer = semantic_cache is not None and not _factory.has_history(session_id)
+
+    router = get_router() if Config.ROUTER_ENABLED else None
+    route = router.route(query) if router is not None else None
+    if route is not None:
+        root.attributes["route"] = route.rule
+
+    events = queue.Queue()
+    tool_tracker = ToolTracker()
+    streamer = StreamingCallbackHandler(events, started_at)
+    tracer = TracingCallbackHandler(root)
+    guard = UpstreamGuard("Gemini")
+    deadline_guard = DeadlineGuard(deadline)
+    step_guard = DeadlineGuard(deadline, reserve=Config.DEADLINE_FINAL_ANSWER_SECONDS)
+    compressor = ObservationCompressor() if Config.OBSERVATION_COMPRESSION_ENABLED and route is None else None
+    result = {}
+
+    def work():
+        try:
+            with tracing.use_span(root), deadline_scope(deadline):
+                if route is not None:
+                    tool_tracker.tools_used.append(route.tool)
+                    with collect_tool_errors() as tool_errors:
+                        result["response"], result["streamed"] = _run_routed(
+                            route, query, session_id, events, started_at, [deadline_guard, guard, tool_tracker, tracer]
+                        )
+                    # The agent can try another tool when one fails; the fast path
+                    # has only its one tool, so its answer is no better than the error.
+                    if tool_errors:
+                        result["tool_error"] = tool_errors[0]
+                else:
+                    agent = _factory.get_executor(session_id)
+                    callbacks = [step_guard, guard, tool_tracker, streamer, tracer] + ([compressor] if compressor else [])
+                    try:
+                        with observing(compressor):
+                            result["response"] = agent.run(_agent_input(query), callbacks=callbacks)
+                    except StepBudgetExceeded:
+                        if not tool_tracker.outputs:
+                            raise
+                        # Out of time for more steps: answer from the observations so far.
+                        material = _digest(tool_tracker.outputs, Config.OBSERVATION_TOKEN_BUDGET)
+                        result["response"], result["streamed"] = _answer_from_material(
+                            query, "tools", material, session_id, events, started_at, [deadline_guard, guard, tracer]
+                        )
+        except Exception as e:
+            result["error"] = e
+        finally:
+            events.put(None)
+
+    # The worker runs in a copy of the caller's context so spans opened there
+    # (and any other context variables) are visible to the agent's callbacks.
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(work,), name="agent-run", daemon=True).start()
+    timed_out = False
+    streamed, tool_outputs = [], []
+    while True:
+        try:
+            event = events.get(timeout=deadline.remaining())
+        except queue.Empty:
+            # Give up on the worker; its next deadline check stops it.
+            deadline.cancel()
+            timed_out = True
+            break
+        if event is None:
+            break
+        if event.type == "token":
+            streamed.append(event.text)
+        elif event.type == "tool_end" and not event.text.startswith("Error:"):
+            tool_outputs.append((event.tool, event.text))
+        yield event
+
+    if timed_out or isinstance(result.get("error"), DeadlineExceeded):
+        response = _partial_answer("".join(streamed), tool_outputs, deadline.seconds)
+        yield AgentEvent("token", elapsed(), text=response)
+        yield finish(response, tool_tracker.tools_used, compressor, error=f"No complete answer within {deadline.seconds:g}s",
+                     deadline_exceeded=True)
+        return
+    if isinstance(result.get("error"), UpstreamUnavailableError):
+        response = f"I can't reach the language model right now: {result['error']}. Please try again shortly."
+    elif "error" in result:
+        response = f"I encountered an error: {str(result['error'])}. Please try rephrasing your question."
+    else:
+        response = result["response"]
+        # An answer built around a failed tool is shown but neither reused nor
+        # counted as a good route.
+        cacheable = "tool_error" not in result
+        if cacheable and store_answer:
+            semantic_cache.store(query, query_vector, response, tool_tracker.tools_used, tool_tracker.llm_calls)
+        if cacheable and router is not None:
+            if route is not None:
+                router.record_routed(route, elapsed())
+            else:
+                router.record_fallback(elapsed())
+    if not (streamer.streamed_final_answer or result.get("streamed")):
+        yield AgentEvent("token", elapsed(), text=response)
+    error = str(result["error"]) if "error" in result else result.get("tool_error")
+    yield finish(response, tool_tracker.tools_used, compressor, error=error)
+
+def run_agent(query: str, session_id: str = "default", deadline_seconds: float = None, raise_errors: bool = False):
+    # By default failures come back as an apology in the response, as the chat
+    # shows them; raise_errors=True raises AgentRunError instead.
+    response, tools_used = "", []
+    for event in stream_agent(query, session_id, deadline_seconds):
+        if event.type == "final":
+            if event.error and raise_errors:
+                raise AgentRunError(event.error)
+            response, tools_used = event.text, event.tools_used
+    return response, tools_used
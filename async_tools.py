@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import threading
+import weakref
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from cache import cached_fetch_async, cached_fetch_many_async
+from concept_graph import learn_concepts
+from config import Config
+from deadline import DeadlineExceeded, current_deadline, deadline_scope, remaining_timeout
+from ratelimit import UpstreamUnavailableError
+from serpapi_client import AsyncSerpApiClient, SearchResult
+from vector_store import remember
+from tool_registry import collect_tool_errors, current_tool_errors, tool_error
+from wiki_client import USER_AGENT, AsyncWikipediaClient, WikipediaError
+import tools
+import tracing
+
+_sessions = weakref.WeakKeyDictionary()
+
+async def get_http_session() -> aiohttp.ClientSession:
+    # One pooled session per event loop; aiohttp sessions cannot cross loops.
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=Config.ASYNC_HTTP_POOL_SIZE),
+            headers={"User-Agent": USER_AGENT},
+        )
+        _sessions[loop] = session
+    return session
+
+async def _wikipedia_transport(url: str, params: dict, timeout: float) -> dict:
+    session = await get_http_session()
+    async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status != 200:
+            raise WikipediaError(f"Wikipedia API returned status code {response.status}")
+        return await response.json(content_type=None)
+
+_serpapi_client = AsyncSerpApiClient(get_http_session)
+_wikipedia_client = AsyncWikipediaClient(_wikipedia_transport)
+
+async def serp_search(tool: str, query: str, engine: str = "google", num: int = 5) -> List[SearchResult]:
+    async def fetch():
+        return [asdict(result) for result in await _serpapi_client.search(query, engine=engine, num=num)]
+
+    # Same cache key as tools.serp_search, so sync and async callers share entries.
+    results = await cached_fetch_async(tool, query, fetch, engine=engine, num=num)
+    return [SearchResult(**result) for result in results]
+
+async def run_serp_tool(tool: str, query: str) -> str:
+    # The steps of tools.run_serp_tool around an async search. The concept graph,
+    # paper index and vector store block, so those steps run in worker threads
+    # rather than on the shared event loop.
+    answer, hits = await asyncio.to_thread(tools.serp_tool_local, tool, query)
+    if answer is not None:
+        return answer
+    spec = tools.SERP_TOOLS[tool]
+    try:
+        results = await serp_search(tool, spec.search_query(query), engine=spec.engine, num=spec.num)
+        return await asyncio.to_thread(tools.serp_tool_answer, tool, query, results, hits)
+    except Exception as e:
+        return await asyncio.to_thread(tools.serp_tool_failure, tool, query, e, hits)
+
+async def wikipedia_tool(query: str) -> str:
+    try:
+        titles = tools.split_titles(query)
+
+        if len(titles) > 1:
+            async def fetch_many(missing):
+                articles = await _wikipedia_client.fetch_articles(missing)
+                return {title: tools.wikipedia_record(article) for title, article in articles.items()}
+
+            records = await cached_fetch_many_async("Wikipedia Tool", titles, fetch_many, batch=True)
+            await asyncio.to_thread(
+                learn_concepts, [record["summary"] for record in records.values() if record and not record["is_disambiguation"]]
+            )
+            return tools.format_wikipedia_batch(titles, records)
+
+        async def fetch():
+            return tools.wikipedia_record(await _wikipedia_client.lookup(query))
+
+        record = await cached_fetch_async("Wikipedia Tool", query, fetch)
+        if not record:
+            return f"No Wikipedia results found for '{query}'."
+
+        output = tools.format_wikipedia_record(record)
+        if not record["is_disambiguation"]:
+            await asyncio.to_thread(learn_concepts, [record["summary"]])
+            await asyncio.to_thread(remember, output, source="Wikipedia Tool", metadata={"query": query, "url": record["url"]})
+        return output
+    except UpstreamUnavailableError as e:
+        return await asyncio.to_thread(tools.degraded_answer, query, e)
+    except Exception as e:
+        return tool_error(f"Couldn't fetch Wikipedia content: {str(e)}")
+
+async def youtube_summary_tool(video_input: str) -> str:
+    # youtube_transcript_api has no async API; keep it off the event loop.
+    return await asyncio.to_thread(tools.youtube_summary_tool, video_input)
+
+async def study_tips_tool(query: str) -> str:
+    return await run_serp_tool("Study Tips Tool", query)
+
+async def google_search_tool(query: str) -> str:
+    return await run_serp_tool("Google Search Tool", query)
+
+async def exam_strategy_tool(query: str) -> str:
+    return await run_serp_tool("Exam Strategy Tool", query)
+
+async def flashcard_generator_tool(query: str) -> str:
+    return await run_serp_tool("Flashcard Generator Tool", query)
+
+async def note_organizer_tool(query: str) -> str:
+    return await run_serp_tool("Note Organizer Tool", query)
+
+async def concept_mapper_tool(query: str) -> str:
+    return await run_serp_tool("Concept Mapper Tool", query)
+
+async def scholarly_papers_tool(query: str) -> str:
+    return await run_serp_tool("Scholarly Papers Tool", query)
+
+async def subject_expert_tool(query: str) -> str:
+    return await run_serp_tool("Subject Expert Tool", query)
+
+ASYNC_TOOLS = {
+    "Wikipedia Tool": wikipedia_tool,
+    "Study Tips Tool": study_tips_tool,
+    "Google Search Tool": google_search_tool,
+    "YouTube Summary Tool": youtube_summary_tool,
+    "Exam Strategy Tool": exam_strategy_tool,
+    "Flashcard Generator Tool": flashcard_generator_tool,
+    "Note Organizer Tool": note_organizer_tool,
+    "Concept Mapper Tool": concept_mapper_tool,
+    "Scholarly Papers Tool": scholarly_papers_tool,
+    "Subject Expert Tool": subject_expert_tool,
+}
+
+async def _run_with_deadline(name: str, query: str, deadline: float) -> Tuple[str, bool]:
+    # The tool's output and whether it succeeded, i.e. reported no error of its own
+    # (one failing tool can report several).
+    with tracing.span(name, "tool") as span, collect_tool_errors() as errors:
+        try:
+            output = await asyncio.wait_for(ASYNC_TOOLS[name](query), timeout=deadline)
+        except asyncio.TimeoutError:
+            output = tool_error(f"{name} did not respond within {deadline:g}s.")
+            span.attributes["timed_out"] = True
+        span.attributes["output_chars"] = len(output)
+    return output, not errors
+
+async def _research_sources(query: str, tool_names: List[str], deadline: float) -> Dict[str, Tuple[str, bool]]:
+    deadline = remaining_timeout(deadline)
+    outcomes = await asyncio.gather(*(_run_with_deadline(name, query, deadline) for name in tool_names))
+    return dict(zip(tool_names, outcomes))
+
+async def research_bundle(
+    query: str,
+    tool_names: Optional[List[str]] = None,
+    deadline: float = Config.RESEARCH_BUNDLE_TOOL_TIMEOUT,
+) -> Dict[str, str]:
+    # Every tool runs concurrently, so wall time is roughly the slowest source
+    # (capped at the per-tool deadline) rather than the sum of all of them.
+    outcomes = await _research_sources(query, tool_names or Config.RESEARCH_BUNDLE_TOOLS, deadline)
+    return {name: output for name, (output, _) in outcomes.items()}
+
+def format_research_bundle(results: Dict[str, str]) -> str:
+    return "\n\n".join(f"### {name}\n{output}" for name, output in results.items())
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    # A long-lived loop lets synchronous callers (the ReAct agent) reuse the pooled
+    # aiohttp session instead of paying for a new loop and connections per call.
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-tools", daemon=True).start()
+        return _loop
+
+async def _within_context(coro, span, deadline, tool_errors):
+    # Tasks on the background loop start from that thread's context, so the
+    # caller's active span, request deadline and tool error list are carried over explicitly.
+    with tracing.use_span(span) if span is not None else contextlib.nullcontext():
+        with deadline_scope(deadline), collect_tool_errors(tool_errors) if tool_errors is not None else contextlib.nullcontext():
+            return await coro
+
+def run_coroutine(coro, timeout: Optional[float] = None):
+    deadline = current_deadline()
+    wrapped = _within_context(coro, tracing.current_span(), deadline, current_tool_errors())
+    future = asyncio.run_coroutine_threadsafe(wrapped, _background_loop())
+    try:
+        return future.result(deadline.timeout(timeout) if deadline is not None else timeout)
+    except (concurrent.futures.TimeoutError, DeadlineExceeded):
+        # Don't leave the coroutine running on the shared loop after giving up on it.
+        future.cancel()
+        raise
+
+def _close_background_session():
+    if _loop is None or not _loop.is_running():
+        return
+    session = _sessions.get(_loop)
+    if session is not None and not session.closed:
+        run_coroutine(session.close(), timeout=5)
+
+atexit.register(_close_background_session)
+
+def research_bundle_tool(query: str) -> str:
+    try:
+        outcomes = run_coroutine(_research_sources(query, Config.RESEARCH_BUNDLE_TOOLS, Config.RESEARCH_BUNDLE_TOOL_TIMEOUT))
+        results = {name: output for name, (output, _) in outcomes.items()}
+        # One source failing still leaves an answer; it is a failure only if all of them did.
+        if not any(ok for _, ok in outcomes.values()):
+            tool_error("Every research source failed")
+        return format_research_bundle(results)
+    except Exception as e:
+        return tool_error(f"Error running research bundle: {str(e)}")
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from dotenv import load_dotenv
+from config import Config
+from ratelimit import TokenBucket
+from tool_registry import TOOL_REGISTRY, collect_tool_errors
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    # Each line is {"query": ..., "id"?: ..., "tool"?: ..., "session_id"?: ...};
+    # a bare JSON string is accepted as the query. Lines without an id are
+    # identified by their line number, which keeps resume working. A line that
+    # can't be read comes through with an "error" and is recorded as failed.
+    with open(path, "r", encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": str(line_number), "error": f"Line {line_number} is not valid JSON: {e}"}
+                continue
+            if isinstance(record, str):
+                record = {"query": record}
+            if not isinstance(record, dict):
+                yield {"id": str(line_number), "error": f"Line {line_number} is not a query or an object"}
+                continue
+            record.setdefault("id", str(line_number))
+            yield record
+
+def completed_ids(output_path: str, retry_errors: bool = False) -> set:
+    # The output file doubles as the checkpoint: every finished query has a line.
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a partial last line; that query reruns.
+                continue
+            if retry_errors and result.get("error"):
+                continue
+            done.add(str(result["id"]))
+    return done
+
+class ResultWriter:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._handle = open(path, "a+", encoding="utf-8")
+        self._lock = threading.Lock()
+        # Make sure a partial line from a crashed run is terminated before appending.
+        self._handle.seek(0, os.SEEK_END)
+        if self._handle.tell():
+            self._handle.seek(self._handle.tell() - 1)
+            if self._handle.read(1) != "\n":
+                self._handle.write("\n")
+
+    def write(self, result: dict):
+        line = json.dumps(result, ensure_ascii=False, default=str)
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+    def close(self):
+        self._handle.close()
+
+def tool_functions() -> Dict[str, Callable[[str], str]]:
+    # Same registry the agent is built from.
+    return {spec.name: spec for spec in TOOL_REGISTRY}
+
+def run_one(record: dict, default_tool: Optional[str], tools: Dict[str, Callable[[str], str]]) -> dict:
+    # Never raises: whatever goes wrong is recorded in the result's "error".
+    tool_name = record.get("tool") or default_tool
+    started = time.perf_counter()
+    result = {"id": record.get("id"), "query": record.get("query"), "tool": tool_name}
+    try:
+        if record.get("error"):
+            raise ValueError(record["error"])
+        query = record.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Missing query")
+        if tool_name:
+            if tool_name not in tools:
+                raise ValueError(f"Unknown tool '{tool_name}'")
+            # Tools answer failures with a message rather than raising.
+            with collect_tool_errors() as tool_errors:
+                result["response"] = tools[tool_name](query)
+            result["tools_used"] = [tool_name]
+            result["error"] = tool_errors[0] if tool_errors else None
+        else:
+            # Imported here so tool-only runs never load the agent and the LLM client.
+            from agent import run_agent
+            session_id = record.get("session_id") or f"batch-{record['id']}"
+            result["response"], result["tools_used"] = run_agent(query, session_id=session_id, raise_errors=True)
+            result["error"] = None
+    except Exception as e:
+        result["response"], result["tools_used"], result["error"] = None, [], str(e) or type(e).__name__
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    return result
+
+def run_batch(
+    records: Iterable[dict],
+    output_path: str,
+    tool: Optional[str] = None,
+    workers: int = Config.BATCH_WORKERS,
+    rate: Optional[float] = Config.BATCH_RATE_LIMIT,
+    resume: bool = True,
+    retry_errors: bool = False,
+    on_result: Optional[Callable[[dict], None]] = None,
+) -> BatchSummary:
+    summary = BatchSummary()
+    started = time.perf_counter()
+    done = completed_ids(output_path, retry_errors) if resume else set()
+    if not resume and os.path.exists(output_path):
+        os.remove(output_path)
+    tools = tool_functions()
+    limiter = TokenBucket(rate, capacity=1) if rate else None
+    writer = ResultWriter(output_path)
+
+    def finish(future):
+        result = future.result()
+        writer.write(result)
+        if result["error"]:
+            summary.failed += 1
+            summary.errors.append(f"{result['id']}: {result['error']}")
+        else:
+            summary.succeeded += 1
+        if on_result:
+            on_result(result)
+
+    def submit(pool, record):
+        if limiter:
+            limiter.acquire()
+        return pool.submit(run_one, record, tool, tools)
+
+    # Only a bounded window of queries is in flight, so arbitrarily large input
+    # files are streamed rather than loaded up front.
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            for record in records:
+                summary.total += 1
+                if str(record.get("id")) in done:
+                    summary.skipped += 1
+                    continue
+                if len(pending) >= workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(future)
+                pending.add(submit(pool, record))
+            for future in wait(pending).done:
+                finish(future)
+    finally:
+        writer.close()
+    summary.elapsed = time.perf_counter() - started
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run many study-assistant queries from a JSONL file.")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("output", help="JSONL file results are appended to (also the resume checkpoint)")
+    parser.add_argument("--tool", help="Run every query through this tool instead of the agent, e.g. 'Flashcard Generator Tool'")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_WORKERS)
+    parser.add_argument("--rate", type=float, default=Config.BATCH_RATE_LIMIT, help="Maximum queries started per second (0 for no limit)")
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of skipping queries already in the output file")
+    parser.add_argument("--retry-errors", action="store_true", help="On resume, rerun queries that previously failed")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+
+    def progress(result):
+        status = "error" if result["error"] else "ok"
+        print(f"[{status}] {result['id']} ({result['elapsed']:.1f}s)", file=sys.stderr)
+
+    summary = run_batch(
+        read_jsonl(args.input),
+        args.output,
+        tool=args.tool,
+        workers=args.workers,
+        rate=args.rate or None,
+        resume=not args.no_resume,
+        retry_errors=args.retry_errors,
+        on_result=progress,
+    )
+    print(
+        f"{summary.succeeded} succeeded, {summary.failed} failed, {summary.skipped} already done "
+        f"({summary.total} total) in {summary.elapsed:.1f}s",
+        file=sys.stderr,
+    )
+    return 1 if summary.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from streamlit.testing.v1 import AppTest
+from chat_history import ChatHistory, ChatMessage
+from config import Config
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOL_SETS = [["Wikipedia Tool"], ["Google Search Tool", "Wikipedia Tool"], ["Flashcard Generator Tool"], []]
+
+# The chat loop this store replaced: every message of the session, rendered on every rerun.
+LEGACY_APP = """
+import streamlit as st
+for message in st.session_state.chat_history:
+    with st.chat_message(message["role"]):
+        st.write(message["content"])
+        if message.get("tools_used"):
+            with st.expander("🧰 Tools Used"):
+                for observation in message.get("observations") or []:
+                    st.info(f"**{observation['tool']}**: {observation['input']}")
+                    st.markdown(observation["output"])
+"""
+
+def synthetic_turn(index: int):
+    # A question, and an answer of typical size with the raw tool outputs.
+    tools = TOOL_SETS[index % len(TOOL_SETS)]
+    answer = f"Answer {index}: " + "Photosynthesis turns light into chemical energy in the chloroplast. " * 20
+    details = {
+        "observations": [{"tool": tool, "input": f"topic {index}", "output": "Snippet about the topic. " * 60} for tool in tools],
+        "prompt_tokens_saved": 150 if tools else 0,
+    }
+    return (
+        {"role": "user", "content": f"Question {index} about photosynthesis?"},
+        {"role": "assistant", "content": answer, "tools_used": list(tools), **details},
+    )
+
+def legacy_history(turns: int) -> list:
+    return [message for index in range(turns) for message in synthetic_turn(index)]
+
+def store_history(turns: int, directory: str) -> ChatHistory:
+    history = ChatHistory(f"bench-{turns}", directory=directory)
+    for index in range(turns):
+        question, answer = synthetic_turn(index)
+        history.append(ChatMessage("user", question["content"]))
+        details = {key: answer[key] for key in ("observations", "prompt_tokens_saved")}
+        history.append(ChatMessage("assistant", answer["content"], answer["tools_used"], details))
+    return history
+
+def retained_mb(build) -> float:
+    tracemalloc.start()
+    history = build()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+    return current / 1e6
+
+def rerun_ms(app: AppTest, state: dict, runs: int) -> float:
+    for key, value in state.items():
+        app.session_state[key] = value
+    app.run()  # first run imports the app's modules
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Streamlit rerun latency and session memory for long chats.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="chat-bench-")
+    Config.CHAT_LOG_DIR = directory
+    print(f"{'turns':>6} {'mode':<8} {'rerun ms':>9} {'memory MB':>10} {'log MB':>7}")
+    print("-" * 44)
+    for turns in args.turns:
+        legacy = legacy_history(turns)
+        legacy_ms = rerun_ms(AppTest.from_string(LEGACY_APP, default_timeout=300), {"chat_history": legacy}, args.runs)
+        print(f"{turns:>6} {'legacy':<8} {legacy_ms:>9.1f} {retained_mb(lambda: legacy_history(turns)):>10.2f} {'-':>7}")
+
+        history = store_history(turns, directory)
+        app = AppTest.from_file(os.path.join(REPO_ROOT, "main.py"), default_timeout=300)
+        state = {"session_id": f"bench-{turns}", "chat_history": history, "history_pages": 1}
+        store_ms = rerun_ms(app, state, args.runs)
+        log_mb = os.path.getsize(history.path) / 1e6 if history.spilled else 0.0
+        memory = retained_mb(lambda: store_history(turns, directory))
+        print(f"{turns:>6} {'store':<8} {store_ms:>9.1f} {memory:>10.2f} {log_mb:>7.2f}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from benchmarks.paper_index import directory_mb, vocabulary
+from concept_graph import ConceptGraph
+from transcripts import STOPWORDS
+
+FILLERS = np.array(["the", "of", "and", "in", "is", "to", "by", "with"])
+
+def synthetic_sentences(seed: int, topics: int = 5_000, topic_words: int = 40, batch: int = 100):
+    # Each sentence is about one topic: half its words come from that topic's own
+    # vocabulary, half from a Zipf-like distribution over all words (skipping the
+    # head, which would be stopwords). Stopwords between some words break them
+    # into phrases, as in real text.
+    rng = np.random.default_rng(seed)
+    words = vocabulary(50_000, rng)
+    weights = 1.0 / np.arange(len(STOPWORDS) + 1, len(STOPWORDS) + len(words) + 1) ** 1.05
+    weights /= weights.sum()
+    pools = rng.integers(0, len(words), (topics, topic_words))
+    while True:
+        topic = rng.integers(0, topics, batch)
+        own = words[pools[topic[:, None], rng.integers(0, topic_words, (batch, 6))]]
+        common = rng.choice(words, (batch, 6), p=weights)
+        mixed = np.concatenate([own, common], axis=1)
+        rng.permuted(mixed, axis=1, out=mixed)
+        gaps = np.where(rng.random((batch, 12)) < 0.5, rng.choice(FILLERS, (batch, 12)), "")
+        yield [
+            " ".join(f"{word} {gap}" if gap else word for word, gap in zip(row, gap_row)).capitalize() + "."
+            for row, gap_row in zip(mixed.tolist(), gaps.tolist())
+        ]
+
+def percentiles(samples) -> str:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return f"p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms"
+
+def timed(call, arguments) -> list:
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        call(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Grow a concept graph from synthetic sentences and time neighbourhood queries.")
+    parser.add_argument("--links", type=int, default=1_000_000, help="Stop adding sentences at this many distinct links.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="concept-graph-bench-")
+    try:
+        graph = ConceptGraph(directory)
+        topics = []
+        started = time.perf_counter()
+        for sentences in synthetic_sentences(args.seed):
+            graph.add_texts(sentences)
+            # Queries are words as they occur in the text, so frequent ones come up more.
+            topics.extend(sentence.split()[0].lower() for sentence in sentences[:5])
+            if graph.edge_count >= args.links:
+                break
+        graph.flush()
+        built = time.perf_counter() - started
+        metrics = graph.metrics()
+        print(f"added {metrics['sentences']:,} sentences in {built:.1f}s ({metrics['sentences'] / built:,.0f}/s): "
+              f"{metrics['concepts']:,} concepts, {metrics['links']:,} links, {metrics['compactions']} compactions, "
+              f"{directory_mb(directory):.0f} MB on disk")
+
+        rng = np.random.default_rng(args.seed + 1)
+        queries = [topics[i] for i in rng.integers(0, len(topics), args.queries)]
+        seeds = [graph.seeds(query)[0] for query in queries]
+        graph.view(queries[0])
+        print(f"1-hop, all links:        {percentiles(timed(lambda s: graph.k_hop(s, hops=1), seeds))}")
+        print(f"2-hop, 10 links per hop: {percentiles(timed(lambda s: graph.k_hop(s, hops=2, fanout=10), seeds))}")
+        print(f"2-hop, all links:        {percentiles(timed(lambda s: graph.k_hop(s, hops=2), seeds[:50]))} (50 queries)")
+        print(f"concept map / cards:     {percentiles(timed(graph.view, queries))}")
+
+        # New sentences go to the buffer; queries see them before the next compaction.
+        more = next(synthetic_sentences(args.seed + 2, batch=100))
+        print(f"adding 100 more sentences: {percentiles(timed(graph.add_texts, [more]))}, "
+              f"{graph.metrics()['buffered_rows']:,} rows buffered")
+        print(f"1-hop with a buffer:     {percentiles(timed(lambda s: graph.k_hop(s, hops=1), seeds))}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
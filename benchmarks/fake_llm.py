@@ -0,0 +1,91 @@
+import json
+import re
+import time
+from typing import Any, Iterator, List, Optional, Tuple
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_google_genai.chat_models import _parse_chat_history
+
+TOOL_RESPONSE_MARKER = "TOOL RESPONSE:"
+AGENT_PROMPT_MARKER = "RESPONSE FORMAT INSTRUCTIONS"
+USER_INPUT_MARKER = "USER'S INPUT"
+
+class ScriptedTrace:
+    # A scripted ReAct trace: when the user's input matches `pattern`, the model
+    # calls each (tool, tool_input) step in turn and then gives the final answer.
+    def __init__(self, pattern: str, steps: List[Tuple[str, str]], answer: str):
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.steps = steps
+        self.answer = answer
+
+def _action_blob(action: str, action_input: str) -> str:
+    return "```json\n" + json.dumps({"action": action, "action_input": action_input}, indent=4) + "\n```"
+
+class ScriptedChatModel(BaseChatModel):
+    # Stateless: the next step is derived from the prompt (how many tool responses
+    # follow the user's input), so one instance can serve any number of concurrent
+    # conversations deterministically.
+    traces: List[Any] = []
+    latency: float = 0.0
+    token_delay: float = 0.0
+    chunk_chars: int = 8
+    fallback: str = "Summary of the earlier conversation."
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        # Reject what Gemini would reject (message types and order), as the agent
+        # builds its prompt with convert_system_message_to_human=True.
+        _parse_chat_history(messages, convert_system_message_to_human=True)
+        if not any(AGENT_PROMPT_MARKER in str(message.content) for message in messages):
+            # Not the agent (e.g. the memory summarizer): plain text reply.
+            return self.fallback
+        humans = [message for message in messages if isinstance(message, HumanMessage)]
+        user_turns = [message for message in humans if not str(message.content).startswith(TOOL_RESPONSE_MARKER)]
+        if not user_turns:
+            return _action_blob("Final Answer", self.fallback)
+        # The input message also lists every tool description; only match on the
+        # user's text, which follows the last USER'S INPUT heading.
+        user_input = str(user_turns[-1].content).rsplit(USER_INPUT_MARKER, 1)[-1]
+        step = len(humans) - 1 - humans.index(user_turns[-1])
+        for trace in self.traces:
+            if trace.pattern.search(user_input):
+                if step < len(trace.steps):
+                    return _action_blob(*trace.steps[step])
+                return _action_blob("Final Answer", trace.answer)
+        return _action_blob("Final Answer", self.fallback)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if kwargs.get("stream"):
+            text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        else:
+            time.sleep(self.latency)
+            text = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        text = self._reply(messages)
+        for start in range(0, len(text), self.chunk_chars):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            piece = text[start:start + self.chunk_chars]
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
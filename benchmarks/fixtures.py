@@ -0,0 +1,143 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+def load_recording(name: str):
+    with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+class FaultInjector:
+    # Latency is base + uniform jitter; a fraction of requests fail with `error_status`.
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next(self):
+        # Returns (delay, failed) for one request.
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return delay, failed
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        delay, failed = self.server.faults.next()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self.send_response(self.server.faults.error_status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        body = json.dumps(self.server.respond(params)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients that hit their deadline hang up mid-response; that is expected here.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class FixtureServer:
+    # Local HTTP server replaying recorded responses; `url` is what the clients'
+    # SERPAPI_BASE_URL / WIKIPEDIA_API_URL overrides point at.
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults or FaultInjector()
+        self._server = _QuietServer(("127.0.0.1", 0), _FixtureHandler)
+        self._server.daemon_threads = True
+        self._server.faults = self.faults
+        self._server.respond = self.respond
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def respond(self, params: dict) -> dict:
+        raise NotImplementedError
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class SerpApiFixtureServer(FixtureServer):
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        super().__init__(faults)
+        self.recordings = {
+            "google": load_recording("serpapi_google.json"),
+            "google_scholar": load_recording("serpapi_google_scholar.json"),
+        }
+
+    def respond(self, params: dict) -> dict:
+        recording = self.recordings.get(params.get("engine"), self.recordings["google"])
+        num = int(params.get("num", 10))
+        return {
+            **recording,
+            "search_parameters": {**recording["search_parameters"], "q": params.get("q", "")},
+            "organic_results": recording["organic_results"][:num],
+        }
+
+class WikipediaFixtureServer(FixtureServer):
+    # Replays one recorded page, retitled after whatever was searched or requested,
+    # so single lookups and batched title lookups both resolve.
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        super().__init__(faults)
+        self.page = load_recording("wikipedia_query.json")["query"]["pages"][0]
+
+    def _page(self, title: str) -> dict:
+        return {**self.page, "title": title, "fullurl": "https://en.wikipedia.org/wiki/" + title.replace(" ", "_")}
+
+    def respond(self, params: dict) -> dict:
+        if params.get("prop") == "links":
+            return {"query": {"pages": []}}
+        if "gsrsearch" in params:
+            titles = [params["gsrsearch"].strip().title()]
+        else:
+            titles = params.get("titles", "").split("|")
+        return {"batchcomplete": True, "query": {"pages": [self._page(title) for title in titles if title]}}
+
+class FixtureTranscriptFetcher:
+    # Stand-in for YouTubeTranscriptApi.get_transcript (see tools.set_transcript_fetcher).
+    def __init__(self, faults: Optional[FaultInjector] = None, recording: str = "youtube_transcript.json"):
+        self.faults = faults or FaultInjector()
+        self.transcript = load_recording(recording)
+
+    def __call__(self, video_id: str):
+        delay, failed = self.faults.next()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise RuntimeError(f"Injected transcript failure for {video_id}")
+        return [dict(entry) for entry in self.transcript]
@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each probe runs in a fresh interpreter so nothing is already imported.
+PROBES = {
+    "import main": "import main",
+    "import tool_registry": "import tool_registry",
+    "import agent": "import agent",
+    "first page render": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "AppTest.from_file('main.py', default_timeout=120).run()"
+    ),
+}
+
+_TIMER = (
+    "import time, json\n"
+    "started = time.perf_counter()\n"
+    "{code}\n"
+    "print(json.dumps(time.perf_counter() - started))\n"
+)
+
+def run_probe(code: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(code=code)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold-start import and first-render timings.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--probes", nargs="+", default=list(PROBES), choices=list(PROBES))
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.probes:
+        run_probe(PROBES[name])  # warm the OS file cache and .pyc files
+        samples = [run_probe(PROBES[name]) for _ in range(args.runs)]
+        results[name] = {"median_ms": round(statistics.median(samples) * 1000, 1),
+                         "min_ms": round(min(samples) * 1000, 1)}
+        print(f"{name:<24}{results[name]['median_ms']:>10.1f} ms median{results[name]['min_ms']:>10.1f} ms min")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        print()
+        for name, result in results.items():
+            if name in baseline:
+                before, after = baseline[name]["median_ms"], result["median_ms"]
+                print(f"{name:<24}{before:>10.1f} -> {after:.1f} ms ({(after - before) / before:+.1%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from paper_index import PaperIndex
+from transcripts import STOPWORDS
+
+SYLLABLES = "ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo fu ga ge gi go gu la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo vu".split()
+
+def vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    words = set()
+    while len(words) < size:
+        syllables = rng.integers(0, len(SYLLABLES), (size, 4))
+        lengths = rng.integers(2, 5, size)
+        words.update("".join(SYLLABLES[s] for s in row[:length]) for row, length in zip(syllables.tolist(), lengths.tolist()))
+    return np.array(sorted(words)[:size])
+
+def synthetic_papers(count: int, seed: int, batch: int):
+    # Titles and abstracts draw words from a Zipf-like distribution over a 50k-word
+    # vocabulary, as real text does; author names come from a smaller pool. The
+    # head of a real distribution is function words, which tokenize() drops as
+    # stopwords, so ranks start after len(STOPWORDS).
+    rng = np.random.default_rng(seed)
+    words = vocabulary(50_000, rng)
+    weights = 1.0 / np.arange(len(STOPWORDS) + 1, len(STOPWORDS) + len(words) + 1) ** 1.05
+    weights /= weights.sum()
+    surnames = vocabulary(20_000, rng)
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        titles = rng.choice(words, (size, 10), p=weights)
+        abstracts = rng.choice(words, (size, 25), p=weights)
+        authors = rng.choice(surnames, (size, 3))
+        yield [
+            {
+                "title": " ".join(titles[i]).capitalize(),
+                "link": f"https://papers.example.org/{start + i}",
+                "snippet": " ".join(abstracts[i]) + ".",
+                "authors": [f"A {name.capitalize()}" for name in authors[i]],
+            }
+            for i in range(size)
+        ]
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1e6
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build a BM25 paper index over a synthetic corpus and time queries.")
+    parser.add_argument("--papers", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=20_000, help="Papers per add() call (one segment each).")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="paper-index-bench-")
+    try:
+        index = PaperIndex(directory)
+        sample = []
+        started = time.perf_counter()
+        for papers in synthetic_papers(args.papers, args.seed, args.batch):
+            index.add(papers)
+            sample.extend(papers[:: max(1, len(papers) // 50)])
+        added = time.perf_counter() - started
+        index.wait_for_merges()
+        built = time.perf_counter() - started
+        print(f"indexed {len(index):,} papers in {added:.1f}s ({len(index) / added:,.0f}/s), "
+              f"merges done after {built:.1f}s: {index.segment_count} segments, {directory_mb(directory):.0f} MB on disk")
+
+        # Queries are two or three words from an indexed title, so every query has
+        # matches and the common words among them have long postings lists.
+        rng = np.random.default_rng(args.seed + 1)
+        queries = []
+        for i in rng.integers(0, len(sample), args.queries):
+            title = sample[i]["title"].lower().split()
+            queries.append(" ".join(rng.choice(title, rng.integers(2, 4), replace=False)))
+        index.search(queries[0])
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+        print(f"{args.queries} queries: p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+
+        duplicates = index.add(sample[:100])
+        print(f"re-adding 100 indexed papers added {duplicates}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import numpy as np
+
+# Run from the repository root: python -m benchmarks.run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from benchmarks.fixtures import FaultInjector, FixtureTranscriptFetcher, SerpApiFixtureServer, WikipediaFixtureServer
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the tools and the agent.")
+    parser.add_argument("--scenarios", default="", help="Only run scenarios whose name contains this text.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--iterations", type=int, default=40, help="Operations per scenario and concurrency level.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Upstream latency in seconds (SerpAPI, Wikipedia, YouTube).")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests that fail.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before the scripted model's first token.")
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--with-cache", action="store_true", help="Keep the tool and semantic caches enabled.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before flagging a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args(argv)
+
+def configure(args, workdir: str):
+    # Everything that would touch the network or the working tree is redirected
+    # before the application modules are imported.
+    faults = lambda: FaultInjector(args.latency, args.jitter, args.error_rate, seed=args.seed)
+    serpapi = SerpApiFixtureServer(faults()).start()
+    wikipedia = WikipediaFixtureServer(faults()).start()
+    os.environ["SERPAPI_API_KEY"] = "benchmark"
+    os.environ["SERPAPI_BASE_URL"] = serpapi.url
+    os.environ["WIKIPEDIA_API_URL"] = wikipedia.url
+
+    Config.AGENT_VERBOSE = False
+    Config.EMBEDDING_BACKEND = "hashing"
+    Config.VECTOR_STORE_PATH = os.path.join(workdir, "vector_store.npy")
+    Config.TOOL_CACHE_PATH = os.path.join(workdir, "tool_cache.sqlite3")
+    Config.TRACE_LOG_PATH = os.path.join(workdir, "traces.jsonl")
+    Config.TOOL_CACHE_ENABLED = args.with_cache
+    Config.SEMANTIC_CACHE_ENABLED = args.with_cache
+    Config.PAPER_INDEX_DIR = os.path.join(workdir, "paper_index")
+    Config.PAPER_INDEX_ENABLED = args.with_cache
+    Config.CONCEPT_GRAPH_DIR = os.path.join(workdir, "concept_graph")
+    Config.CONCEPT_GRAPH_ENABLED = args.with_cache
+    # The fixtures have no quotas; measure the code, not the production rate limits.
+    # Circuit breakers stay on, so --error-rate still exercises the degraded paths.
+    Config.UPSTREAM_LIMITS = {}
+    Config.UPSTREAM_DEFAULTS = {**Config.UPSTREAM_DEFAULTS, "rate": 1e6, "burst": 1e6}
+
+    import tools
+    from agent import get_agent_factory
+    from benchmarks.fake_llm import ScriptedChatModel
+    from benchmarks.scenarios import SCRIPTED_TRACES
+
+    tools.set_transcript_fetcher(FixtureTranscriptFetcher(faults()))
+    get_agent_factory().set_llm(ScriptedChatModel(
+        traces=SCRIPTED_TRACES,
+        latency=args.llm_latency,
+        token_delay=args.token_delay,
+    ))
+    return [serpapi, wikipedia]
+
+def measure(scenario, concurrency: int, iterations: int) -> dict:
+    latencies = np.zeros(iterations)
+    errors = 0
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            scenario.call(i)
+            failed = False
+        except Exception:
+            failed = True
+        latencies[i] = time.perf_counter() - started
+        return failed
+
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        errors = sum(pool.map(timed, range(iterations)))
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - memory_before
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {
+        "scenario": scenario.name,
+        "unit": scenario.unit,
+        "concurrency": concurrency,
+        "iterations": iterations,
+        "errors": int(errors),
+        "throughput_per_s": round(iterations / wall, 2),
+        "p50_ms": round(float(p50), 1),
+        "p99_ms": round(float(p99), 1),
+        "peak_memory_mb": round(peak / (1024 * 1024), 2),
+    }
+
+def result_key(result: dict) -> str:
+    return f"{result['scenario']}@{result['concurrency']}"
+
+def print_report(results: List[dict]):
+    header = f"{'scenario':<28}{'conc':>5}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<28}{r['concurrency']:>5}{r['throughput_per_s']:>10.2f}{r['p50_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['peak_memory_mb']:>10.2f}{r['errors']:>8}")
+
+def compare(results: List[dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"\n{'scenario':<34}{'ops/s':>12}{'p50':>12}{'p99':>12}{'peak MB':>12}")
+    for r in results:
+        key = result_key(r)
+        old = baseline.get(key)
+        if old is None:
+            print(f"{key:<34}{'(new)':>12}")
+            continue
+
+        def change(field):
+            return (r[field] - old[field]) / old[field] if old[field] else 0.0
+
+        deltas = {field: change(field) for field in ("throughput_per_s", "p50_ms", "p99_ms", "peak_memory_mb")}
+        print(f"{key:<34}" + "".join(f"{deltas[field]:>+12.1%}" for field in deltas))
+        if deltas["throughput_per_s"] < -tolerance:
+            regressions.append(f"{key}: throughput {deltas['throughput_per_s']:+.1%}")
+        for field in ("p50_ms", "p99_ms", "peak_memory_mb"):
+            if deltas[field] > tolerance:
+                regressions.append(f"{key}: {field} {deltas[field]:+.1%}")
+    return regressions
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="study-assistant-bench-")
+    servers = configure(args, workdir)
+    from benchmarks.scenarios import agent_scenarios, tool_scenarios
+
+    scenarios = [s for s in tool_scenarios() + agent_scenarios() if args.scenarios in s.name]
+    tracemalloc.start()
+    results = []
+    try:
+        for scenario in scenarios:
+            # One untimed call pays for imports, agent construction and connection setup.
+            scenario.call(args.iterations)
+            for concurrency in args.concurrency:
+                result = measure(scenario, concurrency, args.iterations)
+                results.append(result)
+                print(f"{result_key(result)}: {result['throughput_per_s']} {scenario.unit}s/s", file=sys.stderr)
+    finally:
+        tracemalloc.stop()
+        for server in servers:
+            server.stop()
+
+    print_report(results)
+
+    if args.save_baseline:
+        payload = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "compare")},
+            "results": {result_key(r): r for r in results},
+        }
+        with open(args.save_baseline, "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:")
+            for line in regressions:
+                print(f"  {line}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
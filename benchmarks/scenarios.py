@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from typing import Callable, List
+from benchmarks.fake_llm import ScriptedTrace
+
+TOPICS = [
+    "photosynthesis", "calculus", "organic chemistry", "world war one", "linear algebra",
+    "cell biology", "thermodynamics", "macroeconomics", "python programming", "the french revolution",
+]
+
+VIDEO_IDS = ["dQw4w9WgXcQ", "9bZkp7q19f0", "kJQP7kiw5Fk", "OPf0YbXqDm0", "JGwWNGJdvx8"]
+
+@dataclass
+class Scenario:
+    name: str
+    kind: str  # "tool" or "agent"
+    call: Callable[[int], object]  # call(i) performs the i-th operation
+    unit: str = "call"
+
+def _cycle(items: List[str], i: int) -> str:
+    # Distinct inputs per iteration (topic plus a counter) so results are not
+    # served from the tool cache when it is enabled.
+    return f"{items[i % len(items)]} {i // len(items)}"
+
+def tool_scenarios() -> List[Scenario]:
+    import tools
+
+    def wikipedia(i):
+        return tools.wikipedia_tool(_cycle(TOPICS, i))
+
+    def wikipedia_batch(i):
+        return tools.wikipedia_tool(" | ".join(_cycle(TOPICS, i + offset) for offset in range(3)))
+
+    def youtube(i):
+        return tools.youtube_summary_tool(VIDEO_IDS[i % len(VIDEO_IDS)])
+
+    def serp(func):
+        return lambda i: func(_cycle(TOPICS, i))
+
+    return [
+        Scenario("tool.wikipedia", "tool", wikipedia),
+        Scenario("tool.wikipedia_batch", "tool", wikipedia_batch),
+        Scenario("tool.youtube_summary", "tool", youtube),
+        Scenario("tool.study_tips", "tool", serp(tools.study_tips_tool)),
+        Scenario("tool.google_search", "tool", serp(tools.google_search_tool)),
+        Scenario("tool.exam_strategy", "tool", serp(tools.exam_strategy_tool)),
+        Scenario("tool.flashcard_generator", "tool", serp(tools.flashcard_generator_tool)),
+        Scenario("tool.note_organizer", "tool", serp(tools.note_organizer_tool)),
+        Scenario("tool.concept_mapper", "tool", serp(tools.concept_mapper_tool)),
+        Scenario("tool.scholarly_papers", "tool", serp(tools.scholarly_papers_tool)),
+        Scenario("tool.subject_expert", "tool", serp(tools.subject_expert_tool)),
+    ]
+
+SCRIPTED_TRACES = [
+    ScriptedTrace(r"study tips", [("Study Tips Tool", "calculus")],
+                  "Space your practice, test yourself often and work past papers under timed conditions."),
+    ScriptedTrace(r"explain", [("Wikipedia Tool", "photosynthesis"), ("YouTube Summary Tool", VIDEO_IDS[0])],
+                  "Photosynthesis turns light energy into chemical energy stored in sugars."),
+    ScriptedTrace(r"papers", [("Scholarly Papers Tool", "retrieval practice"), ("Concept Mapper Tool", "retrieval practice")],
+                  "Retrieval practice and spacing are the best supported techniques in the literature."),
+    ScriptedTrace(r"research", [("Research Bundle Tool", "photosynthesis")],
+                  "Here is an overview drawn from an encyclopedia, the web and academic papers."),
+    ScriptedTrace(r"flashcards", [("Flashcard Generator Tool", "cell biology"), ("Note Organizer Tool", "cell biology")],
+                  "Q: What is the powerhouse of the cell? A: The mitochondrion."),
+]
+
+CONVERSATIONS = {
+    "agent.single_turn": ["Give me study tips for calculus"],
+    "agent.multi_turn": [
+        "Explain photosynthesis to me",
+        "Find research papers about how to revise it",
+        "Make flashcards for cell biology",
+        "Give me study tips for the biology exam",
+        "Research photosynthesis across several sources",
+    ],
+}
+
+def agent_scenarios() -> List[Scenario]:
+    from agent import run_agent
+
+    def conversation(name: str, turns: List[str]):
+        def call(i):
+            for turn in turns:
+                run_agent(turn, session_id=f"{name}-{i}")
+        return call
+
+    return [
+        Scenario(name, "agent", conversation(name, turns), unit="conversation")
+        for name, turns in CONVERSATIONS.items()
+    ]
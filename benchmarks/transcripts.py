@@ -0,0 +1,82 @@
+import argparse
+import random
+import re
+import time
+import tracemalloc
+from typing import Iterator, List
+from transcripts import iter_segments, summarize_segments
+
+TOPICS = [
+    "photosynthesis chlorophyll thylakoid stroma calvin rubisco glucose carbon light energy",
+    "mitochondria respiration glycolysis krebs pyruvate electron transport atp oxygen",
+    "genetics dna replication polymerase helicase strand nucleotide codon mutation",
+    "evolution selection population allele fitness speciation drift adaptation fossil",
+    "ecology ecosystem predator prey niche biomass trophic decomposer nitrogen cycle",
+    "neurons synapse axon dendrite neurotransmitter potential myelin sodium potassium",
+    "immunity antibody antigen lymphocyte macrophage vaccine pathogen inflammation",
+    "hormones endocrine insulin glucagon pituitary thyroid receptor feedback",
+    "plants xylem phloem transpiration stomata root auxin germination pollination",
+    "cells membrane nucleus ribosome golgi lysosome cytoskeleton vesicle transport",
+]
+FILLER = "so um basically you know what we're going to do here is look at how this works and why it matters okay".split()
+
+def synthetic_transcript(hours: float, seed: int = 0) -> Iterator[dict]:
+    # Auto-caption style: short unpunctuated lines every ~3 seconds, drifting through
+    # the topics in ten-minute blocks. Yields lazily, like a paged caption feed.
+    rng = random.Random(seed)
+    vocab = [topic.split() for topic in TOPICS]
+    start = 0.0
+    while start < hours * 3600:
+        topic = vocab[int(start // 600) % len(vocab)]
+        words = [rng.choice(topic) if rng.random() < 0.5 else rng.choice(FILLER) for _ in range(rng.randint(6, 10))]
+        duration = rng.uniform(2.5, 3.5)
+        yield {"text": " ".join(words), "start": round(start, 2), "duration": round(duration, 2)}
+        start += duration
+
+def legacy_summary(transcript: List[dict]) -> str:
+    # The summarizer this pipeline replaced: join everything, take the first 20 sentences.
+    full_text = " ".join([entry["text"] for entry in transcript])
+    sentences = re.split(r'[.!?]+', full_text)
+    return ". ".join([s.strip() for s in sentences[:20] if s.strip()]) + "."
+
+def topics_covered(starts: List[float], hours: float) -> str:
+    blocks = min(len(TOPICS), int(hours * 3600 // 600) + 1)
+    covered = {int(start // 600) % len(TOPICS) for start in starts}
+    return f"{len(covered)}/{blocks}"
+
+def measure(label: str, fn):
+    # Timed and traced in separate runs; tracemalloc slows allocation-heavy code down.
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return label, elapsed, peak / 1e6, result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize long synthetic lecture transcripts.")
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 3.0, 10.0])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'hours':>6} {'mode':<18} {'seconds':>8} {'peak MB':>8} {'topics':>7}")
+    print("-" * 51)
+    for hours in args.hours:
+        # The YouTube API returns the whole transcript as a list; it is built outside
+        # the measurement so only the summarizer's own memory is counted.
+        transcript = list(synthetic_transcript(hours, args.seed))
+        rows = [
+            measure("legacy (list)", lambda: legacy_summary(transcript)),
+            measure("pipeline (list)", lambda: summarize_segments(iter_segments(transcript))),
+            measure("pipeline (stream)", lambda: summarize_segments(iter_segments(synthetic_transcript(hours, args.seed)))),
+        ]
+        for label, elapsed, peak, result in rows:
+            # The legacy summary never looks past the opening minutes.
+            topics = topics_covered([0.0], hours) if isinstance(result, str) else topics_covered([p.start for p in result], hours)
+            print(f"{hours:>6.1f} {label:<18} {elapsed:>8.3f} {peak:>8.2f} {topics:>7}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
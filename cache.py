@@ -0,0 +1,326 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from ratelimit import UpstreamUnavailableError
+from singleflight import get_singleflight
+from tracing import record_event
+
+_MISSING = object()
+
+def normalize_query(query: str) -> str:
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" ?!.,;:")
+
+def make_key(tool: str, query: str, **params) -> str:
+    payload = json.dumps([tool, normalize_query(query), params], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class PersistentCache:
+    # In-memory LRU in front of a SQLite file. SQLite (WAL mode) does the locking,
+    # so several Streamlit worker processes on one host can share the same file.
+    # Expired rows are kept for `stale_seconds` more, as a fallback for when the
+    # upstream API is unavailable.
+    def __init__(
+        self,
+        path: str,
+        max_entries: int,
+        max_bytes: int,
+        memory_entries: int,
+        default_ttl: float,
+        ttls: dict = None,
+        stale_seconds: float = 0,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.stale_seconds = stale_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"hits": 0, "memory_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0, "stale_served": 0}
+        self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " tool TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def ttl_for(self, tool: str) -> float:
+        return self.ttls.get(tool, self.default_ttl)
+
+    def _remember(self, key, expires_at, value):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, default=None, record_stats: bool = True):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    if record_stats:
+                        self.stats["hits"] += 1
+                        self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            with self._lock:
+                if record_stats:
+                    self.stats["misses"] += 1
+                if row is not None:
+                    self.stats["expired"] += 1
+            if row is not None:
+                conn.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now - self.stale_seconds))
+            return default
+
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        value = json.loads(row[0])
+        self._remember(key, row[1], value)
+        if record_stats:
+            with self._lock:
+                self.stats["hits"] += 1
+        return value
+
+    def get_stale(self, key: str, default=None):
+        # Ignores expiry; only rows past the stale window are gone.
+        row = self._connect().execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        with self._lock:
+            self.stats["stale_served"] += 1
+        return json.loads(row[0])
+
+    def serve_stale(self, key: str, tool: str, error: UpstreamUnavailableError):
+        value = self.get_stale(key, _MISSING)
+        if value is _MISSING:
+            raise error
+        record_event(tool, stale=True, upstream=error.upstream)
+        return value
+
+    def set(self, key: str, tool: str, value, ttl: float = None):
+        now = time.time()
+        expires_at = now + (self.ttl_for(tool) if ttl is None else ttl)
+        payload = json.dumps(value)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, tool, value, size, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, payload, len(payload), expires_at, now),
+            )
+            evicted = self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._remember(key, expires_at, value)
+        with self._lock:
+            self.stats["sets"] += 1
+            self.stats["evictions"] += evicted
+
+    def _evict(self, conn, now) -> int:
+        evicted = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now - self.stale_seconds,)).rowcount
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return evicted
+
+        # Walk least recently used entries until both limits are satisfied.
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC"):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total_bytes -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        with self._lock:
+            for (key,) in doomed:
+                self._memory.pop(key, None)
+        return evicted + len(doomed)
+
+    def get_or_fetch(self, tool: str, query: str, fetch, **params):
+        # Only successful fetches are stored; exceptions from fetch() propagate uncached.
+        key = make_key(tool, query, **params)
+        value = self.get(key, _MISSING)
+        record_event(tool, hit=value is not _MISSING)
+        if value is not _MISSING:
+            return value
+        return coalesced(key, lambda: self._fill(key, tool, fetch))
+
+    def _fill(self, key: str, tool: str, fetch):
+        # Runs once per key for all concurrent callers. Re-check first: the value may
+        # have been stored by another process that held the key's lock before us.
+        value = self.get(key, _MISSING, record_stats=False)
+        if value is not _MISSING:
+            get_singleflight().record_filled_while_waiting()
+            return value
+        try:
+            value = fetch()
+        except UpstreamUnavailableError as e:
+            return self.serve_stale(key, tool, e)
+        self.set(key, tool, value)
+        return value
+
+    def get_or_fetch_many(self, tool: str, queries, fetch_many, **params) -> dict:
+        # fetch_many receives only the misses and returns {query: value}.
+        results = {}
+        missing = []
+        for query in queries:
+            value = self.get(make_key(tool, query, **params), _MISSING)
+            if value is _MISSING:
+                missing.append(query)
+            else:
+                results[query] = value
+        record_event(tool, hit=not missing, hits=len(results), misses=len(missing))
+        if missing:
+            try:
+                fetched = fetch_many(missing)
+            except UpstreamUnavailableError as e:
+                results.update({query: self.serve_stale(make_key(tool, query, **params), tool, e) for query in missing})
+                return results
+            for query, value in fetched.items():
+                self.set(make_key(tool, query, **params), tool, value)
+                results[query] = value
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self._connect().execute("DELETE FROM entries")
+
+    def metrics(self) -> dict:
+        conn = self._connect()
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics["memory_entries"] = len(self._memory)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        metrics["entries"] = entries
+        metrics["bytes"] = total_bytes
+        return metrics
+
+def coalesced(key: str, fetch):
+    if not Config.SINGLEFLIGHT_ENABLED:
+        return fetch()
+    return get_singleflight().do(key, fetch)
+
+async def coalesced_async(key: str, fetch):
+    if not Config.SINGLEFLIGHT_ENABLED:
+        return await fetch()
+    return await get_singleflight().do_async(key, fetch)
+
+_tool_cache = None
+_tool_cache_lock = threading.Lock()
+
+def get_tool_cache() -> PersistentCache:
+    global _tool_cache
+    with _tool_cache_lock:
+        if _tool_cache is None:
+            _tool_cache = PersistentCache(
+                Config.TOOL_CACHE_PATH,
+                max_entries=Config.TOOL_CACHE_MAX_ENTRIES,
+                max_bytes=Config.TOOL_CACHE_MAX_BYTES,
+                memory_entries=Config.TOOL_CACHE_MEMORY_ENTRIES,
+                default_ttl=Config.TOOL_CACHE_DEFAULT_TTL,
+                ttls=Config.TOOL_CACHE_TTLS,
+                stale_seconds=Config.TOOL_CACHE_STALE_SECONDS,
+            )
+        return _tool_cache
+
+def cached_fetch(tool: str, query: str, fetch, **params):
+    if not Config.TOOL_CACHE_ENABLED:
+        return coalesced(make_key(tool, query, **params), fetch)
+    return get_tool_cache().get_or_fetch(tool, query, fetch, **params)
+
+def cached_fetch_many(tool: str, queries, fetch_many, **params) -> dict:
+    if not Config.TOOL_CACHE_ENABLED:
+        return fetch_many(list(queries))
+    return get_tool_cache().get_or_fetch_many(tool, queries, fetch_many, **params)
+
+async def cached_fetch_async(tool: str, query: str, fetch, **params):
+    # fetch is a coroutine function; SQLite lookups are short enough to run inline.
+    key = make_key(tool, query, **params)
+    if not Config.TOOL_CACHE_ENABLED:
+        return await coalesced_async(key, fetch)
+    cache = get_tool_cache()
+    value = cache.get(key, _MISSING)
+    record_event(tool, hit=value is not _MISSING)
+    if value is not _MISSING:
+        return value
+
+    async def fill():
+        value = cache.get(key, _MISSING, record_stats=False)
+        if value is not _MISSING:
+            get_singleflight().record_filled_while_waiting()
+            return value
+        try:
+            value = await fetch()
+        except UpstreamUnavailableError as e:
+            return cache.serve_stale(key, tool, e)
+        cache.set(key, tool, value)
+        return value
+
+    return await coalesced_async(key, fill)
+
+async def cached_fetch_many_async(tool: str, queries, fetch_many, **params) -> dict:
+    if not Config.TOOL_CACHE_ENABLED:
+        return await fetch_many(list(queries))
+    cache = get_tool_cache()
+    results = {}
+    missing = []
+    for query in queries:
+        value = cache.get(make_key(tool, query, **params), _MISSING)
+        if value is _MISSING:
+            missing.append(query)
+        else:
+            results[query] = value
+    record_event(tool, hit=not missing, hits=len(results), misses=len(missing))
+    if missing:
+        try:
+            fetched = await fetch_many(missing)
+        except UpstreamUnavailableError as e:
+            results.update({query: cache.serve_stale(make_key(tool, query, **params), tool, e) for query in missing})
+            return results
+        for query, value in fetched.items():
+            cache.set(make_key(tool, query, **params), tool, value)
+            results[query] = value
+    return results
@@ -0,0 +1,142 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from config import Config
+
+_tool_lists: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+def intern_tools(tools) -> Tuple[str, ...]:
+    # Most answers use one of a handful of tool combinations; every message with
+    # the same combination shares one tuple.
+    key = tuple(tools or ())
+    return _tool_lists.setdefault(key, tuple(sys.intern(tool) for tool in key))
+
+@dataclass
+class ChatMessage:
+    role: str
+    content: str
+    tools_used: Tuple[str, ...] = ()
+    # Raw tool outputs ("observations"), "trace" rows and "prompt_tokens_saved";
+    # empty values are not kept.
+    details: Optional[dict] = None
+
+    def __post_init__(self):
+        self.role = sys.intern(self.role)
+        self.tools_used = intern_tools(self.tools_used)
+        self.details = {key: value for key, value in (self.details or {}).items() if value} or None
+
+    def get(self, key: str, default=None):
+        return (self.details or {}).get(key, default)
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content, "tools_used": list(self.tools_used), "details": self.details}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatMessage":
+        return cls(data["role"], data["content"], data.get("tools_used"), data.get("details"))
+
+# Logs of sessions with a ChatHistory in this process; a session can sit idle
+# for longer than the TTL and still page back through its log.
+_live_paths: Set[str] = set()
+_live_lock = threading.Lock()
+
+def _release(path: str):
+    with _live_lock:
+        _live_paths.discard(path)
+
+def prune_logs(directory: str, max_age: float = Config.CHAT_LOG_TTL):
+    # Session logs are never reopened after the browser session ends.
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    with _live_lock:
+        live = set(_live_paths)
+    for entry in entries:
+        if not entry.name.endswith(".jsonl") or os.path.abspath(entry.path) in live:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+class ChatHistory:
+    # The last `window` messages of one browser session stay in memory; older
+    # ones are appended to a per-session JSON-lines log, with the byte offset of
+    # each line kept so any page can be read back without scanning the file.
+    def __init__(self, session_id: str, directory: str = Config.CHAT_LOG_DIR, window: int = Config.CHAT_HISTORY_LENGTH):
+        self.path = os.path.join(directory, f"{session_id}.jsonl")
+        self.window = window
+        self._recent = deque()
+        self._offsets = array("q")
+        self._log_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        prune_logs(directory)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        live_path = os.path.abspath(self.path)
+        with _live_lock:
+            _live_paths.add(live_path)
+        weakref.finalize(self, _release, live_path)
+
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._recent)
+
+    @property
+    def spilled(self) -> int:
+        return len(self._offsets)
+
+    def append(self, message: ChatMessage):
+        self._recent.append(message)
+        if len(self._recent) > self.window:
+            self._spill(self._recent.popleft())
+
+    def _spill(self, message: ChatMessage):
+        line = (json.dumps(message.to_dict()) + "\n").encode("utf-8")
+        with open(self.path, "ab") as handle:
+            handle.write(line)
+        self._offsets.append(self._log_bytes)
+        self._log_bytes += len(line)
+
+    def messages(self, start: int, stop: int) -> List[ChatMessage]:
+        # Messages [start, stop) in conversation order; spilled ones come from disk.
+        start, stop = max(0, start), min(len(self), stop)
+        spilled = len(self._offsets)
+        result = []
+        if start < min(stop, spilled):
+            try:
+                with open(self.path, "rb") as handle:
+                    handle.seek(self._offsets[start])
+                    for _ in range(min(stop, spilled) - start):
+                        result.append(ChatMessage.from_dict(json.loads(handle.readline())))
+            except FileNotFoundError:
+                # The log was removed from outside (another process pruning the
+                # directory): older messages are gone, what is in memory is not.
+                result = []
+                self._offsets = array("q")
+                self._log_bytes = 0
+                # Indices shift down by the lost messages; clamp to what is left.
+                start, stop = max(0, start - spilled), max(0, min(len(self), stop - spilled))
+                spilled = 0
+        result.extend(itertools.islice(self._recent, max(0, start - spilled), max(0, stop - spilled)))
+        return result
+
+    def latest(self, count: int) -> List[ChatMessage]:
+        return self.messages(len(self) - count, len(self))
+
+    def clear(self):
+        self._recent.clear()
+        self._offsets = array("q")
+        self._log_bytes = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
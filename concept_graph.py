@@ -0,0 +1,497 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import Config
+from singleflight import file_lock
+from transcripts import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:-[a-z]+)*")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+# "Photosynthesis is ...", "The mitochondria are ...": the subject is being defined.
+_DEFINITION_RE = re.compile(r"^(?:an?\s+|the\s+)?([a-z][a-z -]{2,60}?)\s+(?:is|are|refers to|means|describes)\b")
+# Words from URLs and site names that come with search snippets.
+_NOISE = frozenset("http https www com org edu html pdf wikipedia britannica quizlet youtube".split())
+_ARRAYS = ("indptr", "indices", "counts", "df", "defining", "seen")
+LOCK_NAME = "graph.lock"
+
+def _keep(token: str) -> bool:
+    return len(token) > 2 and token not in STOPWORDS and token not in _NOISE
+
+def terms(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if _keep(token)]
+
+def _sentence_key(sentence: str) -> int:
+    text = " ".join(_TOKEN_RE.findall(sentence.lower()))
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 1024), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray, nodes: np.ndarray):
+    # Every (node, neighbour, count) row of `nodes` in one vectorized slice of the CSR arrays.
+    nodes = nodes[nodes < len(indptr) - 1]
+    starts, stops = indptr[nodes], indptr[nodes + 1]
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if not total:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+    return np.repeat(nodes, lengths), indices[positions].astype(np.int64), counts[positions]
+
+def _csr(src: np.ndarray, dst: np.ndarray, counts: np.ndarray, nodes: int):
+    # Sums duplicate (src, dst) rows and returns the CSR arrays.
+    keys, inverse = np.unique(src.astype(np.int64) * nodes + dst, return_inverse=True)
+    summed = np.bincount(inverse, weights=counts).astype(np.float32)
+    indptr = np.zeros(nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // nodes, minlength=nodes), out=indptr[1:])
+    return indptr, (keys % nodes).astype(np.int32), summed
+
+@dataclass
+class Related:
+    concept: str
+    gloss: Optional[str]
+    score: float
+    linked: List[str] = field(default_factory=list)
+
+@dataclass
+class ConceptView:
+    # What the flashcard and concept map tools render: the query's concept, its
+    # strongest neighbours, and each neighbour's own strongest neighbours.
+    concept: str
+    gloss: Optional[str]
+    mentions: int
+    related: List[Related]
+
+class ConceptGraph:
+    # Concepts (content words and two-word phrases) from every sentence the tools
+    # have fetched, linked when they appear in the same sentence. Links are kept in
+    # both directions as CSR arrays (indptr, indices, counts) plus a small buffer of
+    # new rows; when the buffer reaches `compact_ratio` of the CSR arrays both are
+    # merged and the result is written as a new snapshot, so the cost of growing
+    # the graph is amortized. manifest.json names the current snapshot.
+    def __init__(
+        self,
+        directory: str = Config.CONCEPT_GRAPH_DIR,
+        compact_ratio: float = Config.CONCEPT_GRAPH_COMPACT_RATIO,
+        compact_min_edges: int = Config.CONCEPT_GRAPH_COMPACT_MIN_EDGES,
+        max_sentence_concepts: int = Config.CONCEPT_GRAPH_MAX_SENTENCE_CONCEPTS,
+    ):
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        self.compact_min_edges = compact_min_edges
+        self.max_sentence_concepts = max_sentence_concepts
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self.labels: List[str] = []
+        self.glosses: List[Optional[str]] = []
+        self._df = np.zeros(0, dtype=np.int32)
+        self._defining = np.zeros(0, dtype=bool)
+        self._seen = set()
+        self.sentences = 0
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.float32)
+        self._delta: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._delta_rows = 0
+        self._delta_csr = None
+        self._next_snapshot = 0
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.stats = {"sentences_added": 0, "duplicates": 0, "compactions": 0, "queries": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.directory, LOCK_NAME)
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+
+    def _load(self):
+        # Snapshots are written, listed and removed under the directory lock, so
+        # a process never loads a snapshot that another one is removing.
+        with file_lock(self.lock_path):
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            self._next_snapshot = manifest["next_snapshot"]
+            path = os.path.join(self.directory, manifest["snapshot"])
+            with open(os.path.join(path, "nodes.json"), "r", encoding="utf-8") as handle:
+                nodes = json.load(handle)
+            self.labels, self.glosses, self.sentences = nodes["labels"], nodes["glosses"], nodes["sentences"]
+            self._ids = {label: node for node, label in enumerate(self.labels)}
+            # The CSR arrays are only replaced, never written, so they stay memory-mapped.
+            self._indptr, self._indices, self._counts = (
+                np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ("indptr", "indices", "counts")
+            )
+            self._df = np.load(os.path.join(path, "df.npy"))
+            self._defining = np.load(os.path.join(path, "defining.npy"))
+            self._seen = set(np.load(os.path.join(path, "seen.npy")).tolist())
+            self._remove_stale(manifest["snapshot"])
+
+    def _remove_stale(self, current: str):
+        # Call with the directory lock held. Every snapshot is written under it,
+        # so anything but the current one is finished with (or a crash's leftover).
+        for name in os.listdir(self.directory):
+            if name not in (current, "manifest.json", LOCK_NAME):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _save(self):
+        # Processes sharing the directory each save their own graph; the latest
+        # snapshot is the one the next start-up loads.
+        with file_lock(self.lock_path):
+            manifest = self._read_manifest()
+            self._next_snapshot = max(self._next_snapshot, manifest["next_snapshot"] if manifest else 0) + 1
+            name = f"snapshot-{self._next_snapshot:06d}"
+            path = os.path.join(self.directory, name)
+            os.makedirs(path + ".tmp")
+            arrays = {
+                "indptr": self._indptr, "indices": self._indices, "counts": self._counts,
+                "df": self._df[:len(self.labels)], "defining": self._defining[:len(self.labels)],
+                "seen": np.fromiter(self._seen, dtype=np.int64, count=len(self._seen)),
+            }
+            for array_name in _ARRAYS:
+                np.save(os.path.join(path + ".tmp", f"{array_name}.npy"), arrays[array_name])
+            with open(os.path.join(path + ".tmp", "nodes.json"), "w", encoding="utf-8") as handle:
+                json.dump({"labels": self.labels, "glosses": self.glosses, "sentences": self.sentences}, handle)
+            os.rename(path + ".tmp", path)
+            with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as handle:
+                json.dump({"next_snapshot": self._next_snapshot, "snapshot": name}, handle)
+            os.replace(self.manifest_path + ".tmp", self.manifest_path)
+            self._remove_stale(name)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    @property
+    def node_count(self) -> int:
+        return len(self.labels)
+
+    @property
+    def edge_count(self) -> int:
+        # Distinct links; approximate while new rows are buffered (a link can be in both).
+        return (len(self._indices) + self._delta_rows) // 2
+
+    def _node_ids(self, labels) -> np.ndarray:
+        ids = np.empty(len(labels), dtype=np.int64)
+        for i, label in enumerate(labels):
+            node = self._ids.get(label)
+            if node is None:
+                node = self._ids[label] = len(self.labels)
+                self.labels.append(label)
+                self.glosses.append(None)
+            ids[i] = node
+        return ids
+
+    def add_texts(self, texts: List[str]) -> int:
+        # Returns the number of new sentences; ones seen before add nothing, so the
+        # same cached result can be passed in any number of times.
+        sentences = []
+        with self._lock:
+            for text in texts:
+                for sentence in _SENTENCE_RE.split(text or ""):
+                    sentence = " ".join(sentence.split())
+                    if len(sentence) < 20:
+                        continue
+                    key = _sentence_key(sentence)
+                    if key in self._seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    self._seen.add(key)
+                    sentences.append(sentence)
+            if sentences:
+                self._add_sentences(sentences)
+                self._maybe_compact()
+        return len(sentences)
+
+    def _add_sentences(self, sentences: List[str]):
+        # Tokens of the whole batch are handled as arrays: each distinct word is
+        # checked and looked up once, however often it occurs.
+        tokens = [_TOKEN_RE.findall(sentence.lower()) for sentence in sentences]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        sentence_of = np.repeat(np.arange(len(sentences)), lengths)
+        words, inverse = np.unique(np.array([token for row in tokens for token in row] or [""]), return_inverse=True)
+        inverse = inverse[:len(sentence_of)]
+        kept = np.fromiter(map(_keep, words.tolist()), dtype=bool, count=len(words))[inverse]
+
+        # Two kept words side by side in one sentence also form a phrase concept.
+        pair = kept[:-1] & kept[1:] & (sentence_of[:-1] == sentence_of[1:])
+        pair_codes, pair_inverse = np.unique(inverse[:-1][pair] * len(words) + inverse[1:][pair], return_inverse=True)
+        word_nodes = np.full(len(words), -1, dtype=np.int64)
+        used_words = np.unique(inverse[kept])
+        word_nodes[used_words] = self._node_ids(words[used_words].tolist())
+        phrase_nodes = self._node_ids([f"{words[code // len(words)]} {words[code % len(words)]}" for code in pair_codes.tolist()])
+
+        rows = np.concatenate([sentence_of[kept], sentence_of[:-1][pair]])
+        nodes = np.concatenate([word_nodes[inverse[kept]], phrase_nodes[pair_inverse]])
+        keys = np.unique(rows * len(self.labels) + nodes)
+        rows, nodes = keys // len(self.labels), keys % len(self.labels)
+        # Long sentences keep their first `max_sentence_concepts` concepts, which bounds the pairs per sentence.
+        starts = np.searchsorted(rows, rows, side="left")
+        capped = np.arange(len(rows)) - starts < self.max_sentence_concepts
+        rows, nodes = rows[capped], nodes[capped]
+
+        self._df = _grow(self._df, len(self.labels))
+        self._defining = _grow(self._defining, len(self.labels))
+        np.add.at(self._df, nodes, 1)
+        self.sentences += len(sentences)
+        self.stats["sentences_added"] += len(sentences)
+        self._set_glosses(sentences, rows, nodes)
+
+        # All pairs within each sentence, one vectorized block per sentence size.
+        sizes = np.bincount(rows, minlength=len(sentences))
+        offsets = np.cumsum(sizes) - sizes
+        src, dst = [], []
+        for size in np.unique(sizes[sizes > 1]).tolist():
+            members = nodes[offsets[sizes == size][:, None] + np.arange(size)]
+            left, right = np.triu_indices(size, 1)
+            src.extend([members[:, left].ravel(), members[:, right].ravel()])
+            dst.extend([members[:, right].ravel(), members[:, left].ravel()])
+        if src:
+            src, dst = np.concatenate(src), np.concatenate(dst)
+            keys, counts = np.unique(src * len(self.labels) + dst, return_counts=True)
+            self._delta.append((keys // len(self.labels), keys % len(self.labels), counts.astype(np.float32)))
+            self._delta_rows += len(keys)
+            self._delta_csr = None
+        self._dirty = True
+
+    def _set_glosses(self, sentences: List[str], rows: np.ndarray, nodes: np.ndarray):
+        # A concept's gloss is the first sentence it appeared in, replaced by the
+        # first one that defines it ("X is ...") when that comes along.
+        limit = Config.CONCEPT_GRAPH_GLOSS_CHARS
+        firsts, first_rows = np.unique(nodes, return_index=True)
+        for node, row in zip(firsts.tolist(), rows[first_rows].tolist()):
+            if self.glosses[node] is None:
+                self.glosses[node] = sentences[row][:limit]
+        for sentence in sentences:
+            match = _DEFINITION_RE.match(sentence.lower())
+            if not match:
+                continue
+            node = self._ids.get(" ".join(terms(match.group(1))))
+            if node is not None and not self._defining[node]:
+                self.glosses[node] = sentence[:limit]
+                self._defining[node] = True
+
+    def _maybe_compact(self):
+        # Compaction also saves a snapshot; a quiet graph reaches the row threshold
+        # rarely, so it is saved at least every CONCEPT_GRAPH_SAVE_SECONDS as well,
+        # which bounds what a crash loses.
+        if (self._delta_rows >= max(self.compact_min_edges, self.compact_ratio * len(self._indices))
+                or time.monotonic() - self._saved_at >= Config.CONCEPT_GRAPH_SAVE_SECONDS):
+            self.compact()
+
+    def compact(self):
+        # Callers hold the lock.
+        if self._delta:
+            src, dst, counts = self._buffered()
+            base_src = np.repeat(np.arange(len(self._indptr) - 1), np.diff(self._indptr))
+            self._indptr, self._indices, self._counts = _csr(
+                np.concatenate([base_src, src]),
+                np.concatenate([self._indices, dst]),
+                np.concatenate([self._counts, counts]),
+                len(self.labels),
+            )
+            self._delta, self._delta_rows, self._delta_csr = [], 0, None
+            self.stats["compactions"] += 1
+        if self._dirty:
+            self._save()
+
+    def _buffered(self):
+        return tuple(np.concatenate(column) for column in zip(*self._delta))
+
+    def _edges(self, nodes: np.ndarray):
+        # (node, neighbour, count) for every link of `nodes`, from the CSR arrays
+        # and the buffer (itself indexed as a small CSR, rebuilt after each add).
+        src, dst, counts = _gather(self._indptr, self._indices, self._counts, nodes)
+        if not self._delta:
+            return src, dst, counts
+        if self._delta_csr is None:
+            self._delta_csr = _csr(*self._buffered(), len(self.labels))
+        more = _gather(*self._delta_csr, nodes)
+        src, dst, counts = (np.concatenate(pair) for pair in zip((src, dst, counts), more))
+        keys, inverse = np.unique(src * len(self.labels) + dst, return_inverse=True)
+        return keys // len(self.labels), keys % len(self.labels), np.bincount(inverse, weights=counts)
+
+    def _association(self, src: np.ndarray, dst: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # Normalized PMI of the two concepts over sentences, weighted by log(1 +
+        # co-occurrences) so a pair seen together once ranks below a recurring one.
+        n = max(self.sentences, 1)
+        joint = counts / n
+        pmi = np.log(joint / ((self._df[src] / n) * (self._df[dst] / n)))
+        npmi = pmi / np.maximum(-np.log(joint), 1e-9)
+        return np.maximum(npmi, 0.0) * np.log1p(counts)
+
+    def k_hop(self, seeds, hops: int = 2, fanout: Optional[int] = None, exclude=()) -> Dict[str, np.ndarray]:
+        # Concepts within `hops` links of `seeds`. At each hop every frontier concept
+        # passes on its `fanout` strongest new links (all when None); a reached
+        # concept's score sums the links it was reached by, and its parent is the
+        # strongest of them. Returns parallel arrays sorted by hop, then score.
+        with self._lock:
+            self.stats["queries"] += 1
+            seeds = np.asarray(seeds, dtype=np.int64)
+            visited = np.zeros(len(self.labels), dtype=bool)
+            visited[seeds] = True
+            visited[np.asarray(exclude, dtype=np.int64)] = True
+            frontier = seeds
+            found = {"nodes": [], "hops": [], "parents": [], "scores": []}
+            for hop in range(1, hops + 1):
+                if not len(frontier):
+                    break
+                src, dst, counts = self._edges(frontier)
+                scores = self._association(src, dst, counts)
+                keep = ~visited[dst] & (scores > 0)
+                src, dst, scores = src[keep], dst[keep], scores[keep]
+                if fanout is not None and len(src):
+                    order = np.lexsort((-scores, src))
+                    src, dst, scores = src[order], dst[order], scores[order]
+                    rank = np.arange(len(src)) - np.searchsorted(src, src, side="left")
+                    src, dst, scores = src[rank < fanout], dst[rank < fanout], scores[rank < fanout]
+                nodes, inverse = np.unique(dst, return_inverse=True)
+                totals = np.bincount(inverse, weights=scores, minlength=len(nodes))
+                order = np.lexsort((-scores, dst))
+                parents = src[order][np.searchsorted(dst[order], nodes)]
+                ranked = np.argsort(-totals, kind="stable")
+                found["nodes"].append(nodes[ranked])
+                found["hops"].append(np.full(len(nodes), hop))
+                found["parents"].append(parents[ranked])
+                found["scores"].append(totals[ranked])
+                visited[nodes] = True
+                frontier = nodes
+        return {key: np.concatenate(values) if values else np.zeros(0) for key, values in found.items()}
+
+    def seeds(self, query: str) -> Tuple[List[int], bool]:
+        # The query's concepts, preferring two-word phrases, and whether every
+        # content word of the query is a known concept.
+        words = terms(query)
+        seeds, covered, i = [], bool(words), 0
+        with self._lock:
+            while i < len(words):
+                phrase = self._ids.get(" ".join(words[i:i + 2])) if i + 1 < len(words) else None
+                if phrase is not None:
+                    seeds.append(phrase)
+                    i += 2
+                    continue
+                node = self._ids.get(words[i])
+                if node is None:
+                    covered = False
+                else:
+                    seeds.append(node)
+                i += 1
+        return seeds, covered
+
+    def _distinct(self, nodes: List[int], scores: List[float], limit: int, skip_words: set) -> List[Tuple[int, float]]:
+        # Up to `limit` concepts by score, leaving out a word when a phrase with it
+        # scores at least as high, and anything within `skip_words` or an earlier pick.
+        phrase_scores = {}
+        for node, score in zip(nodes, scores):
+            words = self.labels[node].split()
+            if len(words) > 1:
+                for word in words:
+                    phrase_scores[word] = max(phrase_scores.get(word, 0.0), score)
+        picked, picked_words = [], []
+        for node, score in zip(nodes, scores):
+            label = self.labels[node]
+            words = set(label.split())
+            if words <= skip_words or any(words <= other for other in picked_words) or phrase_scores.get(label, -1.0) >= score:
+                continue
+            picked.append((node, score))
+            picked_words.append(words)
+            if len(picked) == limit:
+                break
+        return picked
+
+    def view(self, query: str, branches: int = Config.CONCEPT_GRAPH_BRANCHES, fanout: int = Config.CONCEPT_GRAPH_FANOUT) -> Optional[ConceptView]:
+        seeds, covered = self.seeds(query)
+        if not seeds or not covered:
+            return None
+        query_words = set(terms(query))
+        reached = self.k_hop(seeds, hops=1)
+        picked = self._distinct(reached["nodes"].tolist(), reached["scores"].tolist(), branches, query_words)
+        # A few spare links per branch, since _distinct may pass some over.
+        linked = self.k_hop([node for node, _ in picked], hops=1, fanout=4 * fanout, exclude=seeds)
+        related = []
+        for node, score in picked:
+            mine = linked["parents"] == node
+            children = self._distinct(linked["nodes"][mine].tolist(), linked["scores"][mine].tolist(), fanout, query_words | set(self.labels[node].split()))
+            related.append(Related(self.labels[node], self.glosses[node], score, [self.labels[child] for child, _ in children]))
+        with self._lock:
+            mentions = int(self._df[seeds].max())
+            gloss = next((self.glosses[seed] for seed in seeds if self._defining[seed]), self.glosses[seeds[0]])
+        return ConceptView(" ".join(self.labels[seed] for seed in seeds), gloss, mentions, related)
+
+    def flush(self):
+        with self._lock:
+            self.compact()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics.update(concepts=self.node_count, links=self.edge_count, sentences=self.sentences, buffered_rows=self._delta_rows)
+        return metrics
+
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_concept_graph() -> ConceptGraph:
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = ConceptGraph(Config.CONCEPT_GRAPH_DIR)
+            # Links still in the buffer are written out with the final snapshot.
+            atexit.register(_flush_on_exit, _graph)
+        return _graph
+
+def _flush_on_exit(graph: ConceptGraph):
+    try:
+        graph.flush()
+    except Exception:
+        logger.exception("Concept graph snapshot failed")
+
+def learn_concepts(texts: List[str]) -> int:
+    if not Config.CONCEPT_GRAPH_ENABLED:
+        return 0
+    try:
+        return get_concept_graph().add_texts(texts)
+    except Exception:
+        logger.exception("Concept graph update failed")
+        return 0
+
+def concept_view(query: str) -> Optional[ConceptView]:
+    if not Config.CONCEPT_GRAPH_ENABLED:
+        return None
+    try:
+        return get_concept_graph().view(query)
+    except Exception:
+        logger.exception("Concept graph query failed")
+        return None
+
+def has_graph_coverage(view: Optional[ConceptView]) -> bool:
+    # Seen often enough, with enough related concepts, to skip SerpAPI.
+    return (
+        view is not None
+        and view.mentions >= Config.CONCEPT_GRAPH_MIN_MENTIONS
+        and len(view.related) >= Config.CONCEPT_GRAPH_MIN_RELATED
+    )
@@ -1,8 +1,121 @@
 class Config:
-    VECTOR_STORE_PATH = "vector_store.pkl"
+    VECTOR_STORE_PATH = "vector_store.npy"
     EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
     LLM_MODEL = "gemini-1.5-flash"
     MAX_OUTPUT_TOKENS = 1024
     TEMPERATURE = 0.7
     MAX_ITERATIONS = 5
-    CHAT_HISTORY_LENGTH = 20
\ No newline at end of file
+    AGENT_VERBOSE = True
+    CHAT_HISTORY_LENGTH = 20
+    CHAT_PAGE_SIZE = 10
+    CHAT_LOG_DIR = "chat_logs"
+    CHAT_LOG_TTL = 24 * 3600
+    MAX_SESSIONS = 500
+    SERPAPI_CONNECT_TIMEOUT = 3.05
+    SERPAPI_READ_TIMEOUT = 15
+    SERPAPI_MAX_RETRIES = 3
+    SERPAPI_BACKOFF_SECONDS = 0.5
+    SERPAPI_BACKOFF_MAX_SECONDS = 8
+    SERPAPI_POOL_SIZE = 10
+    TOOL_CACHE_ENABLED = True
+    TOOL_CACHE_PATH = "tool_cache.sqlite3"
+    TOOL_CACHE_MAX_ENTRIES = 5000
+    TOOL_CACHE_MAX_BYTES = 50 * 1024 * 1024
+    TOOL_CACHE_MEMORY_ENTRIES = 256
+    TOOL_CACHE_DEFAULT_TTL = 24 * 3600
+    TOOL_CACHE_TTLS = {
+        "Wikipedia Tool": 7 * 24 * 3600,
+        "Google Search Tool": 6 * 3600,
+        "YouTube Transcript": 30 * 24 * 3600,
+        "Scholarly Papers Tool": 3 * 24 * 3600,
+        "Subject Expert Tool": 24 * 3600,
+    }
+    WIKIPEDIA_TIMEOUT = 10
+    WIKIPEDIA_POOL_SIZE = 10
+    WIKIPEDIA_BATCH_SIZE = 20
+    ASYNC_HTTP_POOL_SIZE = 20
+    RESEARCH_BUNDLE_TOOLS = ["Wikipedia Tool", "Google Search Tool", "Scholarly Papers Tool"]
+    RESEARCH_BUNDLE_TOOL_TIMEOUT = 8
+    VECTOR_STORE_ENABLED = True
+    VECTOR_STORE_INITIAL_CAPACITY = 1024
+    VECTOR_CHUNK_CHARS = 800
+    VECTOR_SEARCH_TOP_K = 3
+    VECTOR_MIN_SCORE = 0.45
+    PAPER_INDEX_ENABLED = True
+    PAPER_INDEX_DIR = "paper_index"
+    PAPER_INDEX_TOP_K = 5
+    # SerpAPI is skipped when this many local papers contain this share of the query's terms.
+    PAPER_INDEX_MIN_HITS = 3
+    PAPER_INDEX_MIN_COVERAGE = 0.6
+    PAPER_INDEX_MERGE_FACTOR = 8
+    PAPER_INDEX_MAX_SEGMENT_PAPERS = 1_000_000
+    # Unlisted segment directories are only deleted once untouched this long.
+    PAPER_INDEX_ORPHAN_SECONDS = 3600
+    CONCEPT_GRAPH_ENABLED = True
+    CONCEPT_GRAPH_DIR = "concept_graph"
+    # New edges are merged into the CSR arrays once they reach this share of them (and at least the minimum).
+    CONCEPT_GRAPH_COMPACT_RATIO = 0.25
+    CONCEPT_GRAPH_COMPACT_MIN_EDGES = 20_000
+    CONCEPT_GRAPH_SAVE_SECONDS = 300
+    CONCEPT_GRAPH_MAX_SENTENCE_CONCEPTS = 32
+    CONCEPT_GRAPH_GLOSS_CHARS = 240
+    CONCEPT_GRAPH_BRANCHES = 5
+    CONCEPT_GRAPH_FANOUT = 3
+    # Flashcards and concept maps skip SerpAPI once the topic has appeared in this
+    # many sentences and has this many related concepts.
+    CONCEPT_GRAPH_MIN_MENTIONS = 3
+    CONCEPT_GRAPH_MIN_RELATED = 5
+    EMBEDDING_BACKEND = "sentence-transformers"
+    EMBEDDING_BATCH_SIZE = 32
+    SEMANTIC_CACHE_ENABLED = True
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+    SEMANTIC_CACHE_TTL = 24 * 3600
+    SEMANTIC_CACHE_MAX_ENTRIES = 2000
+    SEMANTIC_CACHE_MIN_QUERY_WORDS = 3
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_PATH = "llm_cache.sqlite3"
+    LLM_CACHE_MAX_ENTRIES = 5000
+    LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024
+    LLM_CACHE_MEMORY_ENTRIES = 256
+    LLM_CACHE_TTL = 7 * 24 * 3600
+    # Replies sampled at TEMPERATURE > 0 are only cached when this is on.
+    LLM_CACHE_NONZERO_TEMPERATURE = False
+    MEMORY_TOKEN_BUDGET = 1500
+    MEMORY_SUMMARY_TOKEN_LIMIT = 300
+    MEMORY_PROMPT_SIZE_HISTORY = 100
+    MEMORY_SUMMARY_TIMEOUT = 20
+    TRACE_LOG_PATH = "traces.jsonl"
+    TRACE_LOG_MAX_BYTES = 10 * 1024 * 1024
+    TRACE_LOG_BACKUPS = 3
+    # Exported traces leave out the query and tool inputs unless this is on.
+    TRACE_INCLUDE_TEXT = False
+    TRACE_HISTOGRAM_SAMPLES = 1000
+    BATCH_WORKERS = 4
+    BATCH_RATE_LIMIT = 2.0
+    ROUTER_ENABLED = True
+    ROUTER_CONFIDENCE_THRESHOLD = 0.85
+    ROUTER_CLASSIFIER_ENABLED = False
+    ROUTER_CLASSIFIER_THRESHOLD = 0.6
+    SINGLEFLIGHT_ENABLED = True
+    SINGLEFLIGHT_LOCK_DIR = None
+    SINGLEFLIGHT_WAIT_TIMEOUT = 60
+    UPSTREAM_DEFAULTS = {"rate": 5, "burst": 10, "max_wait": 10, "failure_threshold": 5, "reset_timeout": 30}
+    UPSTREAM_LIMITS = {
+        "SerpAPI": {"rate": 2, "burst": 5, "quota": None, "quota_period": 30 * 24 * 3600},
+        "Wikipedia": {"rate": 20, "burst": 40},
+        "YouTube": {"rate": 2, "burst": 5},
+        "Gemini": {"rate": 1, "burst": 10, "max_wait": 30, "quota": None, "quota_period": 24 * 3600},
+    }
+    TOOL_CACHE_STALE_SECONDS = 7 * 24 * 3600
+    TRANSCRIPT_WINDOW_SECONDS = 45
+    TRANSCRIPT_SUMMARY_PASSAGES = 8
+    TRANSCRIPT_PASSAGE_WORDS = 60
+    TRANSCRIPT_HASH_FEATURES = 2 ** 16
+    OBSERVATION_COMPRESSION_ENABLED = True
+    OBSERVATION_TOKEN_BUDGET = 400
+    OBSERVATION_RUN_TOKEN_BUDGET = 1200
+    OBSERVATION_MIN_TOKENS = 80
+    REQUEST_DEADLINE_SECONDS = 60
+    DEADLINE_FINAL_ANSWER_SECONDS = 8
+    DEADLINE_BLOCKING_WORKERS = 8
+    YOUTUBE_TIMEOUT = 20
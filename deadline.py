@@ -0,0 +1,82 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, Optional
+from config import Config
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+class Deadline:
+    # One time budget for a whole request. Every call made on its behalf asks for
+    # timeout(default) and gets whichever is shorter; cancel() makes every later
+    # check() fail, so work abandoned by the caller stops at its next checkpoint.
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self.expires_at = clock() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self.cancelled:
+            raise DeadlineExceeded("Request was cancelled")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded")
+
+    def timeout(self, default: Optional[float] = None) -> float:
+        self.check()
+        remaining = self.remaining()
+        return remaining if default is None else min(default, remaining)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def remaining_timeout(default: Optional[float] = None) -> Optional[float]:
+    # `default` outside a request; raises DeadlineExceeded once the budget is spent.
+    deadline = _current.get()
+    return default if deadline is None else deadline.timeout(default)
+
+def check_deadline():
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+# For blocking calls that take no timeout of their own (youtube_transcript_api).
+# The caller stops waiting at the deadline; the call itself finishes in the
+# background, and the small pool caps how many of those can pile up.
+_blocking_pool = ThreadPoolExecutor(max_workers=Config.DEADLINE_BLOCKING_WORKERS, thread_name_prefix="deadline")
+
+def call_with_deadline(fn: Callable, *args, default_timeout: Optional[float] = None):
+    timeout = remaining_timeout(default_timeout)
+    if timeout is None:
+        return fn(*args)
+    context = contextvars.copy_context()
+    future = _blocking_pool.submit(context.run, fn, *args)
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise DeadlineExceeded(f"{getattr(fn, '__name__', 'call')} did not finish within {timeout:.1f}s")
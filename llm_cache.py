@@ -0,0 +1,145 @@
+import ast
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+from cache import PersistentCache
+from config import Config
+from tracing import record_event
+
+_MISSING = object()
+CACHE_NAME = "LLM cache"
+
+def cache_allowed(temperature: Optional[float]) -> bool:
+    # A sampled reply is one draw out of many; replaying it would pin every later
+    # answer to that draw, so only deterministic calls are cached by default.
+    return Config.LLM_CACHE_ENABLED and (not temperature or Config.LLM_CACHE_NONZERO_TEMPERATURE)
+
+def _key(model: str, prompt: str) -> str:
+    return hashlib.sha256(json.dumps([model, prompt]).encode("utf-8")).hexdigest()
+
+# Constructor arguments that change the reply. The rest of the serialized model
+# includes the `cache` field, whose repr carries a memory address and would give
+# every process its own keys.
+_MODEL_FIELDS = ("model", "model_name", "temperature", "top_p", "top_k", "max_output_tokens", "max_tokens", "n")
+
+def _model_key(serialized: dict, stop) -> str:
+    kwargs = serialized.get("kwargs") or {}
+    fields = {name: kwargs[name] for name in _MODEL_FIELDS if name in kwargs}
+    return json.dumps([serialized.get("id"), fields, stop], sort_keys=True, default=str)
+
+def _model_from_llm_string(llm_string: str) -> str:
+    # LangChain builds llm_string as the serialized model + "---" + the call's
+    # kwargs. Of the kwargs only `stop` changes the reply (the agent adds
+    # stream=True, a plain call does not).
+    head, separator, params = llm_string.partition("---")
+    if not separator:
+        return llm_string
+    try:
+        serialized = json.loads(head)
+        stop = dict(ast.literal_eval(params)).get("stop")
+    except (ValueError, SyntaxError, TypeError):
+        return llm_string
+    return _model_key(serialized, stop)
+
+def _model_from_callback(serialized: dict, invocation_params: dict, options: dict) -> str:
+    # The same string as _model_from_llm_string, from what on_chat_model_start sees.
+    if serialized.get("type") == "constructor":
+        return _model_key(serialized, (options or {}).get("stop"))
+    return str(sorted((invocation_params or {}).items()))
+
+class LLMResponseCache(BaseCache):
+    # Exact-match cache for chat model calls: the key is the model's parameters
+    # plus the full message list, so only byte-identical prompts share a reply.
+    # Only the reply text is kept, not provider metadata such as token counts.
+    # Stored in its own PersistentCache file (memory LRU over SQLite, TTL, size
+    # limits). Each entry keeps how long the original call took, which is what a
+    # hit saves.
+    def __init__(self, store: PersistentCache):
+        self.store = store
+        self.latency_saved = 0.0
+        self._misses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = _key(_model_from_llm_string(llm_string), prompt)
+        entry = self.store.get(key, _MISSING)
+        record_event(CACHE_NAME, hit=entry is not _MISSING)
+        if entry is _MISSING:
+            # The reply arrives in update(); until then the key's start time is kept
+            # so the entry can record what the call cost.
+            with self._lock:
+                self._misses[key] = time.perf_counter()
+                while len(self._misses) > Config.LLM_CACHE_MEMORY_ENTRIES:
+                    self._misses.popitem(last=False)
+            return None
+        with self._lock:
+            self.latency_saved += entry["seconds"]
+        return [ChatGeneration(message=AIMessage(content=text)) for text in entry["texts"]]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+        key = _key(_model_from_llm_string(llm_string), prompt)
+        with self._lock:
+            started = self._misses.pop(key, None)
+        if not any(generation.text.strip() for generation in return_val):
+            return
+        entry = {
+            "texts": [generation.text for generation in return_val],
+            "seconds": time.perf_counter() - started if started is not None else 0.0,
+        }
+        self.store.set(key, CACHE_NAME, entry)
+
+    def will_hit(self, serialized: dict, messages, invocation_params: dict, options: dict) -> bool:
+        # Asked by callbacks that run before LangChain consults the cache (e.g. the
+        # upstream guard, so a reply served from here costs no rate limit or quota).
+        if len(messages) != 1 or not cache_allowed((invocation_params or {}).get("temperature")):
+            return False
+        key = _key(_model_from_callback(serialized, invocation_params, options), dumps(messages[0]))
+        return self.store.get(key, _MISSING, record_stats=False) is not _MISSING
+
+    def clear(self, **kwargs):
+        self.store.clear()
+        with self._lock:
+            self._misses.clear()
+            self.latency_saved = 0.0
+
+    def metrics(self) -> dict:
+        metrics = self.store.metrics()
+        with self._lock:
+            metrics["latency_saved_seconds"] = self.latency_saved
+        return metrics
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(PersistentCache(
+                Config.LLM_CACHE_PATH,
+                max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+                max_bytes=Config.LLM_CACHE_MAX_BYTES,
+                memory_entries=Config.LLM_CACHE_MEMORY_ENTRIES,
+                default_ttl=Config.LLM_CACHE_TTL,
+            ))
+        return _llm_cache
+
+def cache_for(temperature: Optional[float]):
+    # What to pass as a chat model's `cache`: False turns LangChain's caching off
+    # for that model instead of falling back to a global cache.
+    return get_llm_cache() if cache_allowed(temperature) else False
+
+def will_hit(serialized: dict, messages, invocation_params: dict, options: dict) -> bool:
+    # False until a model has been built with the cache.
+    return _llm_cache is not None and _llm_cache.will_hit(serialized, messages, invocation_params, options)
+
+def llm_cache_metrics() -> Optional[dict]:
+    # None until the first model has been built with the cache.
+    return _llm_cache.metrics() if _llm_cache is not None else None
@@ -1,14 +1,66 @@
 import streamlit as st
+import sys
 import time
-from agent import run_agent
+import uuid
+from chat_history import ChatHistory, ChatMessage
+from config import Config
 from dotenv import load_dotenv
-from tools import get_tool_names
+from ratelimit import upstream_metrics
+from router import router_metrics
+from singleflight import singleflight_metrics
+from tool_registry import get_tool_names
+from tracing import get_histograms
+
+def _append_message(message: ChatMessage):
+    st.session_state.chat_history.append(message)
+
+def _load_earlier():
+    st.session_state.history_pages += 1
+
+def _render_history():
+    # Only the last `history_pages` pages are rendered on a rerun; older messages
+    # stay in the session's log on disk until "Load earlier" asks for them.
+    history = st.session_state.chat_history
+    shown = st.session_state.history_pages * Config.CHAT_PAGE_SIZE
+    if len(history) > shown:
+        st.button(f"⬆️ Load earlier messages ({len(history) - shown} more)", on_click=_load_earlier)
+    for message in history.latest(shown):
+        with st.chat_message(message.role):
+            st.write(message.content)
+            _render_tools(message)
+            if message.get("trace"):
+                _render_trace(message.get("trace"))
+
+def _render_trace(trace: list):
+    # One row per LLM call, tool call and cache lookup, in the order they started.
+    with st.expander("⏱️ Request Trace"):
+        st.dataframe(trace, use_container_width=True, hide_index=True)
+
+def _render_tools(message: ChatMessage):
+    # The agent saw compressed tool outputs; the raw ones are shown here.
+    observations = message.get("observations") or []
+    if not (message.tools_used or observations):
+        return
+    with st.expander("🧰 Tools Used"):
+        if observations:
+            for observation in observations:
+                st.info(f"**{observation['tool']}**: {observation['input']}")
+                st.markdown(observation["output"])
+        else:
+            for tool in message.tools_used:
+                st.info(f"**{tool}**")
+        if message.get("prompt_tokens_saved"):
+            st.caption(f"✂️ Trimming tool output saved about {message.get('prompt_tokens_saved')} prompt tokens")
 
 def main():
     load_dotenv()
     
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory(st.session_state.session_id)
+        st.session_state.history_pages = 1
     
     st.set_page_config(
         page_title="AI Assistant at Your Service",
@@ -27,16 +79,68 @@ def main():
             for tool in tools:
                 st.markdown(f"- **{tool}**")
     
+    with st.sidebar:
+        st.subheader("🗂️ My Notes")
+        note = st.text_area("Paste notes to add to your local knowledge base")
+        if st.button("Save notes") and note.strip():
+            from vector_store import remember
+            remember(note, source="Your notes")
+            st.success("Notes saved. The assistant will search them before going online.")
+        
+        latency = get_histograms().summary()
+        if latency:
+            with st.expander("📈 Latency (p50 / p95 / p99)"):
+                st.dataframe(
+                    [{"span": name, **stats} for name, stats in latency.items()],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+        
+        routing = router_metrics()
+        if routing and routing["queries"]:
+            st.caption(
+                f"⚡ Fast path answered {routing['hit_rate']:.0%} of questions, "
+                f"saving about {routing['latency_saved_seconds']:.0f}s"
+            )
+        
+        # llm_cache pulls in LangChain; until the agent has loaded it there is nothing to report.
+        llm_cache = sys.modules.get("llm_cache")
+        responses = llm_cache.llm_cache_metrics() if llm_cache else None
+        if responses and responses["hits"]:
+            st.caption(
+                f"♻️ {responses['hits']} model replies reused ({responses['hit_rate']:.0%} hit rate), "
+                f"saving about {responses['latency_saved_seconds']:.0f}s"
+            )
+        
+        coalescing = singleflight_metrics()
+        if coalescing and coalescing["upstream_calls_saved"]:
+            st.caption(f"🔗 {coalescing['upstream_calls_saved']} duplicate API calls shared with other sessions")
+        
+        upstreams = upstream_metrics()
+        if upstreams:
+            degraded = any(stats["circuit"]["state"] != "closed" for stats in upstreams.values())
+            with st.expander("🚦 Upstream APIs", expanded=degraded):
+                st.dataframe(
+                    [
+                        {
+                            "api": name,
+                            "circuit": stats["circuit"]["state"],
+                            "requests": stats["requests"],
+                            "failures": stats["failures"],
+                            "throttled": stats["throttled"],
+                            "rejected": stats["rejected_rate"] + stats["rejected_quota"] + stats["circuit"]["rejected"],
+                            "quota left": stats["quota_remaining"],
+                        }
+                        for name, stats in upstreams.items()
+                    ],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+    
     chat_container = st.container()
     
     with chat_container:
-        for message in st.session_state.chat_history:
-            with st.chat_message(message["role"]):
-                st.write(message["content"])
-                if "tools_used" in message and message["tools_used"]:
-                    with st.expander("🧰 Tools Used"):
-                        for tool in message["tools_used"]:
-                            st.info(f"**{tool}**")
+        _render_history()
     
     query = st.chat_input("Ask me anything...")
     
@@ -48,30 +152,50 @@ def main():
             with st.chat_message("assistant"):
                 st.write("👋 Goodbye! Feel free to return whenever you need assistance.")
                 
-            st.session_state.chat_history.append({"role": "user", "content": query})
-            st.session_state.chat_history.append({"role": "assistant", "content": "👋 Goodbye! Feel free to return whenever you need assistance."})
+            _append_message(ChatMessage("user", query))
+            _append_message(ChatMessage("assistant", "👋 Goodbye! Feel free to return whenever you need assistance."))
         else:
             with st.chat_message("user"):
                 st.write(query)
             
-            st.session_state.chat_history.append({"role": "user", "content": query})
+            _append_message(ChatMessage("user", query))
             
             with st.chat_message("assistant"):
+                # The agent (LangChain, Gemini client, tools) is only imported once a
+                # question is asked, which keeps the first page render fast.
+                from agent import stream_agent
+                status = st.status("🧠 Thinking...", expanded=False)
                 response_placeholder = st.empty()
-                response_placeholder.write("🧠 Thinking...")
+                streamed_text = ""
+                response, tools_used, trace = "", [], []
+                observations, tokens_saved = [], 0
+                
+                for event in stream_agent(query, session_id=st.session_state.session_id):
+                    if event.type == "tool_start":
+                        status.update(label=f"🔧 Using {event.tool}...")
+                    elif event.type == "tool_end":
+                        status.write(f"✅ {event.tool} finished in {event.latency:.1f}s")
+                    elif event.type == "token":
+                        streamed_text += event.text
+                        response_placeholder.markdown(streamed_text + "▌")
+                    elif event.type == "final":
+                        response, tools_used, trace = event.text, event.tools_used, event.trace
+                        observations, tokens_saved = event.observations, event.prompt_tokens_saved
                 
-                with st.spinner("Processing your request..."):
-                    response, tools_used = run_agent(query)
-                    
-                response_placeholder.empty()
-                st.write(response)
+                status.update(label=f"Answered in {event.elapsed:.1f}s", state="complete")
+                response_placeholder.markdown(response)
                 
-                if tools_used:
-                    with st.expander("🧰 Tools Used"):
-                        for tool in tools_used:
-                            st.info(f"**{tool}**")
+                message = ChatMessage(
+                    "assistant",
+                    response,
+                    tools_used,
+                    {"trace": trace, "observations": observations, "prompt_tokens_saved": tokens_saved},
+                )
+                _render_tools(message)
+                if trace:
+                    _render_trace(trace)
             
-            st.session_state.chat_history.append({"role": "assistant", "content": response, "tools_used": tools_used})
+            _append_message(message)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import logging
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+from langchain.chains import LLMChain
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, get_buffer_string
+from langchain_core.pydantic_v1 import PrivateAttr
+from config import Config
+from deadline import Deadline, call_with_deadline, deadline_scope
+from ratelimit import get_upstream
+from text_utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+def _message_tokens(messages: List[BaseMessage]) -> int:
+    # A few tokens of per-message overhead for the role markers.
+    return sum(estimate_tokens(message.content) + 4 for message in messages)
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    sentence = re.split(r"(?<=[.!?])\s+", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "..."
+
+class WindowedSummaryMemory(BaseChatMemory):
+    # Keeps the last `window_turns` exchanges verbatim, folds older ones into a
+    # running summary on a background thread, and never injects more than
+    # `token_budget` tokens of history into the prompt.
+    llm: Optional[BaseLanguageModel] = None
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    window_turns: int = Config.CHAT_HISTORY_LENGTH // 2
+    token_budget: int = Config.MEMORY_TOKEN_BUDGET
+    summary_token_limit: int = Config.MEMORY_SUMMARY_TOKEN_LIMIT
+    input_prefix: str = ""
+    summary: str = ""
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _folding: bool = PrivateAttr(default=False)
+    _prompt_sizes: Any = PrivateAttr(default_factory=lambda: deque(maxlen=Config.MEMORY_PROMPT_SIZE_HISTORY))
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def prompt_sizes(self) -> List[int]:
+        return list(self._prompt_sizes)
+
+    @property
+    def has_history(self) -> bool:
+        with self._lock:
+            return bool(self.summary or self.chat_memory.messages)
+
+    def _summary_messages(self, summary: str) -> List[BaseMessage]:
+        # Gemini only accepts a system message first, so the summary goes in as an
+        # exchange of its own ahead of the verbatim turns.
+        if not summary:
+            return []
+        return [
+            HumanMessage(content=f"Summary of our earlier conversation: {summary}"),
+            AIMessage(content="Noted, I'll keep that in mind."),
+        ]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            summary = self._summary_messages(self.summary)
+            recent = list(self.chat_memory.messages)
+
+        budget = self.token_budget - _message_tokens(summary)
+        if budget < 0:
+            # The summary alone is over budget: keep its head, drop verbatim turns.
+            words = self.summary.split()
+            keep = max(1, int(len(words) * self.token_budget / max(_message_tokens(summary), 1)))
+            summary = self._summary_messages(" ".join(words[:keep]))
+            recent, budget = [], 0
+
+        # Drop the oldest verbatim turns until the rest fits the budget. Turns go
+        # whole, so the history always starts with the student's message.
+        turns = [recent[start:start + 2] for start in range(len(recent) % 2, len(recent), 2)]
+        kept, used = [], 0
+        for turn in reversed(turns):
+            tokens = _message_tokens(turn)
+            if used + tokens > budget:
+                break
+            kept = turn + kept
+            used += tokens
+        messages = summary + kept
+
+        history_tokens = _message_tokens(messages)
+        self._prompt_sizes.append(history_tokens)
+        logger.debug("Injecting %d history tokens (%d messages)", history_tokens, len(messages))
+
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        if self.input_prefix and input_str.startswith(self.input_prefix):
+            input_str = input_str[len(self.input_prefix):]
+        with self._lock:
+            self.chat_memory.add_user_message(input_str)
+            self.chat_memory.add_ai_message(output_str)
+            overflow = len(self.chat_memory.messages) > 2 * self.window_turns and not self._folding
+            if overflow:
+                self._folding = True
+        if overflow:
+            threading.Thread(target=self._fold_overflow, name="memory-fold", daemon=True).start()
+
+    def _fold_overflow(self):
+        try:
+            while True:
+                with self._lock:
+                    messages = self.chat_memory.messages
+                    excess = len(messages) - 2 * self.window_turns
+                    if excess <= 0:
+                        return
+                    old = list(messages[:excess])
+                    existing = self.summary
+                summary = self._summarize(old, existing)
+                with self._lock:
+                    # Turns appended meanwhile stay untouched; only the folded head goes.
+                    self.chat_memory.messages = self.chat_memory.messages[len(old):]
+                    self.summary = summary
+        finally:
+            with self._lock:
+                self._folding = False
+
+    def _summarize(self, messages: List[BaseMessage], existing_summary: str) -> str:
+        if self.llm is not None:
+            try:
+                chain = LLMChain(llm=self.llm, prompt=SUMMARY_PROMPT)
+                new_lines = get_buffer_string(messages)
+                # Runs outside any request, so it gets its own deadline, and goes
+                # through the same rate limit, quota and breaker as the agent's calls.
+                with deadline_scope(Deadline(Config.MEMORY_SUMMARY_TIMEOUT)), get_upstream("Gemini").call():
+                    summary = call_with_deadline(lambda: chain.predict(summary=existing_summary, new_lines=new_lines))
+                return self._cap_summary(summary.strip())
+            except Exception:
+                logger.exception("Summarizing conversation history failed; using extractive summary")
+        lines = [
+            f"{'Student' if message.type == 'human' else 'Assistant'}: {_first_sentence(message.content)}"
+            for message in messages
+        ]
+        return self._cap_summary(" ".join(filter(None, [existing_summary, *lines])))
+
+    def _cap_summary(self, summary: str) -> str:
+        # Extractive fallback summaries grow with every fold; keep the newest part.
+        words = summary.split()
+        limit = int(self.summary_token_limit / 0.75)
+        return summary if len(words) <= limit else " ".join(words[-limit:])
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self.summary = ""
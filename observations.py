@@ -0,0 +1,147 @@
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+from langchain.callbacks.base import BaseCallbackHandler
+from config import Config
+from text_utils import estimate_tokens
+
+_TERM_RE = re.compile(r"[a-z0-9]+")
+_URL_RE = re.compile(r"https?://|\bSource:|\bURL:")
+# Bullet, numbering, "**Card 1**", "A:", "Abstract:" ... kept when a line's content is dropped.
+_LINE_PREFIX_RE = re.compile(r"^(\s*(?:[-•*#>]+\s*|\d+\.\s*)?(?:\*\*[^*]{1,60}\*\*:?\s*|[A-Z][A-Za-z ]{0,20}:\s+)?)(.*)$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+DUPLICATE_MARKER = "(same as an earlier result)"
+MIN_DUPLICATE_WORDS = 8
+
+_current = contextvars.ContextVar("observation_compressor", default=None)
+
+def _split_prefix(line: str):
+    match = _LINE_PREFIX_RE.match(line)
+    return match.group(1), match.group(2)
+
+def _fingerprint(text: str) -> str:
+    return " ".join(_TERM_RE.findall(text.lower()))
+
+def strip_boilerplate(text: str) -> str:
+    # Imported here: tools pulls in the HTTP clients, and a tool has already run by
+    # the time there is an observation to strip.
+    from tools import BOILERPLATE
+    for block in BOILERPLATE:
+        text = text.replace(block, "")
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def compress(text: str, budget: int, query: str = "") -> str:
+    # Extractive: keeps the first line (the tool's heading) and the lines and
+    # sentences that share the most terms with the tool input, preferring ones that
+    # carry a link, in their original order until `budget` tokens are used.
+    total = estimate_tokens(text)
+    if total <= budget:
+        return text
+    units = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        prefix, body = _split_prefix(line)
+        sentences = _SENTENCE_RE.split(body) if len(body) > 200 else [body]
+        units.append(prefix + sentences[0])
+        units.extend(sentences[1:])
+
+    query_terms = set(_TERM_RE.findall(query.lower()))
+
+    def score(index: int) -> float:
+        if index == 0:
+            return float("inf")
+        terms = set(_TERM_RE.findall(units[index].lower()))
+        return len(terms & query_terms) + (2 if _URL_RE.search(units[index]) else 0) - index / len(units)
+
+    kept, used = set(), 0
+    for index in sorted(range(len(units)), key=score, reverse=True):
+        tokens = estimate_tokens(units[index])
+        if used + tokens > budget:
+            continue
+        kept.add(index)
+        used += tokens
+    compressed = "\n".join(units[index] for index in sorted(kept))
+    return f"{compressed}\n[trimmed {total - estimate_tokens(compressed)} tokens]"
+
+class ObservationCompressor(BaseCallbackHandler):
+    # Sits between the tools and the agent's scratchpad for one request. Every
+    # observation goes back to the LLM on each later iteration, so each one is
+    # stripped of static boilerplate, has snippets already seen in this request
+    # replaced by a marker, and is cut to a per-observation and per-request token
+    # budget. The raw outputs are kept in `records` for the UI.
+    def __init__(
+        self,
+        observation_budget: int = Config.OBSERVATION_TOKEN_BUDGET,
+        run_budget: int = Config.OBSERVATION_RUN_TOKEN_BUDGET,
+        min_tokens: int = Config.OBSERVATION_MIN_TOKENS,
+    ):
+        self.observation_budget = observation_budget
+        self.run_budget = run_budget
+        self.min_tokens = min_tokens
+        self.records: List[dict] = []
+        self._seen = set()
+        self._used = 0
+        self._llm_calls = 0
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._llm_calls += 1
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._llm_calls += 1
+
+    def _dedupe(self, text: str) -> str:
+        lines = []
+        for line in text.splitlines():
+            prefix, body = _split_prefix(line)
+            fingerprint = _fingerprint(body)
+            if fingerprint.count(" ") + 1 >= MIN_DUPLICATE_WORDS:
+                if fingerprint in self._seen:
+                    line = prefix + DUPLICATE_MARKER
+                self._seen.add(fingerprint)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def process(self, tool: str, tool_input: str, output: str) -> str:
+        with self._lock:
+            text = self._dedupe(strip_boilerplate(output))
+            # Later observations still get `min_tokens` once the run budget is spent.
+            budget = max(self.min_tokens, min(self.observation_budget, self.run_budget - self._used))
+            text = compress(text, budget, tool_input)
+            tokens = estimate_tokens(text)
+            self._used += tokens
+            self.records.append({
+                "tool": tool,
+                "input": tool_input,
+                "output": output,
+                "raw_tokens": estimate_tokens(output),
+                "tokens": tokens,
+                "llm_calls_before": self._llm_calls,
+            })
+        return text
+
+    def prompt_tokens_saved(self) -> int:
+        # Each LLM call after an observation re-sends the scratchpad that holds it.
+        with self._lock:
+            return sum(
+                max(0, record["raw_tokens"] - record["tokens"]) * (self._llm_calls - record["llm_calls_before"])
+                for record in self.records
+            )
+
+@contextmanager
+def observing(compressor: Optional[ObservationCompressor]):
+    token = _current.set(compressor)
+    try:
+        yield compressor
+    finally:
+        _current.reset(token)
+
+def process_observation(tool: str, tool_input: str, output):
+    # Called by the agent's tool wrappers; a no-op outside observing().
+    compressor = _current.get()
+    if compressor is None or not isinstance(output, str):
+        return output
+    return compressor.process(tool, tool_input, output)
@@ -0,0 +1,479 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional
+import numpy as np
+from config import Config
+from singleflight import file_lock
+from transcripts import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2
+_ARRAYS = ("terms", "offsets", "doc_ids", "tfs", "doc_lens", "keys", "store_offsets")
+LOCK_NAME = "index.lock"
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+@lru_cache(maxsize=1 << 18)
+def term_id(term: str) -> int:
+    # Terms are stored as 64-bit hashes, so no vocabulary has to be kept or merged.
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def paper_key(title: str, authors) -> int:
+    # The same paper comes back from different queries with the same title and
+    # authors, sometimes differently cased or with given names spelled out.
+    surnames = sorted({author.split()[-1].lower() for author in authors or [] if author.split()})
+    text = " ".join(_TOKEN_RE.findall((title or "").lower())) + "|" + " ".join(surnames)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def dedupe_papers(papers: List[dict]) -> List[dict]:
+    seen, unique = set(), []
+    for paper in papers:
+        key = paper_key(paper.get("title"), paper.get("authors"))
+        if key not in seen:
+            seen.add(key)
+            unique.append(paper)
+    return unique
+
+def _term_counts(paper: dict) -> Counter:
+    counts = Counter(map(term_id, tokenize(paper.get("title") or "")))
+    for term in counts:
+        counts[term] *= TITLE_WEIGHT
+    counts.update(map(term_id, tokenize(" ".join(paper.get("authors") or []) + " " + (paper.get("snippet") or ""))))
+    return counts
+
+def _last_modified(path: str) -> float:
+    # A directory's mtime doesn't change while a file in it is being written.
+    try:
+        return max([os.path.getmtime(path)] + [entry.stat().st_mtime for entry in os.scandir(path)])
+    except NotADirectoryError:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return time.time()
+
+class Segment:
+    # One immutable on-disk segment holding papers [base, base + size). Postings
+    # are grouped by term hash: doc_ids[offsets[i]:offsets[i + 1]] are the papers
+    # containing terms[i], in increasing order, with their weighted counts in tfs.
+    # Every array is a memory-mapped .npy file; the papers' fields are JSON lines
+    # in docs.jsonl, located through store_offsets and memory-mapped as well, so a
+    # segment stays readable after a merge has deleted its directory.
+    def __init__(self, path: str, base: int, size: int, length: int):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.base = base
+        self.size = size
+        self.length = length
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        # np.memmap refuses an empty file.
+        self.docs = (np.memmap(os.path.join(path, "docs.jsonl"), dtype=np.uint8, mode="r")
+                     if self.store_offsets[-1] else np.zeros(0, dtype=np.uint8))
+
+    def lookup(self, term_ids: np.ndarray):
+        # (start, stop) of each term's postings; start == stop if absent.
+        if not len(self.terms):
+            return np.zeros(len(term_ids), dtype=np.int64), np.zeros(len(term_ids), dtype=np.int64)
+        positions = np.searchsorted(self.terms, term_ids)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == term_ids[found]
+        starts = np.where(found, self.offsets[np.minimum(positions, len(self.terms) - 1)], 0)
+        stops = np.where(found, self.offsets[np.minimum(positions, len(self.terms) - 1) + 1], 0)
+        return starts, stops
+
+    def has_keys(self, keys: np.ndarray) -> np.ndarray:
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[positions] == keys
+
+    def documents(self, doc_ids) -> List[dict]:
+        papers = []
+        for doc_id in doc_ids:
+            local = doc_id - self.base
+            papers.append(json.loads(self.docs[int(self.store_offsets[local]):int(self.store_offsets[local + 1])].tobytes()))
+        return papers
+
+    def manifest_entry(self) -> dict:
+        return {"name": self.name, "base": self.base, "size": self.size, "length": self.length}
+
+def _write_arrays(path: str, arrays: dict):
+    for name in _ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), arrays[name])
+
+def _postings_arrays(terms: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray, order: np.ndarray) -> dict:
+    terms, doc_ids, tfs = terms[order], doc_ids[order], tfs[order]
+    unique_terms, starts = np.unique(terms, return_index=True)
+    return {
+        "terms": unique_terms,
+        "offsets": np.append(starts, len(terms)).astype(np.int64),
+        "doc_ids": doc_ids.astype(np.int32),
+        "tfs": tfs.astype(np.uint16),
+    }
+
+def write_segment(path: str, base: int, papers: List[dict], keys: List[int]) -> Segment:
+    terms, doc_ids, tfs, doc_lens, store_offsets = [], [], [], [], [0]
+    os.makedirs(path + ".tmp")
+    with open(os.path.join(path + ".tmp", "docs.jsonl"), "wb") as handle:
+        for index, paper in enumerate(papers):
+            counts = _term_counts(paper)
+            terms.extend(counts)
+            tfs.extend(counts.values())
+            doc_ids.extend([base + index] * len(counts))
+            doc_lens.append(sum(counts.values()))
+            line = (json.dumps(paper) + "\n").encode("utf-8")
+            handle.write(line)
+            store_offsets.append(store_offsets[-1] + len(line))
+    terms = np.asarray(terms, dtype=np.int64)
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    arrays = _postings_arrays(terms, doc_ids, np.asarray(tfs), np.lexsort((doc_ids, terms)))
+    arrays["doc_lens"] = np.minimum(doc_lens, np.iinfo(np.uint16).max).astype(np.uint16)
+    arrays["keys"] = np.sort(np.asarray(keys, dtype=np.int64))
+    arrays["store_offsets"] = np.asarray(store_offsets, dtype=np.int64)
+    _write_arrays(path + ".tmp", arrays)
+    os.rename(path + ".tmp", path)
+    return Segment(path, base, len(papers), int(np.sum(doc_lens)))
+
+def merge_segments(path: str, segments: List[Segment]) -> Segment:
+    # Segments are consecutive, so concatenating their postings term by term keeps
+    # each term's doc ids sorted; a stable sort by term does exactly that.
+    terms = np.concatenate([np.repeat(segment.terms, np.diff(segment.offsets)) for segment in segments])
+    doc_ids = np.concatenate([segment.doc_ids for segment in segments])
+    tfs = np.concatenate([segment.tfs for segment in segments])
+    arrays = _postings_arrays(terms, doc_ids, tfs, np.argsort(terms, kind="stable"))
+    del terms
+    arrays["doc_lens"] = np.concatenate([segment.doc_lens for segment in segments])
+    arrays["keys"] = np.sort(np.concatenate([segment.keys for segment in segments]))
+    store_offsets, shift = [np.zeros(1, dtype=np.int64)], 0
+    os.makedirs(path + ".tmp")
+    with open(os.path.join(path + ".tmp", "docs.jsonl"), "wb") as out:
+        for segment in segments:
+            out.write(segment.docs)
+            store_offsets.append(segment.store_offsets[1:] + shift)
+            shift += int(segment.store_offsets[-1])
+    arrays["store_offsets"] = np.concatenate(store_offsets)
+    _write_arrays(path + ".tmp", arrays)
+    os.rename(path + ".tmp", path)
+    return Segment(path, segments[0].base, sum(s.size for s in segments), sum(s.length for s in segments))
+
+class PaperIndex:
+    # BM25 over every scholarly result the tools have seen, as a log of immutable
+    # segments: each add() writes one small segment, and a background thread merges
+    # runs of `merge_factor` similar-sized segments so a query touches only a few.
+    # manifest.json lists the live segments and is replaced atomically, so a crash
+    # leaves at most some unreferenced segment directories. Processes sharing the
+    # directory change the manifest under a file lock, re-reading it first, and
+    # only clear out directories that nobody has touched for a while, since
+    # another process's merge writes its segment before listing it.
+    def __init__(
+        self,
+        directory: str = Config.PAPER_INDEX_DIR,
+        merge_factor: int = Config.PAPER_INDEX_MERGE_FACTOR,
+        max_segment_papers: int = Config.PAPER_INDEX_MAX_SEGMENT_PAPERS,
+    ):
+        self.directory = directory
+        self.merge_factor = merge_factor
+        self.max_segment_papers = max_segment_papers
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._next_segment = 0
+        self._manifest_version = None
+        self._merge_thread = None
+        self.stats = {"added": 0, "duplicates": 0, "merges": 0, "queries": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.directory, LOCK_NAME)
+
+    def _manifest_changed(self) -> bool:
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return False
+        # os.replace gives every manifest a new inode.
+        return (stat.st_ino, stat.st_mtime_ns) != self._manifest_version
+
+    def _refresh(self):
+        # Picks up segments that other processes added or merged. Call with the
+        # directory lock held.
+        if not self._manifest_changed():
+            return
+        stat = os.stat(self.manifest_path)
+        with open(self.manifest_path, "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        with self._lock:
+            opened = {segment.name: segment for segment in self._segments}
+        segments = [
+            opened.get(entry["name"])
+            or Segment(os.path.join(self.directory, entry["name"]), entry["base"], entry["size"], entry["length"])
+            for entry in manifest["segments"]
+        ]
+        with self._lock:
+            self._segments = segments
+            self._next_segment = max(self._next_segment, manifest["next_segment"])
+            self._manifest_version = (stat.st_ino, stat.st_mtime_ns)
+
+    def _load(self):
+        with file_lock(self.lock_path):
+            self._refresh()
+            self._remove_orphans()
+
+    def _remove_orphans(self):
+        # Directories no manifest lists: left by a crash, or written by a merge in
+        # another process that hasn't listed its result yet. Only the first kind
+        # is old. Call with the directory lock held.
+        with self._lock:
+            live = {segment.name for segment in self._segments} | {"manifest.json", LOCK_NAME}
+        cutoff = time.time() - Config.PAPER_INDEX_ORPHAN_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name not in live and _last_modified(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _save_manifest(self):
+        # Call with the directory lock held.
+        with self._lock:
+            manifest = {"next_segment": self._next_segment, "segments": [segment.manifest_entry() for segment in self._segments]}
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        stat = os.stat(self.manifest_path)
+        with self._lock:
+            self._manifest_version = (stat.st_ino, stat.st_mtime_ns)
+
+    def _new_segment_path(self) -> str:
+        # Call with the directory lock held, after _refresh, so no other process
+        # hands out the same name.
+        with self._lock:
+            self._next_segment += 1
+            return os.path.join(self.directory, f"segment-{self._next_segment:06d}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(segment.size for segment in self._segments)
+
+    @property
+    def segment_count(self) -> int:
+        with self._lock:
+            return len(self._segments)
+
+    def add(self, papers: List[dict]) -> int:
+        # Papers without a title are skipped, and ones already indexed (same title
+        # and authors) are not added again. Returns the number added.
+        candidates = {}
+        for paper in papers:
+            if paper.get("title"):
+                candidates.setdefault(paper_key(paper["title"], paper.get("authors")), paper)
+        if not candidates:
+            return 0
+        keys = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        with self._write_lock, file_lock(self.lock_path):
+            self._refresh()
+            with self._lock:
+                segments = list(self._segments)
+            known = np.zeros(len(keys), dtype=bool)
+            for segment in segments:
+                known |= segment.has_keys(keys)
+            new_keys = keys[~known].tolist()
+            self.stats["duplicates"] += int(known.sum())
+            if not new_keys:
+                return 0
+            base = segments[-1].base + segments[-1].size if segments else 0
+            segment = write_segment(self._new_segment_path(), base, [candidates[key] for key in new_keys], new_keys)
+            with self._lock:
+                self._segments.append(segment)
+            self._save_manifest()
+            self.stats["added"] += len(new_keys)
+        self._ensure_merging()
+        return len(new_keys)
+
+    def _tier(self, size: int) -> int:
+        return int(math.log(max(size, 1), self.merge_factor))
+
+    def _merge_candidates(self) -> Optional[List[Segment]]:
+        # The first run of `merge_factor` consecutive segments in the same size tier
+        # whose merge stays under the size cap.
+        with self._lock:
+            segments = list(self._segments)
+        for start in range(len(segments) - self.merge_factor + 1):
+            run = segments[start:start + self.merge_factor]
+            tier = self._tier(run[0].size)
+            if all(self._tier(segment.size) == tier for segment in run) and sum(s.size for s in run) <= self.max_segment_papers:
+                return run
+        return None
+
+    def _ensure_merging(self):
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self._merge_worker, name="paper-index-merge", daemon=True)
+            self._merge_thread.start()
+
+    def _merge_worker(self):
+        try:
+            while True:
+                run = self._merge_candidates()
+                if run is None:
+                    return
+                with self._write_lock, file_lock(self.lock_path):
+                    self._refresh()
+                    path = self._new_segment_path()
+                    self._save_manifest()
+                # The merge itself runs unlocked; adds and searches go on meanwhile.
+                merged = merge_segments(path, run)
+                with self._write_lock, file_lock(self.lock_path):
+                    self._refresh()
+                    names = [segment.name for segment in run]
+                    with self._lock:
+                        current = [segment.name for segment in self._segments]
+                        start = current.index(names[0]) if names[0] in current else -1
+                        replaced = start >= 0 and current[start:start + len(run)] == names
+                        if replaced:
+                            self._segments[start:start + len(run)] = [merged]
+                            self.stats["merges"] += 1
+                    if not replaced:
+                        # Another process merged some of these segments first.
+                        shutil.rmtree(merged.path, ignore_errors=True)
+                        continue
+                    self._save_manifest()
+                    # Searches that picked up the old segments keep reading them
+                    # through their memory maps, which outlive the files on POSIX.
+                    # (Where an open map blocks deletion, the directory is removed as
+                    # an orphan later.)
+                    for segment in run:
+                        shutil.rmtree(segment.path, ignore_errors=True)
+        except Exception:
+            logger.exception("Paper index merge failed")
+
+    def wait_for_merges(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def _score(self, segments, ranges, terms, idf, candidates: np.ndarray, average_length: float):
+        # Exact BM25 scores and matched-term counts of `candidates` (sorted paper ids),
+        # found by binary search in each term's postings rather than by scanning them.
+        scores = np.zeros(len(candidates))
+        matched = np.zeros(len(candidates), dtype=np.int32)
+        for segment, (starts, stops) in zip(segments, ranges):
+            lo, hi = np.searchsorted(candidates, [segment.base, segment.base + segment.size])
+            if lo == hi:
+                continue
+            docs = candidates[lo:hi]
+            norm = K1 * (1 - B + B * segment.doc_lens[docs - segment.base] / average_length)
+            for term in terms:
+                postings = segment.doc_ids[starts[term]:stops[term]]
+                if not len(postings):
+                    continue
+                positions = np.minimum(np.searchsorted(postings, docs), len(postings) - 1)
+                found = postings[positions] == docs
+                tfs = segment.tfs[starts[term] + positions[found]].astype(np.float64)
+                scores[lo:hi][found] += idf[term] * tfs * (K1 + 1) / (tfs + norm[found])
+                matched[lo:hi][found] += 1
+        return scores, matched
+
+    def search(self, query: str, k: int = Config.PAPER_INDEX_TOP_K) -> List[dict]:
+        # BM25 (title terms count double). Each hit carries its score and `coverage`,
+        # the fraction of the query's terms it contains.
+        query_terms = np.unique(np.fromiter((term_id(term) for term in tokenize(query)), dtype=np.int64))
+        if self._manifest_changed():
+            with file_lock(self.lock_path):
+                self._refresh()
+        with self._lock:
+            segments = list(self._segments)
+            self.stats["queries"] += 1
+        papers = sum(segment.size for segment in segments)
+        if not len(query_terms) or not papers:
+            return []
+        average_length = sum(segment.length for segment in segments) / papers
+        ranges = [segment.lookup(query_terms) for segment in segments]
+        df = sum(stops - starts for starts, stops in ranges)
+        idf = np.log(1.0 + (papers - df + 0.5) / (df + 0.5))
+        present = np.flatnonzero(df)
+        if not len(present):
+            return []
+
+        # MaxScore: a term adds at most idf * (K1 + 1) to a paper. Candidates come from
+        # the rarest terms' postings; the most common terms are left out as long as
+        # the k-th best candidate already beats every paper that only has those, so
+        # a query rarely reads a long postings list in full. The result is exact.
+        order = present[np.argsort(-df[present], kind="stable")]
+        bounds = idf * (K1 + 1)
+        for skip in range(len(order) - 1, -1, -1):
+            candidates = np.unique(np.concatenate([
+                segment.doc_ids[starts[term]:stops[term]]
+                for segment, (starts, stops) in zip(segments, ranges)
+                for term in order[skip:]
+            ])).astype(np.int64)
+            scores, matched = self._score(segments, ranges, order, idf, candidates, average_length)
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k] if len(scores) >= k else 0.0
+            if not skip or threshold >= bounds[order[:skip]].sum():
+                break
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        hits = []
+        for position in top:
+            doc_id = int(candidates[position])
+            segment = next(s for s in segments if s.base <= doc_id < s.base + s.size)
+            paper = segment.documents([doc_id])[0]
+            hits.append({**paper, "score": float(scores[position]), "coverage": float(matched[position]) / len(query_terms)})
+        return hits
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics["papers"] = sum(segment.size for segment in self._segments)
+            metrics["segments"] = len(self._segments)
+        return metrics
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_paper_index() -> PaperIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PaperIndex(Config.PAPER_INDEX_DIR)
+        return _index
+
+def index_papers(papers: List[dict]) -> int:
+    if not Config.PAPER_INDEX_ENABLED:
+        return 0
+    try:
+        return get_paper_index().add(papers)
+    except Exception:
+        logger.exception("Paper indexing failed")
+        return 0
+
+def local_paper_hits(query: str) -> List[dict]:
+    if not Config.PAPER_INDEX_ENABLED:
+        return []
+    try:
+        return get_paper_index().search(query)
+    except Exception:
+        logger.exception("Paper index search failed")
+        return []
+
+def has_local_recall(hits: List[dict]) -> bool:
+    # Enough local papers that match most of the query to skip SerpAPI.
+    return sum(hit["coverage"] >= Config.PAPER_INDEX_MIN_COVERAGE for hit in hits) >= Config.PAPER_INDEX_MIN_HITS
@@ -0,0 +1,418 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+from config import Config
+from deadline import DeadlineExceeded, remaining_timeout
+
+class TokenBucket:
+    # `rate` tokens per second refill a bucket holding at most `capacity` tokens, so
+    # short bursts up to `capacity` pass immediately and the long-run rate is `rate`.
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        with self._lock:
+            self._refill(self._clock())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        # Blocks until `tokens` are available; returns False if that would take longer
+        # than `timeout` seconds.
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(self._clock())
+            return self._tokens
+
+class UpstreamUnavailableError(Exception):
+    # Raised before any request is sent: the circuit is open, the quota is used up,
+    # or the rate limiter could not grant a slot within the upstream's max wait.
+    def __init__(self, upstream: str, reason: str, retry_after: Optional[float] = None):
+        message = f"{upstream} is temporarily unavailable ({reason})"
+        if retry_after:
+            message += f"; retry in {retry_after:.0f}s"
+        super().__init__(message)
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures; after
+    # `reset_timeout` one trial call is let through (half-open), and its outcome
+    # closes the circuit again or re-opens it.
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def release_trial(self):
+        # The admitted call never reached the upstream; let the next one be the trial.
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.stats["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"state": self._current_state(), "consecutive_failures": self._failures, **self.stats}
+
+@dataclass
+class QuotaReservation:
+    # `window_start` identifies the quota window the unit was taken from, so a
+    # release can't hand a unit back to a later window.
+    granted: bool
+    retry_after: Optional[float] = None
+    window_start: Optional[float] = None
+
+class QuotaStore:
+    # Quota windows are kept in SQLite (the tool cache's file by default), so a
+    # restart doesn't start a fresh window and worker processes on one host share
+    # one count. Windows use wall-clock time, which survives a restart.
+    def __init__(self, path: str, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            " upstream TEXT PRIMARY KEY,"
+            " window_start REAL NOT NULL,"
+            " used INTEGER NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, upstream: str, quota: int, period: Optional[float]) -> QuotaReservation:
+        # Takes one unit if the current window has one left; if not, the reservation
+        # carries the seconds until the window resets.
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front: no other process can read
+        # the same count in between and spend the last unit twice.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self._clock()
+            row = conn.execute("SELECT window_start, used FROM quota WHERE upstream = ?", (upstream,)).fetchone()
+            window_start, used = row if row is not None else (now, 0)
+            if period and now - window_start >= period:
+                window_start, used = now, 0
+            if used >= quota:
+                conn.execute("COMMIT")
+                return QuotaReservation(False, retry_after=window_start + period - now if period else None)
+            conn.execute("INSERT OR REPLACE INTO quota (upstream, window_start, used) VALUES (?, ?, ?)",
+                         (upstream, window_start, used + 1))
+            conn.execute("COMMIT")
+            return QuotaReservation(True, window_start=window_start)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, upstream: str, window_start: float):
+        # Only hands the unit back if its window is still the current one; once the
+        # window has reset, the unit was never counted against the new one.
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE quota SET used = MAX(used - 1, 0) WHERE upstream = ? AND window_start = ?",
+                         (upstream, window_start))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def used(self, upstream: str, period: Optional[float]) -> int:
+        row = self._connect().execute("SELECT window_start, used FROM quota WHERE upstream = ?", (upstream,)).fetchone()
+        if row is None or (period and self._clock() - row[0] >= period):
+            return 0
+        return row[1]
+
+_quota_store = None
+_quota_store_lock = threading.Lock()
+
+def get_quota_store() -> QuotaStore:
+    global _quota_store
+    with _quota_store_lock:
+        if _quota_store is None:
+            _quota_store = QuotaStore(Config.TOOL_CACHE_PATH)
+        return _quota_store
+
+class Upstream:
+    # Token-bucket limiter + quota window + circuit breaker for one external API.
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        max_wait: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        quota: Optional[int] = None,
+        quota_period: Optional[float] = None,
+        clock=time.monotonic,
+        quota_store: Optional[QuotaStore] = None,
+    ):
+        self.name = name
+        self.limiter = TokenBucket(rate, capacity=burst, clock=clock)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+        self.max_wait = max_wait
+        self.quota = quota
+        self.quota_period = quota_period
+        self._quota_store = quota_store
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "throttled": 0,
+                      "rejected_rate": 0, "rejected_quota": 0}
+
+    def _quota(self) -> QuotaStore:
+        if self._quota_store is None:
+            self._quota_store = get_quota_store()
+        return self._quota_store
+
+    def try_reserve_quota(self) -> QuotaReservation:
+        # One unit per request actually sent; clients that retry reserve again
+        # before each retry (see admit_retry), since the upstream bills every attempt.
+        if self.quota is None:
+            return QuotaReservation(True)
+        reservation = self._quota().reserve(self.name, self.quota, self.quota_period)
+        if not reservation.granted:
+            self._count("rejected_quota")
+        return reservation
+
+    def release_quota(self, reservation: QuotaReservation):
+        if reservation.window_start is not None:
+            self._quota().release(self.name, reservation.window_start)
+
+    def _admit(self) -> QuotaReservation:
+        if not self.breaker.allow():
+            raise UpstreamUnavailableError(self.name, "circuit open after repeated failures", self.breaker.retry_after())
+        reservation = self.try_reserve_quota()
+        if not reservation.granted:
+            raise UpstreamUnavailableError(self.name, "quota used up", reservation.retry_after)
+        return reservation
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _rate_limited(self, reservation: QuotaReservation):
+        # Nothing was sent: hand back the quota unit and any half-open trial slot.
+        self._count("rejected_rate")
+        self.release_quota(reservation)
+        self.breaker.release_trial()
+        raise UpstreamUnavailableError(self.name, "rate limit", self.limiter.wait_time())
+
+    def admit(self):
+        # Everything that happens before a request is sent; raises UpstreamUnavailableError.
+        max_wait = remaining_timeout(self.max_wait)
+        reservation = self._admit()
+        if not self.limiter.try_acquire():
+            self._count("throttled")
+            if not self.limiter.acquire(timeout=max_wait):
+                self._rate_limited(reservation)
+        self._count("requests")
+
+    async def admit_async(self):
+        max_wait = remaining_timeout(self.max_wait)
+        reservation = self._admit()
+        if not self.limiter.try_acquire():
+            self._count("throttled")
+            if not await self.limiter.acquire_async(timeout=max_wait):
+                self._rate_limited(reservation)
+        self._count("requests")
+
+    def _retry_wait(self, delay: float) -> float:
+        # The limiter wait comes on top of the backoff delay, so both have to fit
+        # in what is left of the request.
+        return max(0.0, remaining_timeout(self.max_wait) - delay)
+
+    def admit_retry(self, delay: float) -> bool:
+        # A retry inside an admitted call: the breaker has already let the call
+        # through, but the retry needs its own quota unit and limiter slot. Returns
+        # False (holding neither) if it can't have both.
+        reservation = self.try_reserve_quota()
+        if not reservation.granted:
+            return False
+        if not self.limiter.try_acquire():
+            self._count("throttled")
+            if not self.limiter.acquire(timeout=self._retry_wait(delay)):
+                self._count("rejected_rate")
+                self.release_quota(reservation)
+                return False
+        return True
+
+    async def admit_retry_async(self, delay: float) -> bool:
+        reservation = self.try_reserve_quota()
+        if not reservation.granted:
+            return False
+        if not self.limiter.try_acquire():
+            self._count("throttled")
+            if not await self.limiter.acquire_async(timeout=self._retry_wait(delay)):
+                self._count("rejected_rate")
+                self.release_quota(reservation)
+                return False
+        return True
+
+    def record(self, error: Optional[BaseException] = None, is_failure=None):
+        # is_failure(error) can exclude errors that say nothing about the upstream's
+        # health (e.g. a video without captions).
+        if error is None or (is_failure is not None and not is_failure(error)):
+            self._count("successes")
+            self.breaker.record_success()
+        elif isinstance(error, Exception) and not isinstance(error, DeadlineExceeded):
+            self._count("failures")
+            self.breaker.record_failure()
+        else:
+            # Cancelled, interrupted or out of request time: no verdict on the upstream.
+            self.breaker.release_trial()
+
+    @contextmanager
+    def call(self, is_failure=None):
+        self.admit()
+        try:
+            yield
+        except BaseException as e:
+            self.record(e, is_failure)
+            raise
+        self.record()
+
+    @asynccontextmanager
+    async def call_async(self, is_failure=None):
+        await self.admit_async()
+        try:
+            yield
+        except BaseException as e:
+            self.record(e, is_failure)
+            raise
+        self.record()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.stats)
+        metrics["quota"] = self.quota
+        metrics["quota_used"] = 0 if self.quota is None else self._quota().used(self.name, self.quota_period)
+        metrics["quota_remaining"] = None if self.quota is None else max(0, self.quota - metrics["quota_used"])
+        metrics["tokens_available"] = round(self.limiter.available, 2)
+        metrics["circuit"] = self.breaker.metrics()
+        return metrics
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+def get_upstream(name: str) -> Upstream:
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            settings = {**Config.UPSTREAM_DEFAULTS, **Config.UPSTREAM_LIMITS.get(name, {})}
+            upstream = _upstreams[name] = Upstream(name, **settings)
+        return upstream
+
+def upstream_metrics() -> Dict[str, dict]:
+    with _upstreams_lock:
+        upstreams = dict(_upstreams)
+    return {name: upstream.metrics() for name, upstream in upstreams.items()}
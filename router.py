@@ -0,0 +1,178 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern
+from config import Config
+
+# A topic like "it" or "that one" refers back to the conversation, which only the
+# agent (with memory) can resolve.
+_CONTEXT_WORDS = re.compile(r"\b(?:it|this|that|these|those|them|they|above|previous|same)\b", re.IGNORECASE)
+
+def refers_to_context(text: str) -> bool:
+    return bool(_CONTEXT_WORDS.search(text))
+
+@dataclass
+class Route:
+    tool: str
+    tool_input: str
+    confidence: float
+    rule: str
+
+@dataclass
+class RouteRule:
+    # `pattern` is matched against the whole query; a named group `topic` (if any)
+    # becomes the tool input, otherwise the query is passed through unchanged.
+    name: str
+    tool: str
+    pattern: Pattern
+    confidence: float
+
+    def match(self, query: str) -> Optional[Route]:
+        match = self.pattern.search(query)
+        if not match:
+            return None
+        topic = match.groupdict().get("topic")
+        tool_input = topic.strip(" ?.!") if topic else query
+        if topic and self.tool != "YouTube Summary Tool" and refers_to_context(tool_input):
+            return None
+        return Route(self.tool, tool_input, self.confidence, self.name) if tool_input else None
+
+def _rule(name: str, tool: str, pattern: str, confidence: float) -> RouteRule:
+    return RouteRule(name, tool, re.compile(pattern, re.IGNORECASE), confidence)
+
+_ASK = r"^\s*(?:please\s+)?(?:can you\s+|could you\s+)?(?:make|create|generate|give me|get me|find|show me|list|suggest|i need|i want)?\s*(?:me\s+)?(?:some\s+|a\s+|an\s+)?"
+
+DEFAULT_RULES: List[RouteRule] = [
+    _rule("youtube_url", "YouTube Summary Tool",
+          r"(?P<topic>(?:https?://)?(?:www\.|m\.)?(?:youtube\.com/watch\?\S*v=|youtu\.be/)[\w-]{11}\S*)", 0.99),
+    _rule("flashcards", "Flashcard Generator Tool",
+          _ASK + r"flash\s?cards?\s+(?:for|on|about|of)\s+(?P<topic>.+)$", 0.95),
+    _rule("exam_strategy", "Exam Strategy Tool",
+          _ASK + r"(?:exam|test)\s+(?:strateg(?:y|ies)|tips|techniques)\s+(?:for|on|about)\s+(?P<topic>.+)$", 0.95),
+    _rule("papers", "Scholarly Papers Tool",
+          _ASK + r"(?:recent\s+)?(?:research\s+|academic\s+|scholarly\s+|scientific\s+)?papers?\s+(?:on|about|for|regarding)\s+(?P<topic>.+)$", 0.93),
+    _rule("concept_map", "Concept Mapper Tool",
+          _ASK + r"concept\s+maps?\s+(?:for|of|on|about)\s+(?P<topic>.+)$", 0.93),
+    _rule("study_tips", "Study Tips Tool",
+          _ASK + r"study\s+tips\s+(?:for|on|about)\s+(?P<topic>.+)$", 0.92),
+    _rule("organize_notes", "Note Organizer Tool",
+          _ASK + r"(?:organi[sz]e|structure)\s+(?:my\s+)?notes\s+(?:for|on|about)\s+(?P<topic>.+)$", 0.9),
+    _rule("define", "Wikipedia Tool",
+          r"^\s*(?:define|definition of|what does the term)\s+(?P<topic>[^?]{1,80}?)(?:\s+mean)?\s*\??$", 0.9),
+]
+
+CLASSIFIER_EXAMPLES: Dict[str, List[str]] = {
+    "Flashcard Generator Tool": ["quiz cards for the krebs cycle", "question and answer cards about world war two",
+                                 "help me memorise spanish verbs with cards"],
+    "Exam Strategy Tool": ["how should I approach multiple choice questions", "how to prepare for a viva",
+                           "time management in a theory exam"],
+    "Scholarly Papers Tool": ["academic research about sleep and memory", "journal articles on climate models",
+                              "peer reviewed studies of spaced repetition"],
+    "Concept Mapper Tool": ["show how the ideas in thermodynamics connect", "relationships between cell organelles",
+                            "map the key concepts of macroeconomics"],
+    "Study Tips Tool": ["how do I study chemistry better", "best way to revise for biology",
+                        "how can I focus when learning maths"],
+}
+
+class PrototypeClassifier:
+    # Nearest-centroid classifier over a handful of example queries per tool, using
+    # the same embedder as the vector store; cheap enough to run on every query.
+    def __init__(self, embedder, examples: Dict[str, List[str]] = CLASSIFIER_EXAMPLES):
+        import numpy as np
+        self.embedder = embedder
+        self.labels = list(examples)
+        centroids = np.stack([embedder.embed(texts).mean(axis=0) for texts in examples.values()])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.centroids = centroids / norms
+
+    def predict(self, query: str):
+        scores = self.centroids @ self.embedder.embed([query])[0]
+        best = int(scores.argmax())
+        return self.labels[best], float(scores[best])
+
+class QueryRouter:
+    def __init__(
+        self,
+        rules: List[RouteRule] = None,
+        classifier: Optional[PrototypeClassifier] = None,
+        threshold: float = Config.ROUTER_CONFIDENCE_THRESHOLD,
+        classifier_threshold: float = Config.ROUTER_CLASSIFIER_THRESHOLD,
+    ):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.classifier = classifier
+        self.threshold = threshold
+        self.classifier_threshold = classifier_threshold
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "routed": 0, "fallbacks": 0, "by_rule": {},
+                      "routed_seconds": 0.0, "agent_seconds": 0.0}
+
+    def route(self, query: str) -> Optional[Route]:
+        best = None
+        for rule in self.rules:
+            route = rule.match(query)
+            if route and (best is None or route.confidence > best.confidence):
+                best = route
+        if self.classifier is not None:
+            tool, score = self.classifier.predict(query)
+            if best is not None and best.tool == tool:
+                # Rule and classifier agree: enough to clear the threshold.
+                best.confidence = max(best.confidence, min(0.99, best.confidence + score / 2))
+            elif best is None and score >= self.classifier_threshold:
+                best = Route(tool, query, score, "classifier")
+        with self._lock:
+            self.stats["queries"] += 1
+        if best is None or best.confidence < self.threshold:
+            return None
+        return best
+
+    def record_routed(self, route: Route, seconds: float):
+        with self._lock:
+            self.stats["routed"] += 1
+            self.stats["routed_seconds"] += seconds
+            self.stats["by_rule"][route.rule] = self.stats["by_rule"].get(route.rule, 0) + 1
+
+    def record_fallback(self, seconds: float):
+        with self._lock:
+            self.stats["fallbacks"] += 1
+            self.stats["agent_seconds"] += seconds
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = {**self.stats, "by_rule": dict(self.stats["by_rule"])}
+        stats["hit_rate"] = stats["routed"] / stats["queries"] if stats["queries"] else 0.0
+        avg_routed = stats["routed_seconds"] / stats["routed"] if stats["routed"] else 0.0
+        avg_agent = stats["agent_seconds"] / stats["fallbacks"] if stats["fallbacks"] else 0.0
+        stats["avg_routed_seconds"] = avg_routed
+        stats["avg_agent_seconds"] = avg_agent
+        # Estimated against the average full-agent run seen in this process.
+        stats["latency_saved_seconds"] = max(0.0, avg_agent - avg_routed) * stats["routed"] if avg_agent else 0.0
+        return stats
+
+POLISH_PROMPT = (
+    "You are a friendly study assistant. A student asked:\n\n{query}\n\n"
+    "The {tool} returned the material below. Rewrite it as a clear, helpful answer for "
+    "the student. Use only this material, keep any links, and do not mention the tool.\n\n"
+    "{output}"
+)
+
+def polish_prompt(query: str, tool: str, output: str) -> str:
+    return POLISH_PROMPT.format(query=query, tool=tool, output=output)
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router() -> QueryRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            classifier = None
+            if Config.ROUTER_CLASSIFIER_ENABLED:
+                from vector_store import get_embedder
+                classifier = PrototypeClassifier(get_embedder())
+            _router = QueryRouter(classifier=classifier)
+        return _router
+
+def router_metrics() -> Optional[dict]:
+    # None until the first question has been routed; does not build the router.
+    return _router.metrics() if _router is not None else None
@@ -0,0 +1,123 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+import numpy as np
+from config import Config
+from router import refers_to_context
+from vector_store import get_embedder
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    tools_used: List[str]
+    llm_calls: int
+    created_at: float = field(default_factory=time.time)
+    similarity: float = 1.0
+
+class SemanticCache:
+    # Query embeddings are rows of one float32 matrix, so a lookup is a single
+    # matrix-vector product no matter how many answers are cached.
+    def __init__(
+        self,
+        embedder,
+        threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = Config.SEMANTIC_CACHE_TTL,
+        max_entries: int = Config.SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._created = np.empty(0, dtype=np.float64)
+        self._last_used = np.empty(0, dtype=np.float64)
+        self._entries: List[CachedAnswer] = []
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "llm_calls_saved": 0}
+
+    def embed(self, query: str) -> np.ndarray:
+        return self.embedder.embed([query])[0]
+
+    def _keep(self, mask: np.ndarray):
+        self._vectors = self._vectors[mask]
+        self._created = self._created[mask]
+        self._last_used = self._last_used[mask]
+        self._entries = [entry for entry, keep in zip(self._entries, mask) if keep]
+
+    def _purge_expired(self, now: float):
+        if not self._entries:
+            return
+        alive = self._created > now - self.ttl
+        if not alive.all():
+            self.stats["expired"] += int((~alive).sum())
+            self._keep(alive)
+
+    def lookup(self, vector: np.ndarray) -> Optional[CachedAnswer]:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            if not self._entries:
+                self.stats["misses"] += 1
+                return None
+            scores = self._vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            self._last_used[best] = now
+            self.stats["hits"] += 1
+            entry = self._entries[best]
+            self.stats["llm_calls_saved"] += entry.llm_calls
+            return CachedAnswer(
+                query=entry.query,
+                answer=entry.answer,
+                tools_used=list(entry.tools_used),
+                llm_calls=entry.llm_calls,
+                created_at=entry.created_at,
+                similarity=float(scores[best]),
+            )
+
+    def store(self, query: str, vector: np.ndarray, answer: str, tools_used: List[str], llm_calls: int):
+        now = time.time()
+        vector = np.asarray(vector, dtype=np.float32)[None, :]
+        with self._lock:
+            self._purge_expired(now)
+            if len(self._entries) >= self.max_entries:
+                # Drop the least recently used quarter in one pass rather than
+                # reshuffling the matrix on every insert.
+                drop = max(1, len(self._entries) - self.max_entries + 1, self.max_entries // 4)
+                keep = np.ones(len(self._entries), dtype=bool)
+                keep[np.argsort(self._last_used)[:drop]] = False
+                self.stats["evictions"] += drop
+                self._keep(keep)
+            self._vectors = vector if self._vectors is None or not len(self._entries) else np.vstack([self._vectors, vector])
+            self._created = np.append(self._created, now)
+            self._last_used = np.append(self._last_used, now)
+            self._entries.append(CachedAnswer(query, answer, list(tools_used), llm_calls, created_at=now))
+            self.stats["stores"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics["entries"] = len(self._entries)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+def is_cacheable_query(query: str) -> bool:
+    # Very short follow-ups ("explain more", "why?") and ones that point back at
+    # the conversation ("explain that more simply") depend on it, not just on
+    # their own wording, so they always go to the agent.
+    return len(query.split()) >= Config.SEMANTIC_CACHE_MIN_QUERY_WORDS and not refers_to_context(query)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache(get_embedder())
+        return _cache
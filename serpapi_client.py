@@ -0,0 +1,222 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from deadline import remaining_timeout
+from ratelimit import get_upstream
+
+DEFAULT_BASE_URL = "https://serpapi.com/search"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class SerpApiError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def tool_message(self, what: str) -> str:
+        if self.status_code is None:
+            return str(self)
+        return f"Failed to fetch {what}. Status code: {self.status_code}"
+
+class MissingApiKeyError(SerpApiError):
+    def __init__(self):
+        super().__init__("Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable.")
+
+@dataclass
+class SearchResult:
+    title: Optional[str] = None
+    link: Optional[str] = None
+    snippet: Optional[str] = None
+    authors: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, item: dict) -> "SearchResult":
+        publication_info = item.get("publication_info") or {}
+        authors = [
+            author.get("name", "") if isinstance(author, dict) else str(author)
+            for author in publication_info.get("authors", [])
+        ]
+        return cls(
+            title=item.get("title"),
+            link=item.get("link"),
+            snippet=item.get("snippet"),
+            authors=[author for author in authors if author],
+        )
+
+def is_upstream_failure(error: Exception) -> bool:
+    # A rejected query (400, 404) says nothing about SerpAPI's health; bad keys,
+    # throttling, server errors and network failures do.
+    status = getattr(error, "status_code", None)
+    return status is None or status >= 500 or status in (401, 403, 429)
+
+def parse_results(data: dict) -> List[SearchResult]:
+    return [SearchResult.from_json(item) for item in data.get("organic_results", [])]
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), Config.SERPAPI_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    # Full jitter: spreads retries from concurrent sessions instead of synchronising them.
+    ceiling = min(Config.SERPAPI_BACKOFF_MAX_SECONDS, Config.SERPAPI_BACKOFF_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+def _can_wait(delay: float) -> bool:
+    # No point backing off past the request's deadline; give up with the last error.
+    remaining = remaining_timeout()
+    return remaining is None or delay < remaining
+
+def _can_retry(upstream, delay: float) -> bool:
+    # A retry is billed and rate limited like any other search, so it needs its own
+    # quota unit and limiter slot; without them, give up with the last error.
+    return _can_wait(delay) and upstream.admit_retry(delay)
+
+async def _can_retry_async(upstream, delay: float) -> bool:
+    return _can_wait(delay) and await upstream.admit_retry_async(delay)
+
+class _SerpApiBase:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        connect_timeout: float = Config.SERPAPI_CONNECT_TIMEOUT,
+        read_timeout: float = Config.SERPAPI_READ_TIMEOUT,
+        max_retries: int = Config.SERPAPI_MAX_RETRIES,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url or os.getenv("SERPAPI_BASE_URL") or DEFAULT_BASE_URL
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+
+    def _api_key(self) -> str:
+        # Read lazily: main.py loads .env after this module is imported.
+        api_key = self.api_key or os.getenv("SERPAPI_API_KEY")
+        if not api_key:
+            raise MissingApiKeyError()
+        return api_key
+
+    def _params(self, query: str, engine: str, num: int) -> dict:
+        return {
+            "q": query,
+            "api_key": self._api_key(),
+            "engine": engine,
+            "num": num
+        }
+
+class SerpApiClient(_SerpApiBase):
+    def __init__(self, pool_size: int = Config.SERPAPI_POOL_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def search_json(self, query: str, engine: str = "google", num: int = 5) -> dict:
+        params = self._params(query, engine, num)
+        upstream = get_upstream("SerpAPI")
+        with upstream.call(is_failure=is_upstream_failure):
+            return self._search_json(params, upstream)
+
+    def _search_json(self, params: dict, upstream) -> dict:
+        attempt = 0
+        while True:
+            read_timeout = remaining_timeout(self.read_timeout)
+            try:
+                response = self.session.get(
+                    self.base_url,
+                    params=params,
+                    timeout=(min(self.connect_timeout, read_timeout), read_timeout),
+                )
+            except requests.ConnectionError:
+                delay = backoff_delay(attempt)
+                if attempt >= self.max_retries or not _can_retry(upstream, delay):
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code == 200:
+                return response.json()
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries or not _can_retry(upstream, delay):
+                raise SerpApiError(
+                    f"SerpAPI request failed with status code {response.status_code}",
+                    status_code=response.status_code,
+                )
+            time.sleep(delay)
+            attempt += 1
+
+    def search(self, query: str, engine: str = "google", num: int = 5) -> List[SearchResult]:
+        return parse_results(self.search_json(query, engine=engine, num=num))
+
+    def close(self):
+        self.session.close()
+
+class AsyncSerpApiClient(_SerpApiBase):
+    # Same configuration and retry policy as SerpApiClient, but requests go through
+    # a shared aiohttp session supplied by the caller (see async_tools.get_http_session).
+    def __init__(self, session_factory, **kwargs):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+
+    async def search_json(self, query: str, engine: str = "google", num: int = 5) -> dict:
+        params = self._params(query, engine, num)
+        upstream = get_upstream("SerpAPI")
+        async with upstream.call_async(is_failure=is_upstream_failure):
+            return await self._search_json(params, upstream)
+
+    async def _search_json(self, params: dict, upstream) -> dict:
+        attempt = 0
+        while True:
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+                total=remaining_timeout(),
+            )
+            session = await self.session_factory()
+            try:
+                async with session.get(self.base_url, params=params, timeout=timeout) as response:
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+            except aiohttp.ClientConnectionError:
+                delay = backoff_delay(attempt)
+                if attempt >= self.max_retries or not await _can_retry_async(upstream, delay):
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            delay = backoff_delay(attempt, retry_after)
+            if status not in RETRY_STATUS_CODES or attempt >= self.max_retries or not await _can_retry_async(upstream, delay):
+                raise SerpApiError(f"SerpAPI request failed with status code {status}", status_code=status)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def search(self, query: str, engine: str = "google", num: int = 5) -> List[SearchResult]:
+        return parse_results(await self.search_json(query, engine=engine, num=num))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_serpapi_client() -> SerpApiClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SerpApiClient()
+        return _client
+
+def set_serpapi_client(client: Optional[SerpApiClient]):
+    global _client
+    with _client_lock:
+        _client = client
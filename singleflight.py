@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from config import Config
+from deadline import DeadlineExceeded, check_deadline, remaining_timeout
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process coalescing is available.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def file_lock(path: str):
+    # Exclusive lock shared by every process on the host that opens `path`; on
+    # platforms without fcntl it only marks the critical section.
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as handle:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    # Concurrent callers with the same key share one execution of fn: the first
+    # caller (the leader) runs it, the rest wait and get its result or exception.
+    # With `lock_dir` set, the leader also takes an exclusive file lock per key, so
+    # leaders in other processes on the host queue behind it; `fn` is expected to
+    # re-check a shared cache first, which is what lets those processes coalesce.
+    def __init__(self, lock_dir: Optional[str] = None, wait_timeout: float = Config.SINGLEFLIGHT_WAIT_TIMEOUT):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if lock_dir and fcntl is None:
+            logger.warning("File locks are not available on this platform; coalescing within this process only")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "timeouts": 0, "filled_while_waiting": 0}
+
+    @contextmanager
+    def _process_lock(self, key: str):
+        if not self.lock_dir:
+            yield
+            return
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        with file_lock(os.path.join(self.lock_dir, name + ".lock")):
+            yield
+
+    def do(self, key: str, fn: Callable[[], object]):
+        with self._lock:
+            self.stats["calls"] += 1
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            # A waiter gives up at its own deadline, not only at wait_timeout.
+            if not call.done.wait(remaining_timeout(self.wait_timeout)):
+                check_deadline()
+                # The leader is stuck; don't let it take every waiter down with it.
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                return fn()
+            if isinstance(call.error, DeadlineExceeded):
+                # The leader ran out of its own time, which says nothing about this
+                # caller's: try again, leading the next flight if nobody else has.
+                continue
+            with self._lock:
+                self.stats["coalesced"] += 1
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            with self._process_lock(key):
+                with self._lock:
+                    self.stats["executions"] += 1
+                call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.value
+
+    async def do_async(self, key: str, fn):
+        # fn is a coroutine function. Coalesces coroutines on the same event loop;
+        # the blocking file lock is not used here.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.stats["calls"] += 1
+        while True:
+            with self._lock:
+                future = self._async_calls.get((loop, key))
+                leader = future is None
+                if leader:
+                    future = self._async_calls[(loop, key)] = loop.create_future()
+            if leader:
+                break
+            # shield: one waiter being cancelled must not cancel the shared result.
+            try:
+                value = await asyncio.wait_for(asyncio.shield(future), remaining_timeout(self.wait_timeout))
+            except asyncio.TimeoutError:
+                check_deadline()
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                return await fn()
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. its own deadline), not us.
+                return await fn()
+            except DeadlineExceeded:
+                # As in do(): the leader's deadline is not this caller's.
+                continue
+            with self._lock:
+                self.stats["coalesced"] += 1
+            return value
+
+        with self._lock:
+            self.stats["executions"] += 1
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved so an unwaited future doesn't log it.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._async_calls.pop((loop, key), None)
+
+    def record_filled_while_waiting(self):
+        # Called by fn when its re-check finds a value that another process (or a
+        # flight that finished just before this one started) has stored meanwhile.
+        with self._lock:
+            self.stats["filled_while_waiting"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self.stats)
+            metrics["in_flight"] = len(self._calls) + len(self._async_calls)
+        metrics["upstream_calls_saved"] = metrics["coalesced"] + metrics["filled_while_waiting"]
+        return metrics
+
+_singleflight = None
+_singleflight_lock = threading.Lock()
+
+def get_singleflight() -> SingleFlight:
+    global _singleflight
+    with _singleflight_lock:
+        if _singleflight is None:
+            _singleflight = SingleFlight(lock_dir=Config.SINGLEFLIGHT_LOCK_DIR)
+        return _singleflight
+
+def singleflight_metrics() -> Optional[dict]:
+    return _singleflight.metrics() if _singleflight is not None else None
@@ -0,0 +1,195 @@
+import queue
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from langchain.callbacks.base import BaseCallbackHandler
+from text_utils import estimate_tokens
+import tracing
+
+_FINAL_ANSWER_RE = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+@dataclass
+class AgentEvent:
+    # type is one of "tool_start", "tool_end", "token", "final".
+    # elapsed is measured from the start of the request, so a caller can read
+    # time-to-first-token and total latency straight off the event stream.
+    type: str
+    elapsed: float
+    text: str = ""
+    tool: Optional[str] = None
+    latency: Optional[float] = None
+    tools_used: List[str] = field(default_factory=list)
+    # Per-span rows for the request (final event only); see tracing.Span.breakdown.
+    trace: List[dict] = field(default_factory=list)
+    # Raw tool outputs and the prompt tokens their compression saved (final event only).
+    observations: List[dict] = field(default_factory=list)
+    prompt_tokens_saved: int = 0
+    # Set on the final event when the answer is an error message or a partial
+    # answer cut off by the deadline rather than a real answer.
+    error: Optional[str] = None
+
+class FinalAnswerStreamParser:
+    # The conversational ReAct agent answers with a JSON blob
+    # {"action": "Final Answer", "action_input": "..."}; only the decoded
+    # action_input string is user-visible, so tokens before it and the closing
+    # quote are swallowed and JSON escapes are decoded incrementally.
+    def __init__(self):
+        self._buffer = ""
+        self._position = None
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += token
+        if self._position is None:
+            match = _FINAL_ANSWER_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._position = match.end()
+
+        out = []
+        buffer, i = self._buffer, self._position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            # Hold back escape sequences that are split across tokens.
+            if i + 1 >= len(buffer):
+                break
+            code = buffer[i + 1]
+            if code == "u":
+                if i + 6 > len(buffer):
+                    break
+                try:
+                    out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                except ValueError:
+                    out.append(buffer[i:i + 6])
+                i += 6
+            else:
+                out.append(_ESCAPES.get(code, code))
+                i += 2
+        self._position = i
+        return "".join(out)
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, events: "queue.Queue[AgentEvent]", started_at: float):
+        self.events = events
+        self.started_at = started_at
+        self.streamed_final_answer = False
+        self._parser = FinalAnswerStreamParser()
+        self._tool_starts = {}
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._parser = FinalAnswerStreamParser()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._parser = FinalAnswerStreamParser()
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        text = self._parser.feed(token)
+        if text:
+            self.streamed_final_answer = True
+            self.events.put(AgentEvent("token", self._elapsed(), text=text))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        tool_name = serialized.get("name")
+        self._tool_starts[run_id] = (tool_name, time.perf_counter())
+        self.events.put(AgentEvent("tool_start", self._elapsed(), text=input_str, tool=tool_name))
+
+    def _tool_finished(self, run_id, text: str):
+        tool_name, started = self._tool_starts.pop(run_id, (None, time.perf_counter()))
+        self.events.put(AgentEvent(
+            "tool_end",
+            self._elapsed(),
+            text=text,
+            tool=tool_name,
+            latency=time.perf_counter() - started,
+        ))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._tool_finished(run_id, str(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._tool_finished(run_id, f"Error: {error}")
+
+def _usage_from_result(response) -> Dict[str, int]:
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata") or {}
+    prompt = usage.get("prompt_tokens") or usage.get("prompt_token_count")
+    completion = usage.get("completion_tokens") or usage.get("candidates_token_count")
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+def _model_name(serialized: dict) -> str:
+    return serialized.get("kwargs", {}).get("model") or (serialized.get("id") or ["llm"])[-1]
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    # Turns LangChain callbacks into spans under `root`. Each span is also made the
+    # current span while it runs, so cache hits inside a tool nest under that tool.
+    def __init__(self, root: tracing.Span):
+        self.root = root
+        self._open: Dict = {}
+
+    def _start(self, run_id, name: str, kind: str, **attributes):
+        parent = tracing.current_span() or self.root
+        child = tracing.Span(name, kind, parent=parent, **attributes)
+        self._open[run_id] = (child, tracing.activate(child))
+
+    def _end(self, run_id, **attributes) -> Optional[tracing.Span]:
+        entry = self._open.pop(run_id, None)
+        if entry is None:
+            return None
+        child, token = entry
+        child.finish(**attributes)
+        try:
+            tracing.deactivate(token)
+        except ValueError:
+            # Ended from a different context than it started in; nothing to restore.
+            pass
+        return child
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt_text = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, _model_name(serialized), "llm",
+                    prompt_chars=len(prompt_text), estimated_prompt_tokens=estimate_tokens(prompt_text))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        prompt_text = "\n".join(prompts)
+        self._start(run_id, _model_name(serialized), "llm",
+                    prompt_chars=len(prompt_text), estimated_prompt_tokens=estimate_tokens(prompt_text))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        entry = self._open.get(run_id)
+        if entry is None:
+            return
+        completion = "".join(generation.text for batch in response.generations for generation in batch)
+        usage = _usage_from_result(response)
+        estimated = usage["prompt_tokens"] is None or usage["completion_tokens"] is None
+        self._end(
+            run_id,
+            prompt_tokens=usage["prompt_tokens"] or entry[0].attributes.get("estimated_prompt_tokens"),
+            completion_tokens=usage["completion_tokens"] or estimate_tokens(completion),
+            tokens_estimated=estimated,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, serialized.get("name", "tool"), "tool", input=input_str[:200])
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error))
@@ -0,0 +1,122 @@
+import contextlib
+import contextvars
+import importlib
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+_tool_errors: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("tool_errors", default=None)
+
+def tool_error(message: str) -> str:
+    # Tools tell the agent about failures in their answer text. Callers that need
+    # to tell a failure from an answer (the batch runner) collect them instead.
+    errors = _tool_errors.get()
+    if errors is not None:
+        errors.append(message)
+    return message
+
+def current_tool_errors() -> Optional[list]:
+    return _tool_errors.get()
+
+@contextlib.contextmanager
+def collect_tool_errors(errors: Optional[list] = None):
+    errors = [] if errors is None else errors
+    token = _tool_errors.set(errors)
+    try:
+        yield errors
+    finally:
+        _tool_errors.reset(token)
+
+@dataclass
+class ToolSpec:
+    # `target` is "module:function"; the module is imported on the first call, so
+    # listing tools (the UI) or building the agent never loads a tool's dependencies.
+    name: str
+    description: str
+    target: str
+    _func: Callable = field(default=None, init=False, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def load(self) -> Callable[[str], str]:
+        if self._func is None:
+            with self._lock:
+                if self._func is None:
+                    module_name, function_name = self.target.split(":")
+                    self._func = getattr(importlib.import_module(module_name), function_name)
+        return self._func
+
+    def __call__(self, query: str) -> str:
+        return self.load()(query)
+
+TOOL_REGISTRY: List[ToolSpec] = [
+    ToolSpec(
+        "Local Knowledge Tool",
+        "Search the student's saved notes and material fetched earlier. Try this first; only use the online tools if it finds nothing relevant.",
+        "vector_store:local_knowledge_tool",
+    ),
+    ToolSpec(
+        "Wikipedia Tool",
+        "Fetch Wikipedia summaries on academic topics, concepts, and theories. Separate several related concepts with '|' to look them up together.",
+        "tools:wikipedia_tool",
+    ),
+    ToolSpec(
+        "Study Tips Tool",
+        "Provide personalized study tips for different subjects and learning styles.",
+        "tools:study_tips_tool",
+    ),
+    ToolSpec(
+        "Google Search Tool",
+        "Search Google for recent academic information and facts.",
+        "tools:google_search_tool",
+    ),
+    ToolSpec(
+        "YouTube Summary Tool",
+        "Summarize educational YouTube videos. Input: YouTube Video ID or URL.",
+        "tools:youtube_summary_tool",
+    ),
+    ToolSpec(
+        "Exam Strategy Tool",
+        "Get specific tips for different exam formats: MCQ, theory, practical, or viva.",
+        "tools:exam_strategy_tool",
+    ),
+    ToolSpec(
+        "Flashcard Generator Tool",
+        "Generate study flashcards for any topic with question-answer pairs.",
+        "tools:flashcard_generator_tool",
+    ),
+    ToolSpec(
+        "Note Organizer Tool",
+        "Organize and structure study notes for better comprehension.",
+        "tools:note_organizer_tool",
+    ),
+    ToolSpec(
+        "Concept Mapper Tool",
+        "Create concept maps showing relationships between ideas for visual learning.",
+        "tools:concept_mapper_tool",
+    ),
+    ToolSpec(
+        "Scholarly Papers Tool",
+        "Find and summarize academic papers on a given topic.",
+        "tools:scholarly_papers_tool",
+    ),
+    ToolSpec(
+        "Subject Expert Tool",
+        "Get specialized help from virtual subject matter experts in various fields.",
+        "tools:subject_expert_tool",
+    ),
+    ToolSpec(
+        "Research Bundle Tool",
+        "Look a topic up on Wikipedia, Google and Google Scholar at the same time. Use this instead of calling those tools one by one when a question needs several sources.",
+        "async_tools:research_bundle_tool",
+    ),
+]
+
+_BY_NAME: Dict[str, ToolSpec] = {spec.name: spec for spec in TOOL_REGISTRY}
+
+def get_tool_names() -> List[str]:
+    return [spec.name for spec in TOOL_REGISTRY]
+
+def get_tool(name: str) -> ToolSpec:
+    if name not in _BY_NAME:
+        raise KeyError(f"Unknown tool '{name}'")
+    return _BY_NAME[name]
@@ -1,111 +1,390 @@
-import wikipedia
-from youtube_transcript_api import YouTubeTranscriptApi
-import requests
-import os
 import re
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Tuple
 from urllib.parse import urlparse, parse_qs
-import json
-
-def get_tool_names():
-    return [
-        "Wikipedia Tool",
-        "Study Tips Tool",
-        "Google Search Tool",
-        "YouTube Summary Tool",
-        "Exam Strategy Tool",
-        "Flashcard Generator Tool",
-        "Note Organizer Tool",
-        "Concept Mapper Tool",
-        "Scholarly Papers Tool",
-        "Subject Expert Tool"
-    ]
+from cache import cached_fetch, cached_fetch_many
+from concept_graph import ConceptView, concept_view, has_graph_coverage, learn_concepts
+from config import Config
+from deadline import call_with_deadline
+from paper_index import dedupe_papers, has_local_recall, index_papers, local_paper_hits
+from ratelimit import UpstreamUnavailableError, get_upstream
+from serpapi_client import SearchResult, SerpApiError, get_serpapi_client
+from tool_registry import tool_error
+from transcripts import Segment, format_timestamp, iter_segments, summarize_segments
+from vector_store import format_local_hits, local_hits, remember
+from wiki_client import WikiArticle, get_wikipedia_client
+
+def wikipedia_record(article: Optional[WikiArticle]):
+    if article is None:
+        return None
+    return {
+        "title": article.title,
+        "url": article.url,
+        "summary": article.summary(sentences=5),
+        "options": article.disambiguation_options if article.is_disambiguation else [],
+        "is_disambiguation": article.is_disambiguation,
+    }
+
+def format_wikipedia_record(record: dict) -> str:
+    if record["is_disambiguation"]:
+        return f"Multiple Wikipedia entries found. Try one of these: {', '.join(record['options'][:5])}"
+    return f"📚 Wikipedia: {record['title']}\n\n{record['summary']}\n\nSource: {record['url']}"
+
+def split_titles(query: str) -> List[str]:
+    return [title.strip() for title in query.split("|") if title.strip()]
+
+def format_wikipedia_batch(titles: List[str], records: dict) -> str:
+    sections = []
+    for title in titles:
+        record = records.get(title)
+        sections.append(format_wikipedia_record(record) if record else f"No Wikipedia page found for '{title}'.")
+    return "\n\n---\n\n".join(sections)
+
+def degraded_answer(query: str, error: UpstreamUnavailableError) -> str:
+    # Nothing cached for this query and the upstream is off limits: fall back to the
+    # local store, and tell the agent not to keep retrying.
+    try:
+        hits = local_hits(query) if Config.VECTOR_STORE_ENABLED else []
+    except Exception:
+        hits = []
+    if hits:
+        return f"⚠️ {error}. Showing saved material instead.\n\n" + format_local_hits(query, hits)
+    return tool_error(f"⚠️ {error}. Don't retry this tool for now; answer from what you already have.")
 
 def wikipedia_tool(query: str) -> str:
     try:
-        wikipedia.set_lang("en")
-        search_results = wikipedia.search(query)
-        if not search_results:
+        client = get_wikipedia_client()
+        titles = split_titles(query)
+        
+        if len(titles) > 1:
+            # Related concepts are fetched together in one batched request.
+            records = cached_fetch_many(
+                "Wikipedia Tool",
+                titles,
+                lambda missing: {
+                    title: wikipedia_record(article)
+                    for title, article in client.fetch_articles(missing).items()
+                },
+                batch=True,
+            )
+            learn_concepts([record["summary"] for record in records.values() if record and not record["is_disambiguation"]])
+            return format_wikipedia_batch(titles, records)
+        
+        record = cached_fetch("Wikipedia Tool", query, lambda: wikipedia_record(client.lookup(query)))
+        if not record:
             return f"No Wikipedia results found for '{query}'."
         
-        page_title = search_results[0]
-        page = wikipedia.page(page_title, auto_suggest=False)
-        summary = wikipedia.summary(page_title, sentences=5)
-        
-        return f"📚 Wikipedia: {page_title}\n\n{summary}\n\nSource: {page.url}"
-    except wikipedia.DisambiguationError as e:
-        return f"Multiple Wikipedia entries found. Try one of these: {', '.join(e.options[:5])}"
-    except wikipedia.PageError:
-        return f"No Wikipedia page found for '{query}'."
+        output = format_wikipedia_record(record)
+        if not record["is_disambiguation"]:
+            learn_concepts([record["summary"]])
+            remember(output, source="Wikipedia Tool", metadata={"query": query, "url": record["url"]})
+        return output
+    except UpstreamUnavailableError as e:
+        return degraded_answer(query, e)
     except Exception as e:
-        return f"Couldn't fetch Wikipedia content: {str(e)}"
+        return tool_error(f"Couldn't fetch Wikipedia content: {str(e)}")
 
-def study_tips_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"study tips for {query}"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 3
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch study tips. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
+@dataclass(frozen=True)
+class SerpToolSpec:
+    query_template: str
+    num: int
+    what: str
+    error_prefix: str
+    formatter: Callable[[str, List[SearchResult]], str]
+    engine: str = "google"
+
+    def search_query(self, query: str) -> str:
+        return self.query_template.format(query=query)
+
+# Static advice appended to some tool outputs. Kept as constants so the agent's
+# observation compressor (observations.py) can recognise and drop it.
+NOTE_ORGANIZATION_TIPS = (
+    "## Study Organization Tips\n"
+    "- Create a study schedule with specific goals for each session\n"
+    "- Use headings and subheadings to structure your notes\n"
+    "- Review and revise notes regularly\n"
+    "- Connect concepts with arrows or mind maps\n"
+    "- Highlight key definitions and formulas\n\n"
+)
+CONCEPT_MAP_INSTRUCTIONS = (
+    "To create a visual concept map:\n"
+    "1. Place the central concept in the middle\n"
+    "2. Connect related concepts with lines\n"
+    "3. Add brief descriptions on the connecting lines\n"
+    "4. Use different colors for different categories of concepts\n"
+)
+EXPERT_RESOURCES = (
+    "For deeper expertise, consider:\n"
+    "- Consulting specialized textbooks\n"
+    "- Finding subject-specific academic journals\n"
+    "- Attending relevant webinars or lectures\n"
+)
+BOILERPLATE = (NOTE_ORGANIZATION_TIPS, CONCEPT_MAP_INSTRUCTIONS, EXPERT_RESOURCES)
+
+def _short_title(title: str) -> str:
+    return title.split(' - ')[0] if ' - ' in title else title
+
+def _format_study_tips(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No study tips found for {query}. Try a different subject or topic."
+    
+    tips = "🎯 Study Tips:\n\n"
+    for result in results[:3]:
+        tips += f"• {result.title or 'Study tip'}\n"
+        if result.snippet:
+            tips += f"  {result.snippet}\n\n"
+    
+    return tips
+
+def _format_search_results(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return "No search results found."
+    
+    formatted_results = []
+    for i, result in enumerate(results[:5]):
+        title = result.title or 'No title'
+        link = result.link or 'No link'
+        snippet = result.snippet or 'No description'
+        formatted_results.append(f"{i+1}. **{title}**\n   {snippet}\n   URL: {link}")
+    
+    return "🔍 Search Results:\n\n" + "\n\n".join(formatted_results)
+
+def _format_exam_strategies(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No exam strategies found for {query}. Try a different exam type or subject."
+    
+    strategies = f"📘 Exam Strategies for {query}:\n\n"
+    for result in results[:5]:
+        strategies += f"• {result.title or 'Strategy'}\n"
+        if result.snippet:
+            strategies += f"  {result.snippet}\n\n"
+    
+    return strategies
+
+def _format_flashcards(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No content found for {query} flashcards. Try a different subject or topic."
+    
+    flashcards = f"📇 Flashcards for {query}:\n\n"
+    for i, result in enumerate(results[:5]):
+        title = result.title or f'Concept {i+1}'
+        snippet = result.snippet or 'No description available'
         
-        if not results:
-            return f"No study tips found for {query}. Try a different subject or topic."
+        flashcards += f"**Card {i+1}**\nQ: What is {_short_title(title)}?\n"
+        flashcards += f"A: {snippet}\n\n"
+    
+    return flashcards
+
+def _format_organized_notes(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No note organization tips found for {query}. Try a different subject or topic."
+    
+    note_template = f"# 📝 Organized Study Notes for {query}\n\n"
+    note_template += "## Key Concepts\n"
+    
+    for i, result in enumerate(results[:3]):
+        title = result.title or f'Concept {i+1}'
+        snippet = result.snippet or 'No information available'
         
-        tips = "🎯 Study Tips:\n\n"
-        for i, result in enumerate(results[:3]):
-            tips += f"• {result.get('title', 'Study tip')}\n"
-            if result.get('snippet'):
-                tips += f"  {result.get('snippet')}\n\n"
+        note_template += f"### {_short_title(title)}\n"
+        note_template += f"{snippet}\n\n"
+    
+    note_template += NOTE_ORGANIZATION_TIPS
+    
+    return note_template
+
+def _format_concept_map(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No concept data found for {query}. Try a different subject or topic."
+    
+    concept_map = f"🔄 Concept Map for {query}:\n\n"
+    concept_map += f"## Central Concept: {query.upper()}\n\n"
+    
+    # Create branches of the concept map
+    for i, result in enumerate(results[:5]):
+        title = result.title or f'Related Concept {i+1}'
+        snippet = result.snippet or 'No description available'
         
-        return tips
-    except Exception as e:
-        return f"Error fetching study tips: {str(e)}"
+        concept_map += f"### Branch {i+1}: {_short_title(title)}\n"
+        concept_map += f"{snippet[:150]}...\n\n"
+    
+    concept_map += CONCEPT_MAP_INSTRUCTIONS
+    
+    return concept_map
 
-def google_search_tool(query: str) -> str:
-    api_key = os.getenv("SERPAPI_API_KEY")
-    if not api_key:
-        return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-
-    params = {
-        "q": query,
-        "api_key": api_key,
-        "engine": "google",
-        "num": 5
-    }
+def _concept_label(concept: str) -> str:
+    return concept[:1].upper() + concept[1:]
 
-    try:
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch search results. Status code: {response.status_code}"
+def _format_graph_flashcards(query: str, view: ConceptView, local: bool = False) -> str:
+    flashcards = f"📇 Flashcards for {query}{' (from material found earlier)' if local else ''}:\n\n"
+    cards, answers = [], set()
+    if view.gloss:
+        cards.append((f"What is {_concept_label(view.concept)}?", view.gloss))
+        answers.add(view.gloss)
+    for related in view.related:
+        # Concepts glossed by the same sentence would get the same answer twice.
+        if not related.gloss or related.gloss in answers:
+            continue
+        answers.add(related.gloss)
+        if view.concept.split()[0] in related.gloss.lower():
+            question = f"How is {related.concept} related to {view.concept}?"
+        else:
+            question = f"What is {related.concept}?"
+        see_also = f"\nSee also: {', '.join(related.linked)}" if related.linked else ""
+        cards.append((question, related.gloss + see_also))
+    
+    for i, (question, answer) in enumerate(cards):
+        flashcards += f"**Card {i+1}**\nQ: {question}\nA: {answer}\n\n"
+    
+    return flashcards
 
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return "No search results found."
-        
-        formatted_results = []
-        for i, result in enumerate(results[:5]):
-            title = result.get('title', 'No title')
-            link = result.get('link', 'No link')
-            snippet = result.get('snippet', 'No description')
-            formatted_results.append(f"{i+1}. **{title}**\n   {snippet}\n   URL: {link}")
+def _format_graph_concept_map(query: str, view: ConceptView, local: bool = False) -> str:
+    concept_map = f"🔄 Concept Map for {query}{' (from material found earlier)' if local else ''}:\n\n"
+    concept_map += f"## Central Concept: {query.upper()}\n"
+    if view.gloss:
+        concept_map += f"{view.gloss}\n"
+    concept_map += "\n"
+    
+    for i, related in enumerate(view.related):
+        concept_map += f"### Branch {i+1}: {_concept_label(related.concept)}\n"
+        if related.gloss:
+            concept_map += f"{related.gloss[:150]}...\n"
+        if related.linked:
+            concept_map += f"Linked concepts: {', '.join(related.linked)}\n"
+        concept_map += "\n"
+    
+    concept_map += CONCEPT_MAP_INSTRUCTIONS
+    
+    return concept_map
+
+def _format_scholarly_papers(query: str, results: List[SearchResult], local: bool = False) -> str:
+    if not results:
+        return f"No scholarly papers found for {query}. Try a different academic topic."
+    
+    papers = f"📄 Scholarly Papers on {query}{' (from papers found earlier)' if local else ''}:\n\n"
+    for i, result in enumerate(results[:5]):
+        title = result.title or f'Paper {i+1}'
+        authors_text = ", ".join(result.authors) if result.authors else "Unknown authors"
+        snippet = result.snippet or 'No abstract available'
+        
+        papers += f"**{i+1}. {title}**\n"
+        papers += f"Authors: {authors_text}\n"
+        papers += f"Abstract: {snippet}\n\n"
+    
+    return papers
+
+def _format_expert_insights(query: str, results: List[SearchResult]) -> str:
+    if not results:
+        return f"No expert insights found for {query}. Try a different subject or topic."
+    
+    expert_insights = f"🎓 Expert Insights on {query}:\n\n"
+    
+    for i, result in enumerate(results[:3]):
+        title = result.title or f'Insight {i+1}'
+        snippet = result.snippet or 'No information available'
         
-        return "🔍 Search Results:\n\n" + "\n\n".join(formatted_results)
+        expert_insights += f"**Expert Point {i+1}**: {title}\n"
+        expert_insights += f"{snippet}\n\n"
+    
+    expert_insights += EXPERT_RESOURCES
+    
+    return expert_insights
+
+SERP_TOOLS = {
+    "Study Tips Tool": SerpToolSpec(
+        "study tips for {query}", 3, "study tips", "Error fetching study tips", _format_study_tips
+    ),
+    "Google Search Tool": SerpToolSpec(
+        "{query}", 5, "search results", "Error performing search", _format_search_results
+    ),
+    "Exam Strategy Tool": SerpToolSpec(
+        "exam strategies for {query}", 5, "exam strategies", "Error fetching exam strategies", _format_exam_strategies
+    ),
+    "Flashcard Generator Tool": SerpToolSpec(
+        "key concepts {query} for flashcards", 5, "flashcard content", "Error generating flashcards", _format_flashcards
+    ),
+    "Note Organizer Tool": SerpToolSpec(
+        "how to organize study notes for {query}", 3, "note organization tips", "Error organizing notes", _format_organized_notes
+    ),
+    "Concept Mapper Tool": SerpToolSpec(
+        "main concepts related to {query}", 5, "concept data", "Error creating concept map", _format_concept_map
+    ),
+    "Scholarly Papers Tool": SerpToolSpec(
+        "scholarly papers on {query}", 10, "scholarly papers", "Error fetching scholarly papers", _format_scholarly_papers,
+        engine="google_scholar",
+    ),
+    "Subject Expert Tool": SerpToolSpec(
+        "expert insights on {query}", 3, "expert insights", "Error connecting with subject experts", _format_expert_insights
+    ),
+}
+
+def serp_search(tool: str, query: str, engine: str = "google", num: int = 5) -> List[SearchResult]:
+    results = cached_fetch(
+        tool,
+        query,
+        lambda: [asdict(result) for result in get_serpapi_client().search(query, engine=engine, num=num)],
+        engine=engine,
+        num=num,
+    )
+    return [SearchResult(**result) for result in results]
+
+def result_texts(results: List[SearchResult]) -> List[str]:
+    # Site names after " - " or " | " in titles are not concepts.
+    return [f"{re.split(r' [-|–] ', result.title or '')[0]}. {result.snippet or ''}" for result in results]
+
+# The steps of a SerpAPI tool around its search. async_tools runs the same steps
+# around an async search, so the two versions of a tool can't drift apart.
+
+def serp_tool_local(tool: str, query: str) -> Tuple[Optional[str], Optional[List[dict]]]:
+    # Flashcards and concept maps come from the concept graph, and papers from the
+    # local index, when those know enough about the query; SerpAPI is only asked
+    # otherwise. Returns that answer (or None) and any local hits to build on.
+    if tool in GRAPH_FORMATTERS:
+        return local_graph_answer(tool, query), None
+    if tool == "Scholarly Papers Tool":
+        hits = local_paper_hits(query)
+        return (local_papers_answer(query, hits) if has_local_recall(hits) else None), hits
+    return None, None
+
+def serp_tool_answer(tool: str, query: str, results: List[SearchResult], hits: Optional[List[dict]]) -> str:
+    if tool in GRAPH_FORMATTERS:
+        return graph_tool_answer(tool, query, results)
+    if tool == "Scholarly Papers Tool":
+        return scholarly_papers_answer(query, results, hits)
+    output = SERP_TOOLS[tool].formatter(query, results)
+    if results:
+        learn_concepts(result_texts(results))
+        remember(output, source=tool, metadata={"query": query})
+    return output
+
+def serp_tool_failure(tool: str, query: str, error: Exception, hits: Optional[List[dict]]) -> str:
+    spec = SERP_TOOLS[tool]
+    if isinstance(error, UpstreamUnavailableError):
+        if tool in GRAPH_FORMATTERS:
+            return graph_tool_degraded(tool, query, error)
+        if tool == "Scholarly Papers Tool":
+            return scholarly_papers_degraded(query, hits, error)
+        return degraded_answer(query, error)
+    if isinstance(error, SerpApiError):
+        return tool_error(error.tool_message(spec.what))
+    return tool_error(f"{spec.error_prefix}: {str(error)}")
+
+def run_serp_tool(tool: str, query: str) -> str:
+    answer, hits = serp_tool_local(tool, query)
+    if answer is not None:
+        return answer
+    spec = SERP_TOOLS[tool]
+    try:
+        results = serp_search(tool, spec.search_query(query), engine=spec.engine, num=spec.num)
+        return serp_tool_answer(tool, query, results, hits)
     except Exception as e:
-        return f"Error performing search: {str(e)}"
+        return serp_tool_failure(tool, query, e, hits)
+
+def study_tips_tool(query: str) -> str:
+    return run_serp_tool("Study Tips Tool", query)
+
+def google_search_tool(query: str) -> str:
+    return run_serp_tool("Google Search Tool", query)
 
 def extract_video_id(video_input: str) -> str:
     if "youtube.com" in video_input or "youtu.be" in video_input:
@@ -123,6 +402,50 @@ def extract_video_id(video_input: str) -> str:
     
     return ""
 
+_transcript_fetcher = None
+
+def get_transcript_fetcher():
+    # A fetcher takes a video ID and returns [{"text", "start", "duration"}, ...].
+    if _transcript_fetcher is not None:
+        return _transcript_fetcher
+    # Imported on first use so loading the other tools does not pull it in.
+    from youtube_transcript_api import YouTubeTranscriptApi
+    return YouTubeTranscriptApi.get_transcript
+
+def set_transcript_fetcher(fetcher):
+    global _transcript_fetcher
+    _transcript_fetcher = fetcher
+
+# Errors about one particular video; anything else counts against YouTube's health.
+_VIDEO_ERRORS = {
+    "InvalidVideoId", "NoTranscriptAvailable", "NoTranscriptFound", "NotTranslatable",
+    "TranscriptsDisabled", "TranslationLanguageNotAvailable", "VideoUnavailable",
+}
+
+def _is_youtube_failure(error: Exception) -> bool:
+    return type(error).__name__ not in _VIDEO_ERRORS
+
+def fetch_transcript_segments(video_id: str) -> List[list]:
+    with get_upstream("YouTube").call(is_failure=_is_youtube_failure):
+        # youtube_transcript_api takes no timeout; stop waiting at the deadline instead.
+        transcript = call_with_deadline(get_transcript_fetcher(), video_id, default_timeout=Config.YOUTUBE_TIMEOUT)
+    # Cached as compact [start, end, text] windows rather than per-caption dicts.
+    return [[segment.start, segment.end, segment.text] for segment in iter_segments(transcript or [])]
+
+def summarize_transcript(video_id: str) -> List[Segment]:
+    rows = cached_fetch(
+        "YouTube Transcript",
+        video_id,
+        lambda: fetch_transcript_segments(video_id),
+        video_id=video_id,  # IDs are case-sensitive; the normalized query is not
+        window=Config.TRANSCRIPT_WINDOW_SECONDS,
+    )
+    return summarize_segments(Segment(*row) for row in rows)
+
+def format_transcript_summary(video_url: str, passages: List[Segment]) -> str:
+    lines = [f"- [{format_timestamp(passage.start)}]({video_url}&t={int(passage.start)}s) {passage.text}" for passage in passages]
+    return f"🎬 YouTube Video Summary:\n\nSource: {video_url}\n\nKey passages:\n" + "\n".join(lines)
+
 def youtube_summary_tool(video_input: str) -> str:
     try:
         video_id = extract_video_id(video_input)
@@ -130,263 +453,86 @@ def youtube_summary_tool(video_input: str) -> str:
         if not video_id:
             return "Invalid YouTube video ID or URL. Please provide a valid YouTube video ID or URL."
         
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        passages = summarize_transcript(video_id)
         
-        if not transcript:
+        if not passages:
             return "No transcript available for this video."
         
         video_url = f"https://www.youtube.com/watch?v={video_id}"
         
-        full_text = " ".join([entry["text"] for entry in transcript])
-        
-        # Split into sentences and take the first 15-20 sentences
-        sentences = re.split(r'[.!?]+', full_text)
-        summary_text = ". ".join([s.strip() for s in sentences[:20] if s.strip()]) + "."
-        
-        return f"🎬 YouTube Video Summary:\n\nSource: {video_url}\n\n{summary_text}"
+        output = format_transcript_summary(video_url, passages)
+        remember(output, source="YouTube Summary Tool", metadata={"url": video_url})
+        return output
         
+    except UpstreamUnavailableError as e:
+        return degraded_answer(video_input, e)
     except Exception as e:
-        return f"Couldn't fetch or process YouTube transcript: {str(e)}"
+        return tool_error(f"Couldn't fetch or process YouTube transcript: {str(e)}")
 
 def exam_strategy_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"exam strategies for {query}"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 5
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch exam strategies. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return f"No exam strategies found for {query}. Try a different exam type or subject."
-        
-        strategies = f"📘 Exam Strategies for {query}:\n\n"
-        for i, result in enumerate(results[:5]):
-            strategies += f"• {result.get('title', 'Strategy')}\n"
-            if result.get('snippet'):
-                strategies += f"  {result.get('snippet')}\n\n"
-        
-        return strategies
-    except Exception as e:
-        return f"Error fetching exam strategies: {str(e)}"
+    return run_serp_tool("Exam Strategy Tool", query)
+
+GRAPH_FORMATTERS = {
+    "Flashcard Generator Tool": _format_graph_flashcards,
+    "Concept Mapper Tool": _format_graph_concept_map,
+}
+
+def local_graph_answer(tool: str, query: str) -> Optional[str]:
+    view = concept_view(query)
+    return GRAPH_FORMATTERS[tool](query, view, local=True) if has_graph_coverage(view) else None
+
+def graph_tool_answer(tool: str, query: str, results: List[SearchResult]) -> str:
+    # The results go into the concept graph first, so the answer draws on them and
+    # on everything related that earlier tools found.
+    spec = SERP_TOOLS[tool]
+    learn_concepts(result_texts(results))
+    view = concept_view(query)
+    output = GRAPH_FORMATTERS[tool](query, view) if view is not None and view.related else spec.formatter(query, results)
+    if results:
+        remember(output, source=tool, metadata={"query": query})
+    return output
+
+def graph_tool_degraded(tool: str, query: str, error: UpstreamUnavailableError) -> str:
+    view = concept_view(query)
+    if view is not None and view.related:
+        return f"⚠️ {error}. Showing concepts found earlier instead.\n\n" + GRAPH_FORMATTERS[tool](query, view, local=True)
+    return degraded_answer(query, error)
 
 def flashcard_generator_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"key concepts {query} for flashcards"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 5
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch flashcard content. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return f"No content found for {query} flashcards. Try a different subject or topic."
-        
-        flashcards = f"📇 Flashcards for {query}:\n\n"
-        for i, result in enumerate(results[:5]):
-            title = result.get('title', f'Concept {i+1}')
-            snippet = result.get('snippet', 'No description available')
-            
-            flashcards += f"**Card {i+1}**\nQ: What is {title.split(' - ')[0] if ' - ' in title else title}?\n"
-            flashcards += f"A: {snippet}\n\n"
-        
-        return flashcards
-    except Exception as e:
-        return f"Error generating flashcards: {str(e)}"
+    return run_serp_tool("Flashcard Generator Tool", query)
 
 def note_organizer_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"how to organize study notes for {query}"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 3
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch note organization tips. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return f"No note organization tips found for {query}. Try a different subject or topic."
-        
-        note_template = f"# 📝 Organized Study Notes for {query}\n\n"
-        note_template += "## Key Concepts\n"
-        
-        for i, result in enumerate(results[:3]):
-            title = result.get('title', f'Concept {i+1}')
-            snippet = result.get('snippet', 'No information available')
-            
-            note_template += f"### {title.split(' - ')[0] if ' - ' in title else title}\n"
-            note_template += f"{snippet}\n\n"
-        
-        note_template += "## Study Organization Tips\n"
-        note_template += "- Create a study schedule with specific goals for each session\n"
-        note_template += "- Use headings and subheadings to structure your notes\n"
-        note_template += "- Review and revise notes regularly\n"
-        note_template += "- Connect concepts with arrows or mind maps\n"
-        note_template += "- Highlight key definitions and formulas\n\n"
-        
-        return note_template
-    except Exception as e:
-        return f"Error organizing notes: {str(e)}"
+    return run_serp_tool("Note Organizer Tool", query)
 
 def concept_mapper_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"main concepts related to {query}"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 5
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch concept data. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return f"No concept data found for {query}. Try a different subject or topic."
-        
-        concept_map = f"🔄 Concept Map for {query}:\n\n"
-        concept_map += f"## Central Concept: {query.upper()}\n\n"
-        
-        # Create branches of the concept map
-        for i, result in enumerate(results[:5]):
-            title = result.get('title', f'Related Concept {i+1}')
-            snippet = result.get('snippet', 'No description available')
-            
-            concept_map += f"### Branch {i+1}: {title.split(' - ')[0] if ' - ' in title else title}\n"
-            concept_map += f"{snippet[:150]}...\n\n"
-        
-        concept_map += "To create a visual concept map:\n"
-        concept_map += "1. Place the central concept in the middle\n"
-        concept_map += "2. Connect related concepts with lines\n"
-        concept_map += "3. Add brief descriptions on the connecting lines\n"
-        concept_map += "4. Use different colors for different categories of concepts\n"
-        
-        return concept_map
-    except Exception as e:
-        return f"Error creating concept map: {str(e)}"
+    return run_serp_tool("Concept Mapper Tool", query)
+
+def _paper_result(paper: dict) -> SearchResult:
+    return SearchResult(paper.get("title"), paper.get("link"), paper.get("snippet"), paper.get("authors") or [])
+
+def local_papers_answer(query: str, hits: List[dict]) -> str:
+    return _format_scholarly_papers(query, [_paper_result(hit) for hit in hits], local=True)
+
+def scholarly_papers_answer(query: str, results: List[SearchResult], hits: List[dict]) -> str:
+    # Every paper SerpAPI returned goes into the local index; the answer lists them
+    # ahead of the weaker local hits, each paper once.
+    spec = SERP_TOOLS["Scholarly Papers Tool"]
+    fetched = [asdict(result) for result in results]
+    index_papers(fetched)
+    learn_concepts(result_texts(results))
+    papers = dedupe_papers(fetched + [{key: hit.get(key) for key in ("title", "link", "snippet", "authors")} for hit in hits])
+    output = spec.formatter(query, [_paper_result(paper) for paper in papers])
+    if results:
+        remember(output, source="Scholarly Papers Tool", metadata={"query": query})
+    return output
+
+def scholarly_papers_degraded(query: str, hits: List[dict], error: UpstreamUnavailableError) -> str:
+    if hits:
+        return f"⚠️ {error}. Showing papers found earlier instead.\n\n" + local_papers_answer(query, hits)
+    return degraded_answer(query, error)
 
 def scholarly_papers_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        search_query = f"scholarly papers on {query}"
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google_scholar",
-            "num": 5
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch scholarly papers. Status code: {response.status_code}"
-        
-        data = response.json()
-        organic_results = data.get("organic_results", [])
-        
-        if not organic_results:
-            return f"No scholarly papers found for {query}. Try a different academic topic."
-        
-        papers = f"📄 Scholarly Papers on {query}:\n\n"
-        for i, result in enumerate(organic_results[:5]):
-            title = result.get('title', f'Paper {i+1}')
-            authors = result.get('publication_info', {}).get('authors', [])
-            authors_text = ", ".join(authors) if authors else "Unknown authors"
-            snippet = result.get('snippet', 'No abstract available')
-            
-            papers += f"**{i+1}. {title}**\n"
-            papers += f"Authors: {authors_text}\n"
-            papers += f"Abstract: {snippet}\n\n"
-        
-        return papers
-    except Exception as e:
-        return f"Error fetching scholarly papers: {str(e)}"
+    return run_serp_tool("Scholarly Papers Tool", query)
 
 def subject_expert_tool(query: str) -> str:
-    try:
-        api_key = os.getenv("SERPAPI_API_KEY")
-        if not api_key:
-            return "Missing SerpAPI key. Please set the SERPAPI_API_KEY environment variable."
-        
-        subject = query.split()[0] if query.split() else "general"
-        search_query = f"expert insights on {query}"
-        
-        params = {
-            "q": search_query,
-            "api_key": api_key,
-            "engine": "google",
-            "num": 3
-        }
-        
-        response = requests.get("https://serpapi.com/search", params=params)
-        if response.status_code != 200:
-            return f"Failed to fetch expert insights. Status code: {response.status_code}"
-        
-        data = response.json()
-        results = data.get("organic_results", [])
-        
-        if not results:
-            return f"No expert insights found for {query}. Try a different subject or topic."
-        
-        expert_insights = f"🎓 Expert Insights on {query}:\n\n"
-        
-        for i, result in enumerate(results[:3]):
-            title = result.get('title', f'Insight {i+1}')
-            snippet = result.get('snippet', 'No information available')
-            
-            expert_insights += f"**Expert Point {i+1}**: {title}\n"
-            expert_insights += f"{snippet}\n\n"
-        
-        expert_insights += "For deeper expertise, consider:\n"
-        expert_insights += "- Consulting specialized textbooks\n"
-        expert_insights += "- Finding subject-specific academic journals\n"
-        expert_insights += "- Attending relevant webinars or lectures\n"
-        
-        return expert_insights
-    except Exception as e:
-        return f"Error connecting with subject experts: {str(e)}"
\ No newline at end of file
+    return run_serp_tool("Subject Expert Tool", query)
@@ -0,0 +1,180 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from config import Config
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# Attributes holding the student's own words; kept out of exported traces by default.
+_TEXT_ATTRIBUTES = frozenset({"query", "input"})
+
+class Span:
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.children: List["Span"] = []
+        self._lock = threading.Lock()
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self, child: "Span"):
+        with self._lock:
+            self.children.append(child)
+
+    def finish(self, **attributes):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+            self.attributes.update(attributes)
+            if self.kind in ("llm", "tool", "request"):
+                _histograms.observe(f"{self.kind}:{self.name}", self.duration)
+        return self
+
+    def walk(self):
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def to_dict(self, include_text: bool = True) -> dict:
+        attributes = self.attributes
+        if not include_text:
+            attributes = {key: value for key, value in attributes.items() if key not in _TEXT_ATTRIBUTES}
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 2),
+            "attributes": attributes,
+            "children": [child.to_dict(include_text) for child in list(self.children)],
+        }
+
+    def breakdown(self) -> List[dict]:
+        # Flat per-span rows for the UI, in start order, skipping the root itself.
+        rows = []
+        for span in sorted(self.walk(), key=lambda span: span.start_time):
+            if span is self:
+                continue
+            row = {"kind": span.kind, "name": span.name}
+            if span.duration is not None:
+                row["ms"] = round(span.duration * 1000, 1)
+            for key in ("prompt_tokens", "completion_tokens", "output_chars", "hit"):
+                if key in span.attributes:
+                    row[key] = span.attributes[key]
+            rows.append(row)
+        return rows
+
+class LatencyHistograms:
+    # Bounded reservoir of recent samples per key; percentiles are computed on demand.
+    def __init__(self, max_samples: int = Config.TRACE_HISTOGRAM_SAMPLES):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def summary(self) -> Dict[str, dict]:
+        # numpy is imported here so that importing this module stays cheap for the UI.
+        import numpy as np
+        with self._lock:
+            snapshot = {key: np.fromiter(samples, dtype=np.float64) for key, samples in self._samples.items()}
+        summary = {}
+        for key, samples in sorted(snapshot.items()):
+            if not len(samples):
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+            summary[key] = {
+                "count": int(len(samples)),
+                "p50_ms": round(float(p50), 1),
+                "p95_ms": round(float(p95), 1),
+                "p99_ms": round(float(p99), 1),
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+_histograms = LatencyHistograms()
+_log_lock = threading.Lock()
+_trace_logger = logging.getLogger(__name__ + ".export")
+_trace_logger.propagate = False
+_trace_logger.setLevel(logging.INFO)
+_trace_handler: Optional[logging.Handler] = None
+
+def get_histograms() -> LatencyHistograms:
+    return _histograms
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def start_trace(name: str, **attributes) -> Span:
+    return Span(name, "request", **attributes)
+
+def activate(span: Span):
+    # Lower-level form of use_span for callers whose start and end are separate calls.
+    return _current_span.set(span)
+
+def deactivate(token):
+    _current_span.reset(token)
+
+@contextmanager
+def use_span(span: Span):
+    token = activate(span)
+    try:
+        yield span
+    finally:
+        deactivate(token)
+
+@contextmanager
+def span(name: str, kind: str, **attributes):
+    child = Span(name, kind, parent=current_span(), **attributes)
+    with use_span(child):
+        try:
+            yield child
+        finally:
+            child.finish()
+
+def record_event(name: str, kind: str = "cache", **attributes):
+    # Zero-duration span (e.g. a cache hit) attached to whatever span is active.
+    parent = current_span()
+    if parent is not None:
+        Span(name, kind, parent=parent, **attributes).duration = 0.0
+
+def _trace_log() -> logging.Logger:
+    # The handler is rebuilt when TRACE_LOG_PATH changes (the benchmarks point it
+    # at a scratch directory after import).
+    global _trace_handler
+    with _log_lock:
+        path = Config.TRACE_LOG_PATH
+        if _trace_handler is None or _trace_handler.baseFilename != os.path.abspath(path):
+            if _trace_handler is not None:
+                _trace_logger.removeHandler(_trace_handler)
+                _trace_handler.close()
+            _trace_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=Config.TRACE_LOG_MAX_BYTES, backupCount=Config.TRACE_LOG_BACKUPS,
+                encoding="utf-8", delay=True,
+            )
+            _trace_handler.setFormatter(logging.Formatter("%(message)s"))
+            _trace_logger.addHandler(_trace_handler)
+    return _trace_logger
+
+def export_trace(root: Span):
+    if not Config.TRACE_LOG_PATH:
+        return
+    _trace_log().info(json.dumps(root.to_dict(Config.TRACE_INCLUDE_TEXT), default=str))
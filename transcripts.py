@@ -0,0 +1,129 @@
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+import numpy as np
+from config import Config
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_ANNOTATION_RE = re.compile(r"\[[^\]]*\]")
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*$")
+
+# Common words and spoken filler carry no topic signal.
+STOPWORDS = frozenset(
+    "a about after again all also am an and any are as at be because been before being between both but by "
+    "can could did do does doing down during each few for from further had has have having he her here hers "
+    "him his how i if in into is it its just me more most my no nor not now of off on once only or other our "
+    "out over own same she should so some such than that the their them then there these they this those "
+    "through to too under until up very was we were what when where which while who whom why will with would "
+    "you your yours um uh uhm yeah okay ok like gonna wanna gotta right actually basically really going get "
+    "got know think see say said thing things kind sort lot lots let one two well way want need mean today".split()
+)
+
+@dataclass
+class Segment:
+    start: float
+    end: float
+    text: str
+
+def iter_segments(entries: Iterable[dict], window_seconds: float = Config.TRANSCRIPT_WINDOW_SECONDS) -> Iterator[Segment]:
+    # Groups caption entries into windows of about `window_seconds`, consuming the
+    # entries one at a time. Auto-generated captions have no punctuation, so time is
+    # the primary boundary; once the captions have shown punctuation, a window is
+    # closed at a sentence end, up to half a window late.
+    parts, start, end = [], None, 0.0
+    punctuated = False
+    for entry in entries:
+        text = " ".join(_ANNOTATION_RE.sub(" ", entry.get("text", "")).split())
+        if not text:
+            continue
+        entry_start = float(entry.get("start", 0.0))
+        if parts and entry_start - start >= window_seconds:
+            if _SENTENCE_END_RE.search(parts[-1]) or not punctuated or entry_start - start >= window_seconds * 1.5:
+                yield Segment(start, end, " ".join(parts))
+                parts = []
+        if not parts:
+            start = entry_start
+        parts.append(text)
+        punctuated = punctuated or bool(_SENTENCE_END_RE.search(text))
+        end = max(end, entry_start + float(entry.get("duration", 0.0)))
+    if parts:
+        yield Segment(start, end, " ".join(parts))
+
+def _terms(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 2 and token not in STOPWORDS]
+
+class PassageScorer:
+    # Hashed TF-IDF over transcript windows, built incrementally. Each window is kept
+    # as sparse (feature, count) arrays plus the start of its text, so memory grows
+    # with the number of windows rather than the length of the transcript.
+    def __init__(self, features: int = Config.TRANSCRIPT_HASH_FEATURES, passage_words: int = Config.TRANSCRIPT_PASSAGE_WORDS):
+        self.features = features
+        self.passage_words = passage_words
+        self.segments: List[Segment] = []
+        self._indices: List[np.ndarray] = []
+        self._counts: List[np.ndarray] = []
+        self._df = np.zeros(features, dtype=np.int32)
+        self._weights: List[np.ndarray] = []
+
+    def add(self, segment: Segment):
+        terms = _terms(segment.text)
+        hashed = np.fromiter((zlib.crc32(term.encode("utf-8")) for term in terms), dtype=np.int64, count=len(terms))
+        indices, counts = np.unique(hashed % self.features, return_counts=True)
+        self._df[indices] += 1
+        self._indices.append(indices.astype(np.int32))
+        self._counts.append(counts.astype(np.float32))
+        words = segment.text.split()
+        preview = " ".join(words[:self.passage_words]) + (" …" if len(words) > self.passage_words else "")
+        self.segments.append(Segment(segment.start, segment.end, preview))
+
+    def scores(self) -> np.ndarray:
+        # Degree centrality of the TextRank similarity graph: the summed cosine
+        # similarity of a window to every window equals its dot product with the sum
+        # of all (normalised) window vectors, so no n x n matrix is needed.
+        n = len(self.segments)
+        if n == 0:
+            return np.zeros(0)
+        lengths = np.fromiter((len(indices) for indices in self._indices), dtype=np.int64, count=n)
+        indices = np.concatenate(self._indices)
+        rows = np.repeat(np.arange(n), lengths)
+        idf = np.log((1 + n) / (1 + self._df[indices])) + 1.0
+        weights = (1.0 + np.log(np.concatenate(self._counts))) * idf
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n))
+        weights /= np.where(norms == 0, 1.0, norms)[rows]
+        self._weights = np.split(weights, np.cumsum(lengths)[:-1])
+        centroid = np.bincount(indices, weights=weights, minlength=self.features)
+        return np.bincount(rows, weights=weights * centroid[indices], minlength=n)
+
+    def similarity(self, i: int, j: int) -> float:
+        # Cosine similarity of two windows; valid after scores().
+        _, left, right = np.intersect1d(self._indices[i], self._indices[j], assume_unique=True, return_indices=True)
+        return float(self._weights[i][left] @ self._weights[j][right])
+
+    def key_passages(self, count: int = Config.TRANSCRIPT_SUMMARY_PASSAGES, max_overlap: float = 0.7) -> List[Segment]:
+        # The best window from each of `count` consecutive stretches of the video, so
+        # the summary covers the whole lecture instead of bunching up on one topic.
+        # Windows that mostly repeat an already picked one (recaps) are passed over.
+        scores = self.scores()
+        if len(scores) == 0:
+            return []
+        picked = []
+        for section in np.array_split(np.arange(len(scores)), min(count, len(scores))):
+            for candidate in section[np.argsort(-scores[section], kind="stable")]:
+                if scores[candidate] <= 0:
+                    break
+                if all(self.similarity(candidate, other) < max_overlap for other in picked):
+                    picked.append(candidate)
+                    break
+        return [self.segments[i] for i in picked]
+
+def summarize_segments(segments: Iterable[Segment], count: int = Config.TRANSCRIPT_SUMMARY_PASSAGES) -> List[Segment]:
+    scorer = PassageScorer()
+    for segment in segments:
+        scorer.add(segment)
+    return scorer.key_passages(count)
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
@@ -0,0 +1,342 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+from config import Config
+from tool_registry import tool_error
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+class HashingEmbedder:
+    # Deterministic, dependency-free embedder (signed feature hashing of unigrams
+    # and bigrams). Used offline and in benchmarks in place of the real model.
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str):
+        tokens = _TOKEN_RE.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(digest % self.dim)
+                signs.append(1.0 if digest & 0x80000000 else -1.0)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), signs)
+        return _normalize(matrix)
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str = Config.EMBEDDING_MODEL_NAME, batch_size: int = Config.EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                # Imported lazily: loading torch costs seconds and is only needed once
+                # something is actually embedded.
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return vectors.astype(np.float32, copy=False)
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _header_bytes(capacity: int, dim: int) -> bytes:
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+        "fortran_order": False,
+        "shape": (capacity, dim),
+    })
+    return buffer.getvalue()
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def chunk_text(text: str, max_chars: int = Config.VECTOR_CHUNK_CHARS) -> List[str]:
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        while len(paragraph) > max_chars:
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+class VectorStore:
+    # Rows live in a preallocated float32 .npy file opened as a memmap; the number of
+    # valid rows is the number of lines in the JSON-lines metadata sidecar. Appends
+    # write the new rows in place and then the sidecar lines, so a crash mid-append
+    # leaves at most some unreferenced rows, never metadata without a vector.
+    def __init__(self, path: str = Config.VECTOR_STORE_PATH, dim: Optional[int] = None):
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".meta.jsonl"
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._metadata: List[dict] = []
+        self._hashes = set()
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        matrix = np.load(self.path, mmap_mode="r")
+        if self.dim is not None and matrix.shape[1] != self.dim:
+            raise ValueError(f"{self.path} stores {matrix.shape[1]}-d vectors, expected {self.dim}-d")
+        self.dim = matrix.shape[1]
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r+b") as handle:
+                valid = 0
+                for line in handle:
+                    # A crash mid-append can leave a partial last line; everything
+                    # from there on is dropped so the next append starts cleanly.
+                    if not line.endswith(b"\n") or len(self._metadata) >= matrix.shape[0]:
+                        break
+                    if line.strip():
+                        try:
+                            self._metadata.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            break
+                    valid += len(line)
+                if valid < os.fstat(handle.fileno()).st_size:
+                    handle.truncate(valid)
+        self._hashes = {record["hash"] for record in self._metadata}
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+    @property
+    def capacity(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return np.load(self.path, mmap_mode="r").shape[0]
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self.capacity
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, Config.VECTOR_STORE_INITIAL_CAPACITY)
+        if capacity == 0:
+            np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim)).flush()
+        else:
+            header = _header_bytes(new_capacity, self.dim)
+            if len(header) != len(_header_bytes(capacity, self.dim)):
+                # Practically unreachable (headers are padded to 64 bytes), but a
+                # different header length would shift every row, so copy instead.
+                old = np.load(self.path)
+                grown = np.lib.format.open_memmap(self.path + ".tmp", mode="w+", dtype=np.float32, shape=(new_capacity, self.dim))
+                grown[:capacity] = old
+                grown.flush()
+                del grown
+                os.replace(self.path + ".tmp", self.path)
+            else:
+                with open(self.path, "r+b") as handle:
+                    handle.write(header)
+                    handle.truncate(len(header) + new_capacity * self.dim * 4)
+        self._matrix = None
+
+    def _rows(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.load(self.path, mmap_mode="r")
+        return self._matrix[:len(self._metadata)]
+
+    def append(self, vectors: np.ndarray, records: List[dict]) -> int:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records must have the same length")
+        if not len(records):
+            return 0
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            start = len(self._metadata)
+            self._ensure_capacity(start + len(records))
+            writable = np.load(self.path, mmap_mode="r+")
+            writable[start:start + len(records)] = vectors
+            writable.flush()
+            del writable
+            with open(self.meta_path, "a", encoding="utf-8") as handle:
+                for record in records:
+                    handle.write(json.dumps(record) + "\n")
+            self._metadata.extend(records)
+            self._hashes.update(record["hash"] for record in records)
+            self._matrix = None
+        return len(records)
+
+    def contains(self, text: str) -> bool:
+        return _text_hash(text) in self._hashes
+
+    def search(self, query_vector: np.ndarray, k: int = 5) -> List[dict]:
+        return self.search_many(np.asarray(query_vector, dtype=np.float32)[None, :], k)[0]
+
+    def search_many(self, query_vectors: np.ndarray, k: int = 5) -> List[List[dict]]:
+        with self._lock:
+            if not self._metadata:
+                return [[] for _ in range(len(query_vectors))]
+            rows = self._rows()
+            metadata = list(self._metadata)
+        # Rows and queries are unit length, so one matrix product gives cosine scores.
+        scores = np.asarray(query_vectors, dtype=np.float32) @ rows.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-query_scores[candidates])]
+            results.append([{**metadata[i], "score": float(query_scores[i])} for i in ordered])
+        return results
+
+class IngestionPipeline:
+    # Texts are queued and embedded in batches on a background thread so tools and
+    # the UI never wait on the embedding model.
+    def __init__(self, store: VectorStore, embedder, batch_size: int = Config.EMBEDDING_BATCH_SIZE):
+        self.store = store
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _prepare(self, text: str, source: str, metadata: Optional[Dict]) -> List[dict]:
+        return [
+            {"hash": _text_hash(chunk), "text": chunk, "source": source, "metadata": metadata or {}}
+            for chunk in chunk_text(text)
+            if not self.store.contains(chunk)
+        ]
+
+    def ingest(self, texts: List[str], source: str, metadata: Optional[Dict] = None) -> int:
+        records, seen = [], set()
+        for text in texts:
+            for record in self._prepare(text, source, metadata):
+                if record["hash"] not in seen:
+                    seen.add(record["hash"])
+                    records.append(record)
+        added = 0
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            added += self.store.append(self.embedder.embed([record["text"] for record in batch]), batch)
+        return added
+
+    def add(self, text: str, source: str, metadata: Optional[Dict] = None):
+        self._queue.put((text, source, metadata))
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="vector-ingest", daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for text, source, metadata in items:
+                    self.ingest([text], source, metadata)
+            except Exception:
+                logger.exception("Vector store ingestion failed")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+    def search(self, query: str, k: int = Config.VECTOR_SEARCH_TOP_K) -> List[dict]:
+        if not len(self.store):
+            return []
+        return self.store.search(self.embedder.embed([query])[0], k)
+
+_embedder = None
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_embedder():
+    global _embedder
+    with _pipeline_lock:
+        if _embedder is None:
+            if Config.EMBEDDING_BACKEND == "hashing":
+                _embedder = HashingEmbedder()
+            else:
+                _embedder = SentenceTransformerEmbedder()
+        return _embedder
+
+def set_embedder(embedder):
+    global _embedder, _pipeline
+    with _pipeline_lock:
+        _embedder = embedder
+        _pipeline = None
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    global _pipeline
+    embedder = get_embedder()
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = IngestionPipeline(VectorStore(Config.VECTOR_STORE_PATH), embedder)
+        return _pipeline
+
+def remember(text: str, source: str, metadata: Optional[Dict] = None):
+    if Config.VECTOR_STORE_ENABLED:
+        get_ingestion_pipeline().add(text, source, metadata)
+
+def local_hits(query: str) -> List[dict]:
+    return [hit for hit in get_ingestion_pipeline().search(query) if hit["score"] >= Config.VECTOR_MIN_SCORE]
+
+def format_local_hits(query: str, hits: List[dict]) -> str:
+    answer = f"🗂️ From your saved notes and earlier results for {query}:\n\n"
+    for i, hit in enumerate(hits):
+        answer += f"**{i+1}. {hit['source']}** (similarity {hit['score']:.2f})\n{hit['text']}\n\n"
+    return answer
+
+def local_knowledge_tool(query: str) -> str:
+    try:
+        hits = local_hits(query)
+        if not hits:
+            return f"No saved notes or earlier results match '{query}'. Use the online tools instead."
+        return format_local_hits(query, hits)
+    except Exception as e:
+        return tool_error(f"Error searching local notes: {str(e)}")
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+from deadline import remaining_timeout
+from ratelimit import get_upstream
+
+DEFAULT_API_URL = "https://en.wikipedia.org/w/api.php"
+USER_AGENT = "AI-Study-Assistant/1.0 (https://github.com/Praveena1307/AI-STUDY-ASSISTANT)"
+
+# A transport takes (url, params, timeout) and returns the decoded JSON body.
+Transport = Callable[[str, dict, float], dict]
+
+class WikipediaError(Exception):
+    pass
+
+@dataclass
+class WikiArticle:
+    title: str
+    url: str
+    extract: str
+    is_disambiguation: bool = False
+    disambiguation_options: List[str] = field(default_factory=list)
+
+    def summary(self, sentences: int = 5) -> str:
+        parts = re.split(r"(?<=[.!?])\s+", self.extract.strip())
+        return " ".join(parts[:sentences])
+
+class RequestsTransport:
+    def __init__(self, pool_size: int = Config.WIKIPEDIA_POOL_SIZE):
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __call__(self, url: str, params: dict, timeout: float) -> dict:
+        response = self.session.get(url, params=params, timeout=timeout)
+        if response.status_code != 200:
+            raise WikipediaError(f"Wikipedia API returned status code {response.status_code}")
+        return response.json()
+
+def _base_params() -> dict:
+    # extracts + info + pageprops in one request: intro text, canonical URL and the
+    # disambiguation flag.
+    return {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "redirects": 1,
+        "prop": "extracts|info|pageprops",
+        "exintro": 1,
+        "explaintext": 1,
+        "exlimit": "max",
+        "inprop": "url",
+        "ppprop": "disambiguation",
+    }
+
+def _parse_pages(data: dict) -> Dict[str, WikiArticle]:
+    if "error" in data:
+        raise WikipediaError(data["error"].get("info", "Wikipedia API error"))
+
+    articles = {}
+    for page in data.get("query", {}).get("pages", []):
+        if page.get("missing") or page.get("invalid"):
+            continue
+        articles[page["title"]] = WikiArticle(
+            title=page["title"],
+            url=page.get("fullurl", ""),
+            extract=page.get("extract", ""),
+            is_disambiguation="disambiguation" in page.get("pageprops", {}),
+        )
+    return articles
+
+def _resolve_title(data: dict, title: str) -> str:
+    query = data.get("query", {})
+    for mapping in ("normalized", "redirects"):
+        for entry in query.get(mapping, []):
+            if entry.get("from") == title:
+                title = entry.get("to", title)
+    return title
+
+def _pending_disambiguations(articles) -> List[WikiArticle]:
+    return [article for article in articles if article and article.is_disambiguation]
+
+def _links_params(pending: List[WikiArticle]) -> dict:
+    return {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "prop": "links",
+        "titles": "|".join(article.title for article in pending),
+        "plnamespace": 0,
+        "pllimit": "max",
+    }
+
+def _apply_links(pending: List[WikiArticle], data: dict):
+    links = {
+        page["title"]: [link["title"] for link in page.get("links", [])]
+        for page in data.get("query", {}).get("pages", [])
+    }
+    for article in pending:
+        article.disambiguation_options = links.get(article.title, [])
+
+class WikipediaClient:
+    def __init__(
+        self,
+        transport: Optional[Transport] = None,
+        api_url: Optional[str] = None,
+        timeout: float = Config.WIKIPEDIA_TIMEOUT,
+    ):
+        self.transport = transport or RequestsTransport()
+        self.api_url = api_url or os.getenv("WIKIPEDIA_API_URL") or DEFAULT_API_URL
+        self.timeout = timeout
+
+    def _get(self, params: dict) -> dict:
+        with get_upstream("Wikipedia").call():
+            return self.transport(self.api_url, params, remaining_timeout(self.timeout))
+
+    def _query(self, **params) -> dict:
+        return self._get({**_base_params(), **params})
+
+    def _fill_disambiguation_options(self, articles):
+        # Disambiguation pages are rare, so their link lists are fetched separately
+        # rather than inflating every lookup with the links of ordinary articles.
+        pending = _pending_disambiguations(articles)
+        if pending:
+            _apply_links(pending, self._get(_links_params(pending)))
+
+    def lookup(self, query: str) -> Optional[WikiArticle]:
+        # Search, redirect resolution and extract in a single round trip.
+        data = self._query(generator="search", gsrsearch=query, gsrlimit=1)
+        article = next(iter(_parse_pages(data).values()), None)
+        self._fill_disambiguation_options([article])
+        return article
+
+    def fetch_articles(self, titles: List[str]) -> Dict[str, Optional[WikiArticle]]:
+        # One request for up to Config.WIKIPEDIA_BATCH_SIZE exact titles; results are
+        # keyed by the title as requested, with redirects and normalization applied.
+        results = {}
+        for start in range(0, len(titles), Config.WIKIPEDIA_BATCH_SIZE):
+            batch = titles[start:start + Config.WIKIPEDIA_BATCH_SIZE]
+            data = self._query(titles="|".join(batch))
+            articles = _parse_pages(data)
+            for title in batch:
+                results[title] = articles.get(_resolve_title(data, title))
+        self._fill_disambiguation_options(results.values())
+        return results
+
+class AsyncWikipediaClient:
+    # Async twin of WikipediaClient; transport is an awaitable (url, params, timeout) -> dict.
+    def __init__(self, transport, api_url: Optional[str] = None, timeout: float = Config.WIKIPEDIA_TIMEOUT):
+        self.transport = transport
+        self.api_url = api_url or os.getenv("WIKIPEDIA_API_URL") or DEFAULT_API_URL
+        self.timeout = timeout
+
+    async def _get(self, params: dict) -> dict:
+        async with get_upstream("Wikipedia").call_async():
+            return await self.transport(self.api_url, params, remaining_timeout(self.timeout))
+
+    async def _fill_disambiguation_options(self, articles):
+        pending = _pending_disambiguations(articles)
+        if pending:
+            _apply_links(pending, await self._get(_links_params(pending)))
+
+    async def lookup(self, query: str) -> Optional[WikiArticle]:
+        data = await self._get({**_base_params(), "generator": "search", "gsrsearch": query, "gsrlimit": 1})
+        article = next(iter(_parse_pages(data).values()), None)
+        await self._fill_disambiguation_options([article])
+        return article
+
+    async def fetch_articles(self, titles: List[str]) -> Dict[str, Optional[WikiArticle]]:
+        results = {}
+        for start in range(0, len(titles), Config.WIKIPEDIA_BATCH_SIZE):
+            batch = titles[start:start + Config.WIKIPEDIA_BATCH_SIZE]
+            data = await self._get({**_base_params(), "titles": "|".join(batch)})
+            articles = _parse_pages(data)
+            for title in batch:
+                results[title] = articles.get(_resolve_title(data, title))
+        await self._fill_disambiguation_options(results.values())
+        return results
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_wikipedia_client() -> WikipediaClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WikipediaClient()
+        return _client
+
+def set_wikipedia_client(client: Optional[WikipediaClient]):
+    global _client
+    with _client_lock:
+        _client = client